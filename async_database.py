@@ -0,0 +1,151 @@
+# async_database.py
+
+# Асинхронные версии функций database.py для обработчиков.
+# Каждый вызов выполняется в потоке базы данных (db_pool.run_db), поэтому
+# обращение к SQLite не блокирует цикл событий. Ошибки, как и в database.py,
+# логируются внутри и возвращается значение по умолчанию.
+
+import traceback
+
+from telegram import Bot
+from telegram.error import TelegramError
+
+import database
+from db_pool import run_db
+from utils import log_error
+
+
+async def initialize_db():
+    return await run_db(database.initialize_db)
+
+
+async def get_and_increment_photo_counter(user_id: int):
+    return await run_db(database.get_and_increment_photo_counter, user_id)
+
+
+async def get_and_increment_video_counter(user_id: int):
+    return await run_db(database.get_and_increment_video_counter, user_id)
+
+
+async def reserve_photo_counters(user_id: int, count: int):
+    return await run_db(database.reserve_photo_counters, user_id, count)
+
+
+async def reserve_video_counters(user_id: int, count: int):
+    return await run_db(database.reserve_video_counters, user_id, count)
+
+
+async def add_user_video(user_id: int, video_path: str, video_name: str):
+    return await run_db(database.add_user_video, user_id, video_path, video_name)
+
+
+async def is_admin(user_id: int) -> bool:
+    # Список администраторов в памяти — поток базы данных нужен, только когда его пора перечитать
+    admins = database.cached_admins()
+    if admins is not None:
+        return user_id in admins
+    return await run_db(database.is_admin, user_id)
+
+
+async def get_admin_count() -> int:
+    return await run_db(database.get_admin_count)
+
+
+async def get_users(after_id: int = 0, limit: int = 10, before_id: int = None):
+    return await run_db(database.get_users, after_id, limit, before_id)
+
+
+async def get_public_packs(after_id: int = 0, limit: int = 10, before_id: int = None):
+    return await run_db(database.get_public_packs, after_id, limit, before_id)
+
+
+async def update_pack_name(pack_id: int, new_name: str):
+    return await run_db(database.update_pack_name, pack_id, new_name)
+
+
+async def replace_stickers(pack_id: int, new_image_files: list, new_emojis: list):
+    return await run_db(database.replace_stickers, pack_id, new_image_files, new_emojis)
+
+
+async def delete_sticker_pack(pack_id: int, user_id: int, bot: Bot) -> bool:
+    """
+    Удаляет стикерпак из базы данных и через Telegram API.
+
+    Returns:
+        bool: True, если удаление прошло успешно, иначе False.
+    """
+    try:
+        pack_name = await run_db(database.get_sticker_set_name, pack_id, user_id)
+        if pack_name is None:
+            return False
+        try:
+            # Удаляем стикерпак через Telegram API
+            await bot.delete_sticker_set(pack_name)
+        except TelegramError as e:
+            log_error(f"Не удалось удалить стикерпак {pack_name}: {e}")
+            return False
+        return await run_db(database.delete_pack_record, pack_id, user_id)
+    except Exception as e:
+        log_error(f"Ошибка в delete_sticker_pack: {str(e)}", traceback.format_exc())
+        return False
+
+
+async def get_all_packs(after_id: int = 0, limit: int = 10, before_id: int = None):
+    return await run_db(database.get_all_packs, after_id, limit, before_id)
+
+
+async def get_count(name: str):
+    return await run_db(database.get_count, name)
+
+
+async def get_pack_by_id(pack_id: int):
+    return await run_db(database.get_pack_by_id, pack_id)
+
+
+async def add_user_message(user_id: int, message_text: str, has_error: bool, error_log_link: str = None):
+    return await run_db(database.add_user_message, user_id, message_text, has_error, error_log_link)
+
+
+async def add_user_photo(user_id: int, photo_path: str, photo_name: str):
+    return await run_db(database.add_user_photo, user_id, photo_path, photo_name)
+
+
+async def add_user(user_id: int, username: str):
+    # Известный пользователь с прежним username не требует записи в базу
+    if database.is_known_user(user_id, username):
+        return None
+    return await run_db(database.save_user, user_id, username)
+
+
+async def add_sticker_pack(user_id: int, pack_name: str, author_name: str, pack_link: str, is_private: bool):
+    return await run_db(database.add_sticker_pack, user_id, pack_name, author_name, pack_link, is_private)
+
+
+async def get_user_packs(user_id: int):
+    return await run_db(database.get_user_packs, user_id)
+
+
+async def create_pack_job(user_id: int, chat_id: int, pack_name: str, title: str, author_name: str, is_private: bool,
+                          sticker_format: str, sticker_files: list, emojis: list):
+    return await run_db(database.create_pack_job, user_id, chat_id, pack_name, title, author_name, is_private,
+                        sticker_format, sticker_files, emojis)
+
+
+async def get_pack_job(job_id: int):
+    return await run_db(database.get_pack_job, job_id)
+
+
+async def get_pack_job_stickers(job_id: int):
+    return await run_db(database.get_pack_job_stickers, job_id)
+
+
+async def get_unfinished_pack_jobs():
+    return await run_db(database.get_unfinished_pack_jobs)
+
+
+async def update_pack_job_status(job_id: int, status: str):
+    return await run_db(database.update_pack_job_status, job_id, status)
+
+
+async def update_pack_job_stickers(job_id: int, positions: list, status: str):
+    return await run_db(database.update_pack_job_stickers, job_id, positions, status)
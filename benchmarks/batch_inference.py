@@ -0,0 +1,76 @@
+# benchmarks/batch_inference.py
+#
+# Сравнение пропускной способности удаления фона: по одному изображению и пачками.
+# Запуск из корня проекта:
+#     python -m benchmarks.batch_inference path/to/images --backends u2net briaai rembg
+
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+from image_processing import BACKENDS, remove_background, remove_background_batch
+from model_registry import get_model
+
+
+def prepare_inputs(source_dir: str, work_dir: str, limit: int) -> list:
+    """Копирует изображения во временную директорию в виде PNG не больше 512 пикселей, как делает бот."""
+    from PIL import Image
+
+    paths = []
+    sources = sorted(glob.glob(os.path.join(source_dir, '*.png')) + glob.glob(os.path.join(source_dir, '*.jpg')))
+    for idx, source in enumerate(sources[:limit]):
+        path = os.path.join(work_dir, f'bench_{idx}.png')
+        with Image.open(source) as image:
+            image.thumbnail((512, 512))
+            image.save(path, 'PNG')
+        paths.append(path)
+    return paths
+
+
+def run(backend: str, image_paths: list, batch_size: int) -> None:
+    get_model(backend)  # Загрузка модели не входит в замер
+
+    single_outputs = [path.replace('.png', f'_{backend}_single.png') for path in image_paths]
+    started = time.perf_counter()
+    for image_path, output_path in zip(image_paths, single_outputs):
+        remove_background(backend, image_path, output_path)
+    single = time.perf_counter() - started
+
+    batch_outputs = [path.replace('.png', f'_{backend}_batch.png') for path in image_paths]
+    started = time.perf_counter()
+    results = remove_background_batch(backend, image_paths, batch_outputs, batch_size)
+    batched = time.perf_counter() - started
+
+    count = len(image_paths)
+    failed = sum(result is None for result in results)
+    print(f"{backend:>7}: по одному {count / single:6.2f} изобр/с, "
+          f"пачками по {batch_size}: {count / batched:6.2f} изобр/с, "
+          f"ускорение x{single / batched:.2f}, ошибок: {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение поштучного и пакетного удаления фона')
+    parser.add_argument('images', help='Директория с изображениями (png/jpg)')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--limit', type=int, default=40)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_batch_')
+    try:
+        image_paths = prepare_inputs(args.images, work_dir, args.limit)
+        if not image_paths:
+            print('Нет изображений для замера.')
+            return
+        print(f"Изображений: {len(image_paths)}")
+        for backend in args.backends:
+            run(backend, image_paths, args.batch_size)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/db_latency.py
+#
+# Задержка обработчиков при одновременной записи в базу: синхронные вызовы database.py
+# прямо в цикле событий против async_database (поток базы данных).
+# Кроме самих обработчиков замеряется «пульс» цикла событий — задача, которая не обращается
+# к базе: при синхронном доступе она ждёт, пока другой обработчик стоит на блокировке SQLite.
+# Запуск из корня проекта:
+#     python -m benchmarks.db_latency --handlers 2000 --rate 200 --writers 2
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import multiprocessing
+import time
+
+import db_pool
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def writer(db_name: str, stop, batch: int, interval: float) -> None:
+    """
+    Фоновый писатель в отдельном процессе: крупные транзакции, которые держат блокировку записи.
+    Отдельный процесс не конкурирует с ботом за GIL — мешает только блокировка SQLite.
+    """
+    db_pool.DB_NAME = db_name
+    counter = 0
+    while not stop.is_set():
+        with db_pool.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO user_messages (user_id, message_text, has_error) VALUES (?, ?, 0)',
+                [(counter + idx, 'x' * 200) for idx in range(batch)]
+            )
+        counter += batch
+        time.sleep(interval)
+
+
+async def sync_handler(user_id: int) -> None:
+    import database
+    database.add_user(user_id, f'user{user_id}')
+    database.is_admin(user_id)
+    counter = database.get_and_increment_photo_counter(user_id)
+    database.add_user_photo(user_id, f'/tmp/{user_id}_{counter}.png', f'{counter}.png')
+
+
+async def async_handler(user_id: int) -> None:
+    import async_database
+    await async_database.add_user(user_id, f'user{user_id}')
+    await async_database.is_admin(user_id)
+    counter = await async_database.get_and_increment_photo_counter(user_id)
+    await async_database.add_user_photo(user_id, f'/tmp/{user_id}_{counter}.png', f'{counter}.png')
+
+
+async def heartbeat(stop: asyncio.Event, lags: list, interval: float = 0.005) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(handler, total: int, rate: float) -> tuple:
+    """
+    Открытая нагрузка: обновления приходят с частотой rate в секунду независимо от того,
+    успевает ли бот. Задержка считается от момента прихода обновления, поэтому в неё входит
+    и время, пока цикл событий был занят чужим обработчиком.
+    """
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def timed(user_id):
+        arrival = started + user_id / rate
+        await asyncio.sleep(max(0.0, arrival - loop.time()))
+        await handler(user_id)
+        latencies.append(loop.time() - arrival)
+
+    pulse = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.gather(*(timed(user_id) for user_id in range(total)))
+    elapsed = loop.time() - started
+    stop.set()
+    await pulse
+    return latencies, lags, elapsed
+
+
+def report(name: str, latencies: list, lags: list, elapsed: float) -> None:
+    print(f"{name:>6}: {len(latencies) / elapsed:7.0f} обработчиков/с, "
+          f"p50 {percentile(latencies, 0.5) * 1000:6.1f} мс, p99 {percentile(latencies, 0.99) * 1000:6.1f} мс; "
+          f"задержка цикла событий p99 {percentile(lags, 0.99) * 1000:6.1f} мс, макс {max(lags) * 1000:6.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Задержка обработчиков при синхронном и асинхронном доступе к SQLite')
+    parser.add_argument('--handlers', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200, help='Обновлений в секунду')
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--writer-batch', type=int, default=500)
+    parser.add_argument('--writer-interval', type=float, default=0.05, help='Пауза писателя между транзакциями (с)')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_db_')
+    db_pool.DB_NAME = os.path.join(work_dir, 'bench.db')
+    try:
+        import database
+        database.initialize_db()
+        for name, handler in (('sync', sync_handler), ('async', async_handler)):
+            stop = multiprocessing.Event()
+            writers = [multiprocessing.Process(target=writer, args=(db_pool.DB_NAME, stop, args.writer_batch,
+                                                                      args.writer_interval))
+                       for _ in range(args.writers)]
+            for process in writers:
+                process.start()
+            try:
+                latencies, lags, elapsed = asyncio.run(run(handler, args.handlers, args.rate))
+            finally:
+                stop.set()
+                for process in writers:
+                    process.join()
+            report(name, latencies, lags, elapsed)
+    finally:
+        db_pool.close_all()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
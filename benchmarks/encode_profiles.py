@@ -0,0 +1,93 @@
+# benchmarks/encode_profiles.py
+#
+# Профили кодирования VP9 (video_processing.ENCODE_PROFILES) на наборе видео:
+# скорость (кадров в секунду с учётом обоих проходов), размер файла и SSIM относительно
+# исходника, приведённого к тем же 3 секундам, 512 пикселям и 30 кадрам/с.
+# Без аргументов используется синтетический набор: графика с движением, фрактал и шум.
+# Запуск из корня проекта:
+#     python -m benchmarks.encode_profiles [path/to/videos ...] --threads 4 --profiles fast balanced quality
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+import video_processing
+from media_probe import probe_media
+
+FPS = 30
+
+# Синтетические исходники (фильтры lavfi ffmpeg)
+FIXTURES = {
+    'motion': 'testsrc2=size=1280x720:rate=60:duration=4',
+    'fractal': 'mandelbrot=size=960x540:rate=30',
+    'noise': 'testsrc2=size=1280x720:rate=30:duration=4,noise=alls=60:allf=t',
+}
+
+
+def make_fixtures(work_dir: str) -> list:
+    paths = []
+    for name, source in FIXTURES.items():
+        path = os.path.join(work_dir, f'{name}.mp4')
+        subprocess.run(
+            [video_processing.ffmpeg_executable(), '-v', 'error', '-y', '-f', 'lavfi', '-i', source,
+             '-t', '4', '-pix_fmt', 'yuv420p', '-crf', '12', path],
+            check=True
+        )
+        paths.append(path)
+    return paths
+
+
+def ssim(encoded_path: str, source_path: str) -> float:
+    """SSIM закодированного стикера относительно исходника после той же обрезки, масштаба и fps."""
+    graph = (f"[1:v]fps={FPS},{video_processing.SCALE_FILTER},format=yuv420p[ref];"
+             f"[0:v]format=yuv420p[enc];[enc][ref]ssim")
+    result = subprocess.run(
+        [video_processing.ffmpeg_executable(), '-v', 'info', '-i', encoded_path,
+         '-t', str(video_processing.MAX_STICKER_DURATION), '-i', source_path,
+         '-lavfi', graph, '-f', 'null', os.devnull],
+        capture_output=True, text=True
+    )
+    match = re.search(r'SSIM .*All:([0-9.]+)', result.stderr)
+    return float(match.group(1)) if match else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Скорость, размер и качество профилей кодирования VP9')
+    parser.add_argument('videos', nargs='*', help='Исходные видео (по умолчанию синтетический набор)')
+    parser.add_argument('--threads', type=int, default=video_processing.DEFAULT_THREADS)
+    parser.add_argument('--profiles', nargs='+', default=list(video_processing.ENCODE_PROFILES))
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_profiles_')
+    try:
+        videos = args.videos or make_fixtures(work_dir)
+        totals = {profile: [0.0, 0, 0, 0.0] for profile in args.profiles}
+        for video in videos:
+            print(f"{os.path.basename(video)}:")
+            for profile in args.profiles:
+                output_path = os.path.join(work_dir, f'out_{profile}.webm')
+                result = video_processing.transcode_with_ffmpeg(
+                    video, output_path, args.threads, fps=FPS, profile=profile
+                )
+                frames = round(probe_media(output_path)['duration'] * FPS)
+                quality = ssim(output_path, video)
+                totals[profile][0] += result.elapsed
+                totals[profile][1] += frames
+                totals[profile][2] += result.size
+                totals[profile][3] += quality
+                print(f"  {profile:>8}: {frames / result.elapsed:6.1f} кадров/с, {result.elapsed:6.2f} с, "
+                      f"проходов {result.passes}, {result.size / 1024:6.1f} КБ, SSIM {quality:.4f}")
+
+        print('Итого:')
+        for profile, (elapsed, frames, size, quality) in totals.items():
+            print(f"  {profile:>8}: {frames / elapsed:6.1f} кадров/с, средний размер {size / len(videos) / 1024:6.1f} КБ, "
+                  f"средний SSIM {quality / len(videos):.4f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
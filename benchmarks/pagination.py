@@ -0,0 +1,78 @@
+# benchmarks/pagination.py
+#
+# Время загрузки страницы списка пользователей на разной глубине: LIMIT/OFFSET против keyset.
+# База генерируется во временной директории (по умолчанию 1 000 000 пользователей).
+# Запуск из корня проекта:
+#     python -m benchmarks.pagination --users 1000000
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import db_pool
+from cache import invalidate
+
+PAGE_SIZE = 10
+OFFSET_QUERY = 'SELECT user_id, username FROM users LIMIT ? OFFSET ?'
+
+
+def generate(users: int) -> None:
+    import database
+
+    database.initialize_db()
+    batch = 50000
+    started = time.perf_counter()
+    for start in range(0, users, batch):
+        # Идентификаторы с пропусками, как у настоящих пользователей Telegram
+        db_pool.executemany(
+            'INSERT INTO users (user_id, username) VALUES (?, ?)',
+            [(100000 + idx * 7, f'user{idx}') for idx in range(start, min(users, start + batch))]
+        )
+    print(f"Сгенерировано пользователей: {users} за {time.perf_counter() - started:.1f} с")
+
+
+def timed(func, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение пагинации LIMIT/OFFSET и keyset на большой таблице')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_pages_')
+    db_pool.DB_NAME = os.path.join(work_dir, 'bench.db')
+    try:
+        import database
+
+        generate(args.users)
+        pages = args.users // PAGE_SIZE
+        for page in (0, 100, pages // 10, pages // 2, pages - 1):
+            offset = page * PAGE_SIZE
+            # Курсор — последний ключ предыдущей страницы, как в callback_data кнопки «>»
+            after_id = db_pool.fetchone(OFFSET_QUERY, (1, offset - 1))[0] if offset else 0
+            offset_rows = db_pool.fetchall(OFFSET_QUERY, (PAGE_SIZE, offset))
+            keyset_rows = database.get_users(after_id=after_id, limit=PAGE_SIZE)
+            assert offset_rows == keyset_rows, 'страницы не совпадают'
+
+            offset_time = timed(lambda: db_pool.fetchall(OFFSET_QUERY, (PAGE_SIZE, offset)), args.repeats)
+            keyset_time = timed(lambda: database.get_users(after_id=after_id, limit=PAGE_SIZE), args.repeats)
+            print(f"страница {page:>7}: OFFSET {offset_time * 1000:8.2f} мс, keyset {keyset_time * 1000:6.3f} мс")
+
+        invalidate('counts')
+        count_time = timed(lambda: database.get_count('users'), 1)
+        cached_time = timed(lambda: database.get_count('users'), args.repeats)
+        print(f"COUNT(*): {count_time * 1000:.2f} мс, из кэша {cached_time * 1000:.4f} мс")
+    finally:
+        db_pool.close_all()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
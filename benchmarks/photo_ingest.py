@@ -0,0 +1,100 @@
+# benchmarks/photo_ingest.py
+#
+# Время приёма одного фото после скачивания: прежний путь (JPEG во временный файл, полное
+# декодирование, thumbnail, PNG, удаление временного файла) против декодирования из памяти
+# в режиме draft, когда на диск пишется только итоговый PNG.
+# Без аргументов используются синтетические JPEG размером, в котором Telegram отдаёт фото.
+# Запуск из корня проекта:
+#     python -m benchmarks.photo_ingest [path/to/jpegs] --repeats 20
+
+import argparse
+import glob
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_processing import normalize_photo
+
+SYNTHETIC_SIZES = ((1280, 960), (1280, 720), (2560, 1920))
+
+
+def load_inputs(source_dir: str) -> list:
+    """Возвращает список (имя, байты JPEG) — из директории или синтетические."""
+    if source_dir:
+        sources = sorted(glob.glob(os.path.join(source_dir, '*.jpg')) + glob.glob(os.path.join(source_dir, '*.jpeg')))
+        inputs = []
+        for source in sources:
+            with open(source, 'rb') as f:
+                inputs.append((os.path.basename(source), f.read()))
+        return inputs
+
+    rng = np.random.default_rng(0)
+    inputs = []
+    for width, height in SYNTHETIC_SIZES:
+        # Плавный градиент с шумом сжимается примерно как фотография
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        pixels = gradient + rng.normal(0, 24, (height, width, 3))
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=87)
+        inputs.append((f'{width}x{height}', buffer.getvalue()))
+    return inputs
+
+
+def ingest_via_disk(data: bytes, photo_path: str) -> None:
+    temp_file_path = photo_path.replace('.png', '_temp.jpg')
+    with open(temp_file_path, 'wb') as f:
+        f.write(data)
+    try:
+        with Image.open(temp_file_path) as img:
+            img.thumbnail((512, 512))
+            img.save(photo_path, 'PNG')
+    finally:
+        os.remove(temp_file_path)
+
+
+def timed(func, data: bytes, photo_path: str, repeats: int) -> float:
+    func(data, photo_path)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func(data, photo_path)
+    return (time.perf_counter() - started) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время приёма фото: временный файл против декодирования из памяти')
+    parser.add_argument('source_dir', nargs='?', default=None, help='Директория с JPEG (по умолчанию синтетические)')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    inputs = load_inputs(args.source_dir)
+    if not inputs:
+        print('Не найдено ни одного JPEG.')
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='bench_ingest_')
+    try:
+        total_disk = total_memory = 0.0
+        for name, data in inputs:
+            photo_path = os.path.join(work_dir, 'photo.png')
+            disk_time = timed(ingest_via_disk, data, photo_path, args.repeats)
+            with Image.open(photo_path) as img:
+                disk_size = img.size
+            memory_time = timed(normalize_photo, data, photo_path, args.repeats)
+            with Image.open(photo_path) as img:
+                memory_size = img.size
+            total_disk += disk_time
+            total_memory += memory_time
+            print(f"{name:>20} ({len(data) / 1024:5.0f} КБ): временный файл {disk_time * 1000:6.1f} мс {disk_size}, "
+                  f"из памяти {memory_time * 1000:6.1f} мс {memory_size}, ускорение x{disk_time / memory_time:.1f}")
+        print(f"В среднем на фото: {total_disk / len(inputs) * 1000:.1f} мс -> {total_memory / len(inputs) * 1000:.1f} мс")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/transcode.py
+#
+# Кодирование видеостикера (convert_mp4_to_webm): moviepy против одного процесса ffmpeg.
+# Каждый прогон выполняется в новом процессе, чтобы пиковая память (RSS) не накапливалась
+# между прогонами; отдельно показывается пик самого большого процесса ffmpeg, запущенного кодированием
+# (moviepy запускает два: чтение кадров и запись).
+# Без аргументов используется синтетическое видео 1280x720, 60 кадров/с, 5 секунд.
+# Запуск из корня проекта:
+#     python -m benchmarks.transcode [path/to/video.mp4 ...] --repeats 3 --threads 4
+
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def make_sample(work_dir: str) -> str:
+    import video_processing
+
+    path = os.path.join(work_dir, 'sample.mp4')
+    subprocess.run(
+        [video_processing.ffmpeg_executable(), '-v', 'error', '-y', '-f', 'lavfi',
+         '-i', 'testsrc2=size=1280x720:rate=60:duration=5', '-pix_fmt', 'yuv420p', path],
+        check=True
+    )
+    return path
+
+
+def run_once(backend: str, input_path: str, output_path: str, threads: int) -> tuple:
+    """Выполняется в отдельном процессе: (время, пик RSS процесса, пик RSS дочерних процессов) в МиБ."""
+    import video_processing
+
+    video_processing.VIDEO_TRANSCODER = backend
+    started = time.perf_counter()
+    video_processing.convert_mp4_to_webm(input_path, output_path, threads=threads)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss в Linux измеряется в КиБ
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return elapsed, own, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время и пиковая память кодирования видеостикера: moviepy и ffmpeg')
+    parser.add_argument('videos', nargs='*', help='Исходные видео (по умолчанию синтетическое)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_transcode_')
+    context = multiprocessing.get_context('spawn')
+    try:
+        videos = args.videos or [make_sample(work_dir)]
+        for video in videos:
+            print(f"{os.path.basename(video)} ({os.path.getsize(video) / 1024:.0f} КБ):")
+            for backend in ('moviepy', 'ffmpeg'):
+                output_path = os.path.join(work_dir, f'{backend}.webm')
+                runs = []
+                for _ in range(args.repeats):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        runs.append(pool.submit(run_once, backend, video, output_path, args.threads).result())
+                elapsed = sorted(run[0] for run in runs)[len(runs) // 2]
+                own = max(run[1] for run in runs)
+                children = max(run[2] for run in runs)
+                print(f"  {backend:>7}: {elapsed:6.2f} с (медиана), пик RSS Python {own:6.0f} МиБ, "
+                      f"ffmpeg {children:5.0f} МиБ, результат {os.path.getsize(output_path) / 1024:.0f} КБ")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# cache.py
+
+# Небольшие кэши в памяти процесса: ограничение по числу записей (вытесняются давно не
+# использованные), время жизни записи и счётчики попаданий/промахов.
+# Кэши регистрируются по имени, чтобы код записи в базу мог сбросить их через invalidate(name),
+# а статистику всех кэшей можно было получить одним вызовом get_cache_stats().
+#
+# Обращения идут и из цикла событий, и из потока базы данных, поэтому операции защищены блокировкой.
+
+import threading
+import time
+from collections import OrderedDict
+
+_caches = {}
+
+
+class TTLCache:
+    """Кэш с ограничением размера (LRU) и временем жизни записей."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Возвращает значение по ключу или default, если его нет или срок жизни истёк."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, load):
+        """Возвращает значение из кэша, а при промахе вызывает load() и кэширует результат (кроме None)."""
+        value = self.get(key)
+        if value is None:
+            value = load()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key=None) -> None:
+        """Удаляет запись key или, если key не указан, все записи."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def get_cache(name: str, maxsize: int = 128, ttl: float = 60) -> TTLCache:
+    """Возвращает кэш name, создавая его при первом обращении."""
+    cache = _caches.get(name)
+    if cache is None:
+        cache = _caches.setdefault(name, TTLCache(name, maxsize, ttl))
+    return cache
+
+
+def invalidate(name: str, key=None) -> None:
+    """Сбрасывает кэш name (целиком или одну запись key), если он создан."""
+    cache = _caches.get(name)
+    if cache is not None:
+        cache.invalidate(key)
+
+
+def get_cache_stats() -> dict:
+    """Возвращает статистику всех кэшей: имя -> размер, попадания, промахи, доля попаданий."""
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -1,2 +1,84 @@
 TOKEN = ""
 BOT_USERNAME = ""
+
+# Сколько обновлений Telegram обрабатывать одновременно (обновления одного пользователя — всё равно по очереди)
+UPDATE_CONCURRENCY = 256
+
+# Пул процессов для удаления фона (BriaAI, RemBG, U2Net)
+INFERENCE_WORKERS = 2
+INFERENCE_QUEUE_SIZE = 16
+
+# Перекодирование видео: число одновременных кодирований (потоки делятся между ними поровну)
+TRANSCODE_WORKERS = 2
+
+# Чем кодировать видеостикеры: 'ffmpeg' (один процесс ffmpeg с графом фильтров) или 'moviepy'.
+# При ошибке ffmpeg кодирование повторяется через moviepy
+VIDEO_TRANSCODER = 'ffmpeg'
+
+# Кодирование под ограничение Telegram на размер видеостикера: предельный размер (байты),
+# CRF первой попытки и сколько раз повторять второй проход с меньшим битрейтом, если файл не уложился
+STICKER_MAX_BYTES = 512 * 1024
+VIDEO_CRF = 30
+VIDEO_SIZE_RETRIES = 3
+
+# Профиль кодирования VP9 из video_processing.ENCODE_PROFILES: 'fast', 'balanced' или 'quality'.
+# Сравнить профили на своём железе: python -m benchmarks.encode_profiles
+VIDEO_ENCODE_PROFILE = 'balanced'
+
+# Модели, которые прогреваются при старте процесса пула (остальные загружаются при первом запросе),
+# время простоя до выгрузки модели и период проверки простоя (секунды)
+WARMUP_BACKENDS = ('briaai',)
+MODEL_IDLE_TIMEOUT = 600
+MODEL_IDLE_CHECK_INTERVAL = 60
+
+# Сколько изображений обрабатывается за один прямой проход модели
+INFERENCE_BATCH_SIZE = 8
+
+# Бюджет кэша результатов удаления фона на диске (байты)
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Кэш хэшей исходных изображений для кэша результатов: число записей и время жизни (секунды)
+IMAGE_HASH_CACHE_SIZE = 4096
+IMAGE_HASH_CACHE_TTL = 24 * 60 * 60
+
+# Инструменты, которые запускаются сразу после загрузки фото (до нажатия «Обработать»).
+# По умолчанию только основной: остальные варианты строятся по запросу и не занимают пул заранее
+SPECULATIVE_BACKENDS = ('briaai',)
+
+# Минимальный интервал между обновлениями сообщения о ходе выполнения (секунды)
+PROGRESS_EDIT_INTERVAL = 3.0
+
+# Сколько файлов стикеров загружать в Telegram одновременно
+STICKER_UPLOAD_CONCURRENCY = 4
+
+# Параметры соединений SQLite: кэш страниц (КиБ), объём memory-mapped I/O (байты),
+# сколько подготовленных выражений хранить на соединение, ожидание блокировки (мс)
+DB_CACHE_SIZE_KB = 16384
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_STATEMENT_CACHE_SIZE = 256
+DB_BUSY_TIMEOUT_MS = 5000
+
+# Как долго (секунды) показывать закэшированное общее количество пользователей и стикерпаков
+COUNT_CACHE_TTL = 60
+
+# Кэш страниц списка публичных стикерпаков: время жизни (секунды) и число страниц
+PUBLIC_PACKS_CACHE_TTL = 300
+PUBLIC_PACKS_CACHE_SIZE = 64
+
+# Кэш известных пользователей (user_id -> username), чтобы /start не писал в базу каждый раз
+KNOWN_USERS_CACHE_SIZE = 50000
+KNOWN_USERS_CACHE_TTL = 24 * 60 * 60
+
+# Как часто перечитывать список администраторов (секунды): они добавляются в базу вручную
+ADMINS_CACHE_TTL = 60
+
+# Сколько секунд ждать остальные фото альбома (media_group_id) после последнего полученного
+ALBUM_COLLECT_WINDOW = 1.0
+
+# Кэш file_id отправленных превью (путь к файлу -> file_id): число записей и время жизни (секунды)
+FILE_ID_CACHE_SIZE = 10000
+FILE_ID_CACHE_TTL = 24 * 60 * 60
+
+# Кэш характеристик видео (путь -> длительность, размеры, fps, кодек): число записей и время жизни (секунды)
+PROBE_CACHE_SIZE = 1024
+PROBE_CACHE_TTL = 60 * 60
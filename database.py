@@ -1,258 +1,390 @@
 import sqlite3
 import re
-import traceback
-from contextlib import closing
-from telegram import Bot
-from telegram.error import TelegramError
-from utils import log_error
-import os
+from utils import log_error, log_info
+from config import COUNT_CACHE_TTL, PUBLIC_PACKS_CACHE_TTL, PUBLIC_PACKS_CACHE_SIZE, KNOWN_USERS_CACHE_SIZE, \
+    KNOWN_USERS_CACHE_TTL, ADMINS_CACHE_TTL
+from cache import get_cache, invalidate
+# Все запросы идут через долгоживущие соединения пула (WAL, общий кэш выражений)
+from db_pool import get_connection, transaction, fetchone, fetchall, execute, executemany
+
+# Миграции схемы. Номер применённой миграции хранится в PRAGMA user_version;
+# initialize_db применяет по порядку все, что новее. Уже выпущенные миграции не меняются —
+# для изменений схемы добавляется новая в конец списка.
+MIGRATIONS = [
+    # 1: индексы под запросы бота
+    [
+        # get_user_packs: покрывающий индекс, таблица не читается
+        '''CREATE INDEX IF NOT EXISTS idx_sticker_packs_user
+           ON sticker_packs (user_id, pack_id, pack_name, author_name, pack_link)''',
+        # get_public_packs: частичный индекс только по публичным стикерпакам
+        '''CREATE INDEX IF NOT EXISTS idx_sticker_packs_public
+           ON sticker_packs (pack_id, pack_name, author_name, pack_link) WHERE is_private = 0''',
+        'CREATE INDEX IF NOT EXISTS idx_user_photos_user ON user_photos (user_id, photo_id)',
+        'CREATE INDEX IF NOT EXISTS idx_user_videos_user ON user_videos (user_id, video_id)',
+        'CREATE INDEX IF NOT EXISTS idx_user_messages_user ON user_messages (user_id, message_id)',
+        'CREATE INDEX IF NOT EXISTS idx_pack_jobs_status ON pack_jobs (status, job_id)',
+    ],
+    # 2: имя набора в Telegram — уникальный ключ стикерпака
+    [
+        'ALTER TABLE sticker_packs ADD COLUMN set_name TEXT',
+        # Имя берём из ссылки; если старые записи повторяются, имя получает только первая из них
+        '''UPDATE sticker_packs SET set_name = substr(pack_link, instr(pack_link, '/addstickers/') + 13)
+           WHERE instr(pack_link, '/addstickers/') > 0
+             AND pack_id IN (SELECT MIN(pack_id) FROM sticker_packs GROUP BY pack_link)''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_sticker_packs_set_name ON sticker_packs (set_name)',
+    ],
+    # 3: время создания записей (ALTER TABLE не допускает DEFAULT CURRENT_TIMESTAMP —
+    # новые строки получают его в INSERT)
+    [
+        'ALTER TABLE users ADD COLUMN created_at DATETIME',
+        'ALTER TABLE sticker_packs ADD COLUMN created_at DATETIME',
+        'ALTER TABLE user_photos ADD COLUMN created_at DATETIME',
+        'ALTER TABLE user_videos ADD COLUMN created_at DATETIME',
+    ],
+    # 4: is_private — первый столбец индекса публичных стикерпаков: COUNT(*) и страницы
+    # с условием is_private = 0 идут поиском по индексу, а не его полным проходом
+    [
+        'DROP INDEX IF EXISTS idx_sticker_packs_public',
+        '''CREATE INDEX IF NOT EXISTS idx_sticker_packs_public
+           ON sticker_packs (is_private, pack_id, pack_name, author_name, pack_link) WHERE is_private = 0''',
+    ],
+]
+
+
+def migrate(conn):
+    """Применяет к базе миграции, номер которых больше PRAGMA user_version. Каждая — в своей транзакции."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN')
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        log_info(f"Применена миграция базы данных {number}")
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, 'stickers.db')
 
 def initialize_db():
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        photo_counter INTEGER DEFAULT 0,
-                        video_counter INTEGER DEFAULT 0
-                    )
-                ''')
-                conn.execute('''
-                                    CREATE TABLE IF NOT EXISTS sticker_packs (
-                                        pack_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                        user_id INTEGER,
-                                        pack_name TEXT,
-                                        author_name TEXT,
-                                        pack_link TEXT,
-                                        is_private INTEGER,
-                                        FOREIGN KEY(user_id) REFERENCES users(user_id)
-                                    )
-                                ''')
-                # Добавляем новую таблицу для фотографий пользователей
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS user_photos (
-                        photo_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        photo_path TEXT,
-                        photo_name TEXT,
-                        FOREIGN KEY(user_id) REFERENCES users(user_id)
-                    )
-                ''')
-                conn.execute('''
-                                    CREATE TABLE IF NOT EXISTS user_messages (
-                                        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                        user_id INTEGER,
-                                        message_text TEXT,
-                                        has_error INTEGER,
-                                        error_log_link TEXT,
-                                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                                        FOREIGN KEY(user_id) REFERENCES users(user_id)
-                                    )
-                                ''')
-                conn.execute('''
-                                    CREATE TABLE IF NOT EXISTS admins (
-                                        admin_id INTEGER PRIMARY KEY
-                                    )
-                                ''')
-                conn.execute('''
-                                    CREATE TABLE IF NOT EXISTS user_videos (
-                                        video_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                        user_id INTEGER,
-                                        video_path TEXT,
-                                        video_name TEXT,
-                                        FOREIGN KEY(user_id) REFERENCES users(user_id)
-                                    )
-                                ''')
+        with transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    photo_counter INTEGER DEFAULT 0,
+                    video_counter INTEGER DEFAULT 0
+                )
+            ''')
+            conn.execute('''
+                                CREATE TABLE IF NOT EXISTS sticker_packs (
+                                    pack_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    user_id INTEGER,
+                                    pack_name TEXT,
+                                    author_name TEXT,
+                                    pack_link TEXT,
+                                    is_private INTEGER,
+                                    FOREIGN KEY(user_id) REFERENCES users(user_id)
+                                )
+                            ''')
+            # Добавляем новую таблицу для фотографий пользователей
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_photos (
+                    photo_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    photo_path TEXT,
+                    photo_name TEXT,
+                    FOREIGN KEY(user_id) REFERENCES users(user_id)
+                )
+            ''')
+            conn.execute('''
+                                CREATE TABLE IF NOT EXISTS user_messages (
+                                    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    user_id INTEGER,
+                                    message_text TEXT,
+                                    has_error INTEGER,
+                                    error_log_link TEXT,
+                                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                                    FOREIGN KEY(user_id) REFERENCES users(user_id)
+                                )
+                            ''')
+            conn.execute('''
+                                CREATE TABLE IF NOT EXISTS admins (
+                                    admin_id INTEGER PRIMARY KEY
+                                )
+                            ''')
+            conn.execute('''
+                                CREATE TABLE IF NOT EXISTS user_videos (
+                                    video_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    user_id INTEGER,
+                                    video_path TEXT,
+                                    video_name TEXT,
+                                    FOREIGN KEY(user_id) REFERENCES users(user_id)
+                                )
+                            ''')
+            # Задания на сборку стикерпаков: переживают перезапуск бота и дособираются при старте
+            conn.execute('''
+                                CREATE TABLE IF NOT EXISTS pack_jobs (
+                                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    user_id INTEGER,
+                                    chat_id INTEGER,
+                                    pack_name TEXT,
+                                    title TEXT,
+                                    author_name TEXT,
+                                    is_private INTEGER,
+                                    sticker_format TEXT,
+                                    status TEXT DEFAULT 'pending',
+                                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                                    FOREIGN KEY(user_id) REFERENCES users(user_id)
+                                )
+                            ''')
+            conn.execute('''
+                                CREATE TABLE IF NOT EXISTS pack_job_stickers (
+                                    job_id INTEGER,
+                                    position INTEGER,
+                                    file_path TEXT,
+                                    emoji TEXT,
+                                    status TEXT DEFAULT 'pending',
+                                    PRIMARY KEY(job_id, position),
+                                    FOREIGN KEY(job_id) REFERENCES pack_jobs(job_id)
+                                )
+                            ''')
+        migrate(get_connection())
+        load_admins()
     except sqlite3.Error as e:
         log_error(f"Ошибка инициализации базы данных: {e}")
         raise
 
-def get_and_increment_photo_counter(user_id: int):
+# Столбцы счётчиков, которые можно резервировать через reserve_counters
+COUNTER_COLUMNS = ('photo_counter', 'video_counter')
+
+
+def reserve_counters(user_id: int, column: str, count: int = 1):
+    """
+    Атомарно увеличивает счётчик пользователя на count одним запросом (UPSERT ... RETURNING).
+
+    Параллельные загрузки (например, альбом) получают непересекающиеся номера,
+    поэтому файлы {user_id}_{counter} не перезаписывают друг друга.
+
+    Returns:
+        int: первый номер зарезервированного блока (номера first .. first + count - 1) или None при ошибке.
+    """
+    if column not in COUNTER_COLUMNS:
+        raise ValueError(f"Неизвестный счётчик: {column}")
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT photo_counter FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            if result:
-                counter = result[0] + 1
-                cursor.execute('UPDATE users SET photo_counter = ? WHERE user_id = ?', (counter, user_id))
-            else:
-                counter = 1
-                cursor.execute('INSERT INTO users (user_id, username, photo_counter) VALUES (?, ?, ?)', (user_id, '', counter))
-            conn.commit()
-            return counter
+        with transaction() as conn:
+            row = conn.execute(f'''
+                INSERT INTO users (user_id, username, {column}, created_at) VALUES (?, '', ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET {column} = {column} + excluded.{column}
+                RETURNING {column}
+            ''', (user_id, count)).fetchone()
+        return row[0] - count + 1
     except sqlite3.Error as e:
-        log_error(f"Ошибка при обновлении photo_counter для пользователя {user_id}: {e}")
+        log_error(f"Ошибка при обновлении {column} для пользователя {user_id}: {e}")
         return None
 
+
+def get_and_increment_photo_counter(user_id: int):
+    return reserve_counters(user_id, 'photo_counter')
+
+def reserve_photo_counters(user_id: int, count: int):
+    return reserve_counters(user_id, 'photo_counter', count)
+
 def get_and_increment_video_counter(user_id: int):
-    try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT video_counter FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            if result:
-                counter = result[0] + 1
-                cursor.execute('UPDATE users SET video_counter = ? WHERE user_id = ?', (counter, user_id))
-            else:
-                counter = 1
-                cursor.execute('INSERT INTO users (user_id, username, video_counter) VALUES (?, ?, ?)', (user_id, '', counter))
-            conn.commit()
-            return counter
-    except sqlite3.Error as e:
-        log_error(f"Ошибка при обновлении video_counter для пользователя {user_id}: {e}")
-        return None
+    return reserve_counters(user_id, 'video_counter')
+
+def reserve_video_counters(user_id: int, count: int):
+    return reserve_counters(user_id, 'video_counter', count)
 
 
 def add_user_video(user_id: int, video_path: str, video_name: str):
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                conn.execute('''
-                    INSERT INTO user_videos (user_id, video_path, video_name)
-                    VALUES (?, ?, ?)
-                ''', (user_id, video_path, video_name))
+        execute('''
+            INSERT INTO user_videos (user_id, video_path, video_name, created_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (user_id, video_path, video_name))
     except sqlite3.Error as e:
         log_error(f"Ошибка добавления видео для пользователя {user_id}: {e}")
 
-def is_admin(user_id: int) -> bool:
+# Таблица admins целиком в памяти: она крошечная, а проверка нужна на каждый /start.
+# Администраторы добавляются в базу напрямую (SQL), поэтому список перечитывается
+# не реже чем раз в ADMINS_CACHE_TTL секунд — изменения действуют без перезапуска.
+def _admins_cache():
+    return get_cache('admins', 1, ADMINS_CACHE_TTL)
+
+
+def load_admins():
+    """Перечитывает список администраторов из базы. Возвращает frozenset их id или None при ошибке."""
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1 FROM admins WHERE admin_id = ?', (user_id,))
-            return cursor.fetchone() is not None
+        admins = frozenset(row[0] for row in fetchall('SELECT admin_id FROM admins'))
     except sqlite3.Error as e:
-        log_error(f"Ошибка проверки администратора {user_id}: {e}")
-        return False
+        log_error(f"Ошибка загрузки списка администраторов: {e}")
+        return None
+    _admins_cache().set('all', admins)
+    return admins
 
-def get_users(offset=0, limit=10):
+
+def cached_admins():
+    """Список администраторов, если он загружен и ещё не устарел, иначе None."""
+    return _admins_cache().get('all')
+
+
+def _get_admins():
+    admins = cached_admins()
+    return admins if admins is not None else load_admins()
+
+
+def get_admin_count() -> int:
+    admins = _get_admins()
+    return len(admins) if admins is not None else 0
+
+
+def is_admin(user_id: int) -> bool:
+    admins = _get_admins()
+    return admins is not None and user_id in admins
+
+def _keyset_page(sql_after: str, sql_before: str, after_id: int, before_id, limit: int) -> list:
+    """
+    Страница по первичному ключу (keyset): строки с ключом больше after_id,
+    либо — при переходе назад — последние limit строк с ключом меньше before_id.
+    В отличие от OFFSET, стоимость не зависит от номера страницы, а новые строки не сдвигают уже показанные.
+    """
+    if before_id is not None:
+        rows = fetchall(sql_before, (before_id, limit))
+        rows.reverse()
+        return rows
+    return fetchall(sql_after, (after_id, limit))
+
+
+def get_users(after_id: int = 0, limit: int = 10, before_id: int = None):
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT user_id, username FROM users LIMIT ? OFFSET ?
-            ''', (limit, offset))
-            return cursor.fetchall()
+        return _keyset_page(
+            'SELECT user_id, username FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?',
+            'SELECT user_id, username FROM users WHERE user_id < ? ORDER BY user_id DESC LIMIT ?',
+            after_id, before_id, limit
+        )
     except sqlite3.Error as e:
         log_error(f"Ошибка получения списка пользователей: {e}")
         return []
 
-def get_public_packs(offset=0, limit=10):
+def get_public_packs(after_id: int = 0, limit: int = 10, before_id: int = None):
+    # Страницы кэшируются; кэш сбрасывается в _packs_changed при любой записи в sticker_packs
+    cache = get_cache('public_packs', PUBLIC_PACKS_CACHE_SIZE, PUBLIC_PACKS_CACHE_TTL)
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
-                WHERE is_private = 0
-                LIMIT ? OFFSET ?
-            ''', (limit, offset))
-            return cursor.fetchall()
+        return cache.get_or_load((after_id, limit, before_id), lambda: _keyset_page(
+            '''SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
+               WHERE is_private = 0 AND pack_id > ? ORDER BY pack_id LIMIT ?''',
+            '''SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
+               WHERE is_private = 0 AND pack_id < ? ORDER BY pack_id DESC LIMIT ?''',
+            after_id, before_id, limit
+        ))
     except sqlite3.Error as e:
         log_error(f"Ошибка получения публичных стикерпаков: {e}")
         return []
 
 def update_pack_name(pack_id: int, new_name: str):
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                conn.execute('''
-                    UPDATE sticker_packs SET pack_name = ? WHERE pack_id = ?
-                ''', (new_name, pack_id))
+        execute('''
+            UPDATE sticker_packs SET pack_name = ? WHERE pack_id = ?
+        ''', (new_name, pack_id))
+        _packs_changed()
     except sqlite3.Error as e:
         log_error(f"Ошибка обновления названия стикерпака {pack_id}: {e}")
 
 def replace_stickers(pack_id: int, new_image_files: list, new_emojis: list):
-    try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                # Здесь можно реализовать логику замены стикеров
-                # Например, удалить старые стикеры и добавить новые через Telegram API
-                pass  # Реализуйте по необходимости
-    except sqlite3.Error as e:
-        log_error(f"Ошибка замены стикеров для стикерпака {pack_id}: {e}")
+    # Сами стикеры хранятся в Telegram, в базе их нет — менять здесь пока нечего.
+    # Замену (удалить старые стикеры и добавить новые через Telegram API) реализуйте по необходимости
+    pass
 
-async def delete_sticker_pack(pack_id: int, user_id: int, bot: Bot) -> bool:
+def get_sticker_set_name(pack_id: int, user_id: int):
     """
-    Удаляет стикерпак из базы данных и через Telegram API.
-
-    Args:
-        pack_id (int): Идентификатор стикерпака.
-        user_id (int): Идентификатор пользователя.
-        bot (Bot): Экземпляр Telegram Bot.
+    Возвращает имя набора в Telegram для стикерпака пользователя.
 
     Returns:
-        bool: True, если удаление прошло успешно, иначе False.
+        str: имя набора или None, если стикерпак не найден или ссылка некорректна.
     """
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT pack_link FROM sticker_packs WHERE pack_id = ? AND user_id = ?
-                ''', (pack_id, user_id))
-                result = cursor.fetchone()
-                if result:
-                    pack_link = result[0]
-
-                    # Извлекаем имя стикерпака из ссылки
-                    match = re.search(r'/addstickers/([a-zA-Z0-9_]+)', pack_link)
-                    if match:
-                        pack_name = match.group(1)
-                        try:
-                            # Удаляем стикерпак через Telegram API
-                            await bot.delete_sticker_set(pack_name)
-                        except TelegramError as e:
-                            log_error(f"Не удалось удалить стикерпак {pack_name}: {e}")
-                            return False
-
-                        try:
-                            # Удаляем запись из базы данных
-                            cursor.execute('''
-                                DELETE FROM sticker_packs WHERE pack_id = ? AND user_id = ?
-                            ''', (pack_id, user_id))
-                            return True
-                        except sqlite3.Error as db_error:
-                            log_error(f"Ошибка при удалении записи с pack_id={pack_id}: {db_error}")
-                            return False
-                    else:
-                        log_error(f"Некорректный формат pack_link: {pack_link}")
-                        return False
-                else:
-                    log_error(f"Стикерпак с pack_id={pack_id} и user_id={user_id} не найден.")
-                    return False
-    except Exception as e:
-        log_error(f"Ошибка в delete_sticker_pack: {str(e)}", traceback.format_exc())
-        return False
+        result = fetchone('''
+            SELECT pack_link FROM sticker_packs WHERE pack_id = ? AND user_id = ?
+        ''', (pack_id, user_id))
+    except sqlite3.Error as e:
+        log_error(f"Ошибка получения стикерпака {pack_id}: {e}")
+        return None
+    if not result:
+        log_error(f"Стикерпак с pack_id={pack_id} и user_id={user_id} не найден.")
+        return None
+    pack_link = result[0]
 
+    # Извлекаем имя стикерпака из ссылки
+    match = re.search(r'/addstickers/([a-zA-Z0-9_]+)', pack_link)
+    if not match:
+        log_error(f"Некорректный формат pack_link: {pack_link}")
+        return None
+    return match.group(1)
 
 
-def get_all_packs(offset=0, limit=10):
+def delete_pack_record(pack_id: int, user_id: int) -> bool:
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
-                LIMIT ? OFFSET ?
-            ''', (limit, offset))
-            return cursor.fetchall()
+        execute('''
+            DELETE FROM sticker_packs WHERE pack_id = ? AND user_id = ?
+        ''', (pack_id, user_id))
+        _packs_changed()
+        return True
+    except sqlite3.Error as db_error:
+        log_error(f"Ошибка при удалении записи с pack_id={pack_id}: {db_error}")
+        return False
+
+
+def get_all_packs(after_id: int = 0, limit: int = 10, before_id: int = None):
+    try:
+        return _keyset_page(
+            '''SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
+               WHERE pack_id > ? ORDER BY pack_id LIMIT ?''',
+            '''SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
+               WHERE pack_id < ? ORDER BY pack_id DESC LIMIT ?''',
+            after_id, before_id, limit
+        )
     except sqlite3.Error as e:
         log_error(f"Ошибка получения списка всех стикерпаков: {e}")
         return []
 
 
+COUNT_QUERIES = {
+    'users': 'SELECT COUNT(*) FROM users',
+    'all_packs': 'SELECT COUNT(*) FROM sticker_packs',
+    'public_packs': 'SELECT COUNT(*) FROM sticker_packs WHERE is_private = 0',
+}
+
+
+def get_count(name: str):
+    """
+    Возвращает количество строк для списка name из COUNT_QUERIES.
+
+    COUNT(*) по большой таблице — полный проход индекса, поэтому значение кэшируется
+    на COUNT_CACHE_TTL секунд (и сбрасывается при изменении стикерпаков).
+    """
+    cache = get_cache('counts', len(COUNT_QUERIES), COUNT_CACHE_TTL)
+    try:
+        return cache.get_or_load(name, lambda: fetchone(COUNT_QUERIES[name])[0])
+    except sqlite3.Error as e:
+        log_error(f"Ошибка подсчёта {name}: {e}")
+        return None
+
+
+def _packs_changed() -> None:
+    """Сбрасывает кэши, зависящие от sticker_packs. Вызывается после каждой записи в таблицу."""
+    invalidate('public_packs')
+    invalidate('counts', 'all_packs')
+    invalidate('counts', 'public_packs')
+
+
 def get_pack_by_id(pack_id: int):
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM sticker_packs WHERE pack_id = ?
-            ''', (pack_id,))
-            return cursor.fetchone()
+        return fetchone('''
+            SELECT * FROM sticker_packs WHERE pack_id = ?
+        ''', (pack_id,))
     except sqlite3.Error as e:
         log_error(f"Ошибка получения стикерпака по ID {pack_id}: {e}")
         return None
@@ -260,116 +392,153 @@ def get_pack_by_id(pack_id: int):
 
 def add_user_message(user_id: int, message_text: str, has_error: bool, error_log_link: str = None):
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                conn.execute('''
-                    INSERT INTO user_messages (user_id, message_text, has_error, error_log_link)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, message_text, int(has_error), error_log_link))
+        execute('''
+            INSERT INTO user_messages (user_id, message_text, has_error, error_log_link)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, message_text, int(has_error), error_log_link))
     except sqlite3.Error as e:
         log_error(f"Ошибка добавления сообщения для пользователя {user_id}: {e}")
 
 
 def add_user_photo(user_id: int, photo_path: str, photo_name: str):
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                conn.execute('''
-                    INSERT INTO user_photos (user_id, photo_path, photo_name)
-                    VALUES (?, ?, ?)
-                ''', (user_id, photo_path, photo_name))
+        execute('''
+            INSERT INTO user_photos (user_id, photo_path, photo_name, created_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (user_id, photo_path, photo_name))
     except sqlite3.Error as e:
         log_error(f"Ошибка добавления фотографии для пользователя {user_id}: {e}")
 
 
+def _known_users():
+    return get_cache('known_users', KNOWN_USERS_CACHE_SIZE, KNOWN_USERS_CACHE_TTL)
+
+
+def is_known_user(user_id: int, username: str) -> bool:
+    """True, если пользователь уже записан в базу с тем же username и add_user ничего не изменит."""
+    return _known_users().get(user_id) == username
+
+
 def add_user(user_id: int, username: str):
+    if not is_known_user(user_id, username):
+        save_user(user_id, username)
+
+
+def save_user(user_id: int, username: str):
+    """Записывает пользователя в базу без проверки кэша известных пользователей."""
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                conn.execute('''
-                    INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)
-                ''', (user_id, username))
+        # Новый пользователь добавляется, у известного обновляется username, если он сменился
+        execute('''
+            INSERT INTO users (user_id, username, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(user_id) DO UPDATE SET username = excluded.username
+            WHERE username IS NOT excluded.username
+        ''', (user_id, username))
+        _known_users().set(user_id, username)
+        invalidate('counts', 'users')
     except sqlite3.Error as e:
         log_error(f"Ошибка добавления пользователя {user_id}: {e}")
 
 def add_sticker_pack(user_id: int, pack_name: str, author_name: str, pack_link: str, is_private: bool):
+    match = re.search(r'/addstickers/([a-zA-Z0-9_]+)', pack_link)
+    set_name = match.group(1) if match else None
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                conn.execute('''
-                    INSERT INTO sticker_packs (user_id, pack_name, author_name, pack_link, is_private)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, pack_name, author_name, pack_link, int(is_private)))
+        # Повторное сохранение того же набора (например, после возобновлённой сборки) обновляет запись
+        execute('''
+            INSERT INTO sticker_packs (user_id, pack_name, author_name, pack_link, is_private, set_name, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(set_name) DO UPDATE SET
+                pack_name = excluded.pack_name, author_name = excluded.author_name, is_private = excluded.is_private
+        ''', (user_id, pack_name, author_name, pack_link, int(is_private), set_name))
+        _packs_changed()
     except sqlite3.Error as e:
         log_error(f"Ошибка добавления стикерпака для пользователя {user_id}: {e}")
 
 
 def get_user_packs(user_id: int):
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
-                WHERE user_id = ?
-            ''', (user_id,))
-            return cursor.fetchall()
+        return fetchall('''
+            SELECT pack_id, pack_name, author_name, pack_link FROM sticker_packs
+            WHERE user_id = ?
+        ''', (user_id,))
     except sqlite3.Error as e:
         log_error(f"Ошибка получения стикерпаков для пользователя {user_id}: {e}")
         return []
 
-async def delete_sticker_pack(pack_id: int, user_id: int, bot: Bot) -> bool:
-    """
-    Удаляет стикерпак из базы данных и через Telegram API.
 
-    Args:
-        pack_id (int): Идентификатор стикерпака.
-        user_id (int): Идентификатор пользователя.
-        bot (Bot): Экземпляр Telegram Bot.
+def create_pack_job(user_id: int, chat_id: int, pack_name: str, title: str, author_name: str, is_private: bool,
+                    sticker_format: str, sticker_files: list, emojis: list):
+    """
+    Сохраняет задание на сборку стикерпака вместе с упорядоченным списком файлов и эмодзи.
 
     Returns:
-        bool: True, если удаление прошло успешно, иначе False.
+        int: job_id созданного задания или None при ошибке.
     """
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            with conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT pack_link FROM sticker_packs WHERE pack_id = ? AND user_id = ?
-                ''', (pack_id, user_id))
-                result = cursor.fetchone()
-                if result:
-                    pack_link = result[0]
-
-                    # Извлекаем имя стикерпака из ссылки
-                    match = re.search(r'/addstickers/([a-zA-Z0-9_]+)', pack_link)
-                    if match:
-                        pack_name = match.group(1)
-                        try:
-                            # Удаляем стикерпак через Telegram API
-                            await bot.delete_sticker_set(pack_name)
-                        except TelegramError as e:
-                            log_error(f"Не удалось удалить стикерпак {pack_name}: {e}")
-                            return False
-
-                        try:
-                            # Удаляем запись из базы данных
-                            cursor.execute('''
-                                DELETE FROM sticker_packs WHERE pack_id = ? AND user_id = ?
-                            ''', (pack_id, user_id))
-                            return True
-                        except sqlite3.Error as db_error:
-                            log_error(f"Ошибка при удалении записи с pack_id={pack_id}: {db_error}")
-                            return False
-                    else:
-                        log_error(f"Некорректный формат pack_link: {pack_link}")
-                        return False
-                else:
-                    log_error(f"Стикерпак с pack_id={pack_id} и user_id={user_id} не найден.")
-                    return False
-    except Exception as e:
-        log_error(f"Ошибка в delete_sticker_pack: {str(e)}", traceback.format_exc())
-        return False
+        with transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO pack_jobs (user_id, chat_id, pack_name, title, author_name, is_private, sticker_format)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, chat_id, pack_name, title, author_name, int(is_private), sticker_format))
+            job_id = cursor.lastrowid
+            conn.executemany('''
+                INSERT INTO pack_job_stickers (job_id, position, file_path, emoji) VALUES (?, ?, ?, ?)
+            ''', [(job_id, position, file_path, emoji_assigned)
+                  for position, (file_path, emoji_assigned) in enumerate(zip(sticker_files, emojis))])
+            return job_id
+    except sqlite3.Error as e:
+        log_error(f"Ошибка создания задания на сборку стикерпака {pack_name}: {e}")
+        return None
+
+
+def get_pack_job(job_id: int):
+    try:
+        return fetchone('''
+            SELECT job_id, user_id, chat_id, pack_name, title, author_name, is_private, sticker_format, status
+            FROM pack_jobs WHERE job_id = ?
+        ''', (job_id,))
+    except sqlite3.Error as e:
+        log_error(f"Ошибка получения задания на сборку {job_id}: {e}")
+        return None
+
+
+def get_pack_job_stickers(job_id: int):
+    try:
+        return fetchall('''
+            SELECT position, file_path, emoji, status FROM pack_job_stickers
+            WHERE job_id = ? ORDER BY position
+        ''', (job_id,))
+    except sqlite3.Error as e:
+        log_error(f"Ошибка получения стикеров задания {job_id}: {e}")
+        return []
+
+
+def get_unfinished_pack_jobs():
+    try:
+        return [row[0] for row in fetchall('''
+            SELECT job_id FROM pack_jobs WHERE status IN ('pending', 'created') ORDER BY job_id
+        ''')]
+    except sqlite3.Error as e:
+        log_error(f"Ошибка получения незавершённых заданий на сборку: {e}")
+        return []
+
+
+def update_pack_job_status(job_id: int, status: str):
+    try:
+        execute('''
+            UPDATE pack_jobs SET status = ? WHERE job_id = ?
+        ''', (status, job_id))
+    except sqlite3.Error as e:
+        log_error(f"Ошибка обновления статуса задания {job_id}: {e}")
+
+
+def update_pack_job_stickers(job_id: int, positions: list, status: str):
+    try:
+        executemany('''
+            UPDATE pack_job_stickers SET status = ? WHERE job_id = ? AND position = ?
+        ''', [(status, job_id, position) for position in positions])
+    except sqlite3.Error as e:
+        log_error(f"Ошибка обновления стикеров задания {job_id}: {e}")
 
 if __name__ == '__main__':
     initialize_db()
-    print("База данных инициализирована.")
\ No newline at end of file
+    print("База данных инициализирована.")
@@ -0,0 +1,129 @@
+# db_pool.py
+
+# Долгоживущие соединения с SQLite вместо sqlite3.connect на каждый вызов.
+# Соединения sqlite3 нельзя делить между потоками, поэтому у каждого потока своё соединение;
+# оно открывается при первом обращении и живёт до close_all().
+#
+# Каждое соединение работает в режиме WAL (читатели не ждут писателей) с synchronous=NORMAL,
+# увеличенным кэшем страниц и mmap. Подготовленные выражения кэширует сам модуль sqlite3
+# (параметр cached_statements), поэтому запросы здесь передаются всегда одной и той же строкой.
+#
+# Асинхронные обработчики не обращаются к базе напрямую: run_db выполняет вызов
+# в отдельном потоке базы данных (очередь однопоточного исполнителя), и медленный fsync
+# не останавливает цикл событий.
+
+import asyncio
+import functools
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_STATEMENT_CACHE_SIZE, DB_BUSY_TIMEOUT_MS
+from utils import log_info
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_NAME = os.path.join(BASE_DIR, 'stickers.db')
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_db_executor = None
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_STATEMENT_CACHE_SIZE)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}')
+    conn.execute(f'PRAGMA mmap_size={int(DB_MMAP_SIZE)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute(f'PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}')
+    log_info(f"Открыто соединение с базой данных (поток {threading.current_thread().name})")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Возвращает соединение текущего потока, открывая его при первом обращении."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Транзакция на соединении текущего потока: фиксируется при выходе из блока,
+    откатывается при исключении.
+    """
+    conn = get_connection()
+    with conn:
+        yield conn
+
+
+def fetchone(sql: str, params=()):
+    """Выполняет запрос на чтение и возвращает первую строку результата (или None)."""
+    return get_connection().execute(sql, params).fetchone()
+
+
+def fetchall(sql: str, params=()) -> list:
+    """Выполняет запрос на чтение и возвращает все строки результата."""
+    return get_connection().execute(sql, params).fetchall()
+
+
+def execute(sql: str, params=()) -> sqlite3.Cursor:
+    """Выполняет изменяющий запрос в отдельной транзакции."""
+    with transaction() as conn:
+        return conn.execute(sql, params)
+
+
+def executemany(sql: str, seq_of_params) -> None:
+    """Выполняет изменяющий запрос для каждого набора параметров в одной транзакции."""
+    with transaction() as conn:
+        conn.executemany(sql, seq_of_params)
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Возвращает исполнитель с единственным потоком базы данных."""
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+    return _db_executor
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронную функцию работы с базой в потоке базы данных и возвращает её результат."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+def close_all() -> None:
+    """Закрывает все открытые соединения и останавливает поток базы данных (при остановке бота)."""
+    global _db_executor
+    if _db_executor is not None:
+        # Соединение потока базы данных можно закрыть только из него самого
+        _db_executor.submit(_close_current).result()
+        _db_executor.shutdown(wait=True)
+        _db_executor = None
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Соединение другого потока: sqlite3 запрещает закрывать его отсюда
+                pass
+        _connections.clear()
+    _local.__dict__.pop('conn', None)
+
+
+def _close_current() -> None:
+    conn = _local.__dict__.pop('conn', None)
+    if conn is not None:
+        with _connections_lock:
+            _connections.remove(conn)
+        conn.close()
@@ -1,12 +1,62 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from database import get_users, get_user_packs, get_pack_by_id, delete_sticker_pack, get_all_packs
+from async_database import get_users, get_user_packs, get_pack_by_id, delete_sticker_pack, get_all_packs, get_count, \
+    get_admin_count
+from cache import get_cache_stats
 from handlers import start
+from tg_stickers_bot.workers import collect_model_stats, get_inference_stats, get_transcode_stats
 from utils import log_error
 import traceback
 from states import ADMIN_PANEL, ADMIN_USER_LIST, ADMIN_PACK_LIST, ADMIN_PACK_ACTION, CHOOSING_ACTION, ADMIN_ALL_PACKS, \
     ADMIN_ALL_PACK_ACTION
 
+# Сколько записей показывать на одной странице списков админ панели
+PAGE_SIZE = 10
+
+
+def parse_page_cursor(data: str, prefix: str):
+    """
+    Разбирает callback_data кнопок «<» и «>» вида '{prefix}_next_{id}' / '{prefix}_prev_{id}'.
+
+    Returns:
+        tuple: (after_id, before_id) для запроса следующей или предыдущей страницы.
+    """
+    direction, _, key = data[len(prefix) + 1:].partition('_')
+    try:
+        key = int(key)
+    except ValueError:
+        return 0, None
+    if direction == 'prev':
+        return 0, key
+    return key, None
+
+
+async def fetch_page(fetch, after_id: int = 0, before_id: int = None):
+    """
+    Загружает страницу списка через keyset-функцию fetch (get_users, get_all_packs, ...).
+    Запрашивается на одну запись больше, чтобы узнать, есть ли следующая (или предыдущая) страница.
+
+    Returns:
+        tuple: (rows, has_prev, has_next)
+    """
+    rows = await fetch(after_id=after_id, limit=PAGE_SIZE + 1, before_id=before_id)
+    if before_id is not None:
+        if not rows:
+            # Всё, что было до курсора, удалено — показываем первую страницу
+            return await fetch_page(fetch)
+        return rows[-PAGE_SIZE:], len(rows) > PAGE_SIZE, True
+    return rows[:PAGE_SIZE], after_id > 0, len(rows) > PAGE_SIZE
+
+
+def pagination_buttons(prefix: str, rows: list, has_prev: bool, has_next: bool) -> list:
+    """Кнопки «<» и «>», в callback_data которых записан ключ первой/последней записи страницы."""
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("<", callback_data=f'{prefix}_prev_{rows[0][0]}'))
+    if has_next:
+        buttons.append(InlineKeyboardButton(">", callback_data=f'{prefix}_next_{rows[-1][0]}'))
+    return buttons
+
 
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
@@ -14,6 +64,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             [InlineKeyboardButton("Пользователи", callback_data='admin_users')],
             [InlineKeyboardButton("Все стикерпаки", callback_data='admin_all_packs')],
             [InlineKeyboardButton("Доступ к набору по имени", callback_data='admin_access_pack')],
+            [InlineKeyboardButton("Статистика кэшей и очередей", callback_data='admin_cache_stats')],
             [InlineKeyboardButton("Назад", callback_data='back_to_main')]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -36,6 +87,10 @@ async def admin_panel_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE
     elif query.data == 'admin_access_pack':
         await query.edit_message_text('Функционал доступа к набору по имени пока не реализован.')
         return ADMIN_PANEL
+    elif query.data == 'admin_cache_stats':
+        return await admin_cache_stats(update, context)
+    elif query.data == 'admin_panel':
+        return await admin_panel(update, context)
     elif query.data == 'back_to_main':
         from .start import start
         await start(update, context)
@@ -44,13 +99,53 @@ async def admin_panel_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text('Неизвестная команда.')
         return ADMIN_PANEL
 
-async def admin_all_packs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def admin_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    lines = [f"Администраторов: {await get_admin_count()}"]
+    for name, stats in get_cache_stats().items():
+        lines.append(
+            f"{name}: {stats['size']}/{stats['maxsize']} записей, попаданий {stats['hits']}, "
+            f"промахов {stats['misses']} ({stats['hit_rate']:.0%}), вытеснено {stats['evictions']}"
+        )
+    inference = get_inference_stats()
+    lines.append(
+        f"Инференс: в очереди {inference['queued']}, выполняется {inference['running']}, "
+        f"готово {inference['completed']}, ошибок {inference['failed']}, "
+        f"ожидание в среднем {inference['avg_wait']:.1f} с, максимум {inference['max_wait']:.1f} с"
+    )
+    transcode = get_transcode_stats()
+    lines.append(
+        f"Кодирование видео: в очереди {transcode['queued']}, выполняется {transcode['running']}, "
+        f"готово {transcode['completed']}, ошибок {transcode['failed']}, потоков на задачу {transcode['threads_per_job']}, "
+        f"ожидание в среднем {transcode['avg_wait']:.1f} с, последнее {transcode['last_wait']:.1f} с, "
+        f"максимум {transcode['max_wait']:.1f} с"
+    )
+    lines.append(
+        f"Кодирование VP9: {transcode['encoded']} видео, проходов в среднем {transcode['avg_passes']:.1f} "
+        f"(последнее {transcode['last_passes']}), время в среднем {transcode['avg_encode_time']:.1f} с "
+        f"(последнее {transcode['last_encode_time']:.1f} с), повторов из-за размера {transcode['oversize_retries']}"
+    )
+    model_stats = await collect_model_stats()
+    if not model_stats:
+        lines.append("Модели: пул инференса не отвечает или ещё не запущен")
+    for pid, models in sorted(model_stats.items()):
+        if not models:
+            lines.append(f"Процесс {pid}: модели не загружены")
+        for backend, stats in models.items():
+            lines.append(
+                f"Процесс {pid}, {backend}: {stats['memory'] / 2 ** 20:.0f} МБ, загрузка {stats['load_time']:.1f} с, "
+                f"вызовов {stats['calls']}, простой {stats['idle']:.0f} с"
+            )
+    keyboard = [[InlineKeyboardButton("Назад", callback_data='admin_panel')]]
+    await update.callback_query.edit_message_text('\n'.join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
+    return ADMIN_PANEL
+
+async def admin_all_packs(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                          after_id: int = 0, before_id: int = None) -> int:
     try:
         query = update.callback_query
         await query.answer()
 
-        page = context.user_data.get('admin_all_packs_page', 0)
-        packs = get_all_packs(offset=page * 10, limit=10)
+        packs, has_prev, has_next = await fetch_page(get_all_packs, after_id, before_id)
 
         if not packs:
             await query.edit_message_text('Нет стикерпаков для отображения.')
@@ -60,18 +155,16 @@ async def admin_all_packs(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         for pack in packs:
             keyboard.append([InlineKeyboardButton(f"{pack[1]} (ID: {pack[0]})", callback_data=f'admin_all_pack_{pack[0]}')])
 
-        pagination_buttons = []
-        if page > 0:
-            pagination_buttons.append(InlineKeyboardButton("<", callback_data='admin_all_packs_prev'))
-        if len(packs) == 10:
-            pagination_buttons.append(InlineKeyboardButton(">", callback_data='admin_all_packs_next'))
-        if pagination_buttons:
-            keyboard.append(pagination_buttons)
+        buttons = pagination_buttons('admin_all_packs', packs, has_prev, has_next)
+        if buttons:
+            keyboard.append(buttons)
 
         keyboard.append([InlineKeyboardButton("Назад", callback_data='admin_panel')])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text('Список всех стикерпаков:', reply_markup=reply_markup)
+        total = await get_count('all_packs')
+        title = f'Список всех стикерпаков (всего {total}):' if total is not None else 'Список всех стикерпаков:'
+        await query.edit_message_text(title, reply_markup=reply_markup)
         return ADMIN_ALL_PACKS
     except Exception as e:
         log_error(f"Ошибка в admin_all_packs: {str(e)}", traceback.format_exc())
@@ -82,15 +175,8 @@ async def admin_all_packs_pagination(update: Update, context: ContextTypes.DEFAU
     query = update.callback_query
     await query.answer()
 
-    action = query.data
-    page = context.user_data.get('admin_all_packs_page', 0)
-
-    if action == 'admin_all_packs_next':
-        context.user_data['admin_all_packs_page'] = page + 1
-    elif action == 'admin_all_packs_prev' and page > 0:
-        context.user_data['admin_all_packs_page'] = page - 1
-
-    return await admin_all_packs(update, context)
+    after_id, before_id = parse_page_cursor(query.data, 'admin_all_packs')
+    return await admin_all_packs(update, context, after_id, before_id)
 
 
 async def admin_all_pack_actions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -105,7 +191,7 @@ async def admin_all_pack_actions(update: Update, context: ContextTypes.DEFAULT_T
 
     context.user_data['selected_pack_id'] = pack_id
 
-    pack = get_pack_by_id(pack_id)
+    pack = await get_pack_by_id(pack_id)
     if not pack:
         await query.edit_message_text('Стикерпак не найден.')
         return ADMIN_ALL_PACKS
@@ -129,7 +215,7 @@ async def admin_all_delete_pack(update: Update, context: ContextTypes.DEFAULT_TY
         await query.edit_message_text('Не выбран стикерпак для удаления.')
         return ADMIN_ALL_PACK_ACTION
 
-    pack = get_pack_by_id(pack_id)
+    pack = await get_pack_by_id(pack_id)
     if not pack:
         await query.edit_message_text('Стикерпак не найден.')
         return ADMIN_ALL_PACK_ACTION
@@ -148,13 +234,13 @@ async def admin_all_delete_pack(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 
-async def admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                      after_id: int = 0, before_id: int = None) -> int:
     try:
         query = update.callback_query
         await query.answer()
 
-        page = context.user_data.get('admin_user_page', 0)
-        users = get_users(offset=page * 10, limit=10)
+        users, has_prev, has_next = await fetch_page(get_users, after_id, before_id)
 
         if not users:
             await query.edit_message_text('Нет пользователей для отображения.')
@@ -164,18 +250,16 @@ async def admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         for user in users:
             keyboard.append([InlineKeyboardButton(f"{user[1]} (ID: {user[0]})", callback_data=f'admin_user_{user[0]}')])
 
-        pagination_buttons = []
-        if page > 0:
-            pagination_buttons.append(InlineKeyboardButton("<", callback_data='admin_users_prev'))
-        if len(users) == 10:
-            pagination_buttons.append(InlineKeyboardButton(">", callback_data='admin_users_next'))
-        if pagination_buttons:
-            keyboard.append(pagination_buttons)
+        buttons = pagination_buttons('admin_users', users, has_prev, has_next)
+        if buttons:
+            keyboard.append(buttons)
 
         keyboard.append([InlineKeyboardButton("Назад", callback_data='admin_panel')])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text('Список пользователей:', reply_markup=reply_markup)
+        total = await get_count('users')
+        title = f'Список пользователей (всего {total}):' if total is not None else 'Список пользователей:'
+        await query.edit_message_text(title, reply_markup=reply_markup)
         return ADMIN_USER_LIST
     except Exception as e:
         log_error(f"Ошибка в admin_users: {str(e)}", traceback.format_exc())
@@ -186,15 +270,8 @@ async def admin_users_pagination(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
 
-    action = query.data
-    page = context.user_data.get('admin_user_page', 0)
-
-    if action == 'admin_users_next':
-        context.user_data['admin_user_page'] = page + 1
-    elif action == 'admin_users_prev' and page > 0:
-        context.user_data['admin_user_page'] = page - 1
-
-    return await admin_users(update, context)
+    after_id, before_id = parse_page_cursor(query.data, 'admin_users')
+    return await admin_users(update, context, after_id, before_id)
 
 async def admin_user_packs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
@@ -208,7 +285,7 @@ async def admin_user_packs(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     context.user_data['selected_user_id'] = user_id
 
-    packs = get_user_packs(user_id)
+    packs = await get_user_packs(user_id)
 
     if not packs:
         await query.edit_message_text('У пользователя нет стикерпаков.')
@@ -236,7 +313,7 @@ async def admin_pack_actions(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     context.user_data['selected_pack_id'] = pack_id
 
-    pack = get_pack_by_id(pack_id)
+    pack = await get_pack_by_id(pack_id)
     if not pack:
         await query.edit_message_text('Стикерпак не найден.')
         return ADMIN_PACK_LIST
@@ -259,7 +336,7 @@ async def admin_delete_pack(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.edit_message_text('Не выбран стикерпак для удаления.')
         return ADMIN_PACK_ACTION
 
-    pack = get_pack_by_id(pack_id)
+    pack = await get_pack_by_id(pack_id)
     if not pack:
         await query.edit_message_text('Стикерпак не найден.')
         return ADMIN_PACK_ACTION
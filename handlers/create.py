@@ -1,21 +1,26 @@
 import os
 import asyncio
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputSticker
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.error import BadRequest
-from PIL import Image
 import traceback
 
 import emoji
 import random
 from tg_stickers_bot.utils import sanitize_pack_name, log_error, log_info
-from tg_stickers_bot.database import add_user_photo, add_user_video, add_sticker_pack, get_and_increment_video_counter, \
-    get_and_increment_photo_counter
-from tg_stickers_bot.config import BOT_USERNAME
-from photo.processing.briaai import remove_background_briaai
-from photo.processing.rembg import remove_background_from_image
-from photo.processing.u2net import remove_background_u2net, u2net_model, save_u2net_result
-from moviepy.editor import VideoFileClip
+from tg_stickers_bot.async_database import add_user_photo, add_user_video, get_and_increment_video_counter, \
+    get_and_increment_photo_counter, reserve_photo_counters
+from tg_stickers_bot.config import BOT_USERNAME, SPECULATIVE_BACKENDS, INFERENCE_BATCH_SIZE, ALBUM_COLLECT_WINDOW, \
+    STICKER_MAX_BYTES
+from tg_stickers_bot.progress import start_progress, begin_job, end_job
+from tg_stickers_bot.workers import remove_background_async, remove_background_all, remove_background_batch_async, \
+    remove_background_all_batch, render_background_variants, save_variants, run_transcode
+from tg_stickers_bot.image_processing import normalize_photo
+# Под тем же именем, что и в workers.py: run_transcode узнаёт EncodeResult по типу
+from video_processing import convert_mp4_to_webm, convert_image_to_webm, process_video, StickerTooLargeError
+from tg_stickers_bot.pack_jobs import start_pack_job
+from tg_stickers_bot.media_cache import send_cached_photo, send_cached_video, send_cached_photo_group
+from tg_stickers_bot.media_probe import probe_media
 
 # Определяем базовую директорию проекта
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -40,30 +45,30 @@ all_emojis = list(emoji.EMOJI_DATA.keys())
 RANDOM_EMOJIS = [e for e in all_emojis if len(e) == 1]
 
 async def process_image_with_briaai(image_path):
-    # Вызов функции из briaai.py
-    result_path = remove_background_briaai(image_path)
+    # Обработка BriaAI в пуле инференса
+    result_path = await remove_background_async('briaai', image_path)
     return result_path
 
 async def process_image_with_briaai_tool(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.effective_message.reply_text("Ожидайте...")
     image_path = context.user_data.get('processing_image_path')
     output_path = image_path.replace('.png', '_briaai.png')
-    # Вызов функции из briaai.py
-    remove_background_briaai(image_path, output_path)
+    # Обработка BriaAI в пуле инференса
+    await remove_background_async('briaai', image_path, output_path)
     # Обновляем изображение в user_data
     idx = context.user_data.get('processing_image_index')
     context.user_data['image_files'][idx] = output_path
     # Отображаем обработанное изображение с кнопками
-    with open(output_path, 'rb') as img:
-        await context.bot.send_photo(
-            chat_id=update.effective_chat.id,
-            photo=img,
-            caption="Обработка завершена.",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("Готово", callback_data='image_processing_done')],
-                [InlineKeyboardButton("Отмена", callback_data='cancel_image_processing')]
-            ])
-        )
+    await send_cached_photo(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        path=output_path,
+        caption="Обработка завершена.",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("Готово", callback_data='image_processing_done')],
+            [InlineKeyboardButton("Отмена", callback_data='cancel_image_processing')]
+        ])
+    )
 
 async def create_new_pack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
@@ -120,6 +125,7 @@ async def handle_mode_selection(update: Update, context: ContextTypes.DEFAULT_TY
             return PROCESSING_MEDIA
         elif query.data == 'cancel':
             await query.edit_message_text('Создание стикерпака отменено.')
+            cancel_speculative_processing(context)
             context.user_data.clear()
             return ConversationHandler.END
         else:
@@ -132,49 +138,6 @@ async def handle_mode_selection(update: Update, context: ContextTypes.DEFAULT_TY
 
 # Удалена функция process_zip и соответствующие обработчики
 
-from moviepy.editor import VideoFileClip
-
-def convert_mp4_to_webm(input_path: str, output_path: str) -> str:
-    try:
-        with VideoFileClip(input_path) as clip:
-            # Обрезаем до 3 секунд, если длительность больше 3 секунд
-            if clip.duration > 3:
-                clip = clip.subclip(0, 3)
-
-            # Вычисляем масштабный коэффициент
-            max_dimension = max(clip.w, clip.h)
-            if max_dimension > 512:
-                scale_factor = 512 / max_dimension
-                clip = clip.resize(scale_factor)
-            # Если оба измерения <= 512, масштабирование не требуется
-
-            # Устанавливаем частоту кадров до 30 FPS
-            clip = clip.set_fps(30)
-
-            # Сохраняем видео в формате WebM с кодеком VP9 и без звука
-            clip.write_videofile(
-                output_path,
-                codec='libvpx-vp9',  # Кодек VP9
-                audio=False,         # Отключаем звук
-                threads=12,          # Используем несколько потоков для ускорения
-                preset='medium',     # Оптимизация для качества/скорости
-                bitrate='256k',      # Ограничиваем размер файла
-                ffmpeg_params=['-pix_fmt', 'yuva420p']  # Устанавливаем альфа-канал
-            )
-
-        # Получаем характеристики конвертированного видео
-        props = get_video_properties(output_path)
-        log_info(f"Конвертация видео завершена. Характеристики: {props}")
-
-        return output_path
-    except Exception as e:
-        log_error(f"Ошибка при конвертации MP4 в WebM: {str(e)}")
-        raise
-
-
-
-
-
 
 async def process_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
@@ -194,9 +157,14 @@ async def process_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     context.user_data.setdefault('photo_count', 0)
     context.user_data.setdefault('video_count', 0)
 
+    if update.message.photo and update.message.media_group_id:
+        # Фото из альбома собираются и обрабатываются одной пачкой
+        buffer_album_photo(update, context)
+        return PROCESSING_STICKERS
+
     if update.message.photo:
         # Получаем следующий уникальный счетчик для фото
-        counter = get_and_increment_photo_counter(user_id)
+        counter = await get_and_increment_photo_counter(user_id)
         if counter is None:
             await update.message.reply_text('Не удалось получить счетчик фотографий.')
             return PROCESSING_STICKERS
@@ -205,32 +173,22 @@ async def process_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         photo_path = os.path.join(user_image_dir, photo_name)
 
         # Обработка фото
-        file = await context.bot.get_file(update.message.photo[-1].file_id)
-        temp_file_path = os.path.join(user_image_dir, f'temp_{user_id}.jpg')
-        await file.download_to_drive(temp_file_path)
-
-        img = Image.open(temp_file_path)
-        img.thumbnail((512, 512))
-        img.save(photo_path, 'PNG')
-
-        # Удаляем временный файл
-        os.remove(temp_file_path)
+        await save_incoming_photo(context.bot, update.message.photo[-1], photo_path)
 
         # Добавляем информацию о фотографии в базу данных
-        add_user_photo(user_id, photo_path, photo_name)
+        await add_user_photo(user_id, photo_path, photo_name)
 
         # Обновляем данные пользователя
         context.user_data['image_files'].append(photo_path)
         context.user_data['photo_count'] += 1
         await update.message.reply_text('Фото сохранено. Нажмите кнопку ниже, чтобы обработать изображения.')
-        # Обрабатываем изображение тремя методами
+        # Сразу начинаем удаление фона в фоне, не задерживая ответ пользователю
         #process_image_with_briaai_tool(photo_path, context.user_data['image_files'])
-        process_image_with_rembg_tool(photo_path)
-        process_image_with_u2net_tool(photo_path)
+        start_speculative_processing(update, context, photo_path)
 
     elif update.message.video or (update.message.document and update.message.document.mime_type.startswith('video/')):
         # Получаем следующий уникальный счетчик для видео
-        counter = get_and_increment_video_counter(user_id)
+        counter = await get_and_increment_video_counter(user_id)
         if counter is None:
             await update.message.reply_text('Не удалось получить счетчик видео.')
             return PROCESSING_STICKERS
@@ -245,16 +203,16 @@ async def process_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         await file.download_to_drive(temp_file_path)
 
         try:
-            convert_mp4_to_webm(temp_file_path, video_path)
+            await run_transcode(convert_mp4_to_webm, temp_file_path, video_path)
             # Удаляем временный файл после обработки
             os.remove(temp_file_path)
             # Добавляем информацию о видео в базу данных
-            add_user_video(user_id, video_path, video_name)
+            await add_user_video(user_id, video_path, video_name)
             # Обновляем данные пользователя
             context.user_data['video_files'].append(video_path)
             context.user_data['video_count'] += 1
         except Exception as e:
-            await update.message.reply_text('Не удалось обработать видео. Пожалуйста, попробуйте другое видео.')
+            await update.message.reply_text(video_error_text(e))
             log_error(f"Ошибка при обработке видео: {str(e)}")
             return PROCESSING_STICKERS
 
@@ -263,6 +221,12 @@ async def process_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return PROCESSING_STICKERS
 
     # В режиме 'single' после получения одного медиафайла показываем статус и меню
+    await send_media_status(update, context)
+    return PROCESSING_STICKERS
+
+
+async def send_media_status(update: Update, context: ContextTypes.DEFAULT_TYPE, status_message=None) -> None:
+    """Показывает, сколько файлов получено, и меню дальнейших действий (в status_message, если оно передано)."""
     total_count = context.user_data.get('photo_count', 0) + context.user_data.get('video_count', 0)
     photo_count = context.user_data.get('photo_count', 0)
     video_count = context.user_data.get('video_count', 0)
@@ -282,48 +246,227 @@ async def process_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     )
 
     # Отправляем статус и меню
-    status_message = await update.message.reply_text(status_text, reply_markup=reply_markup)
+    if status_message is not None:
+        await status_message.edit_text(status_text, reply_markup=reply_markup)
+    else:
+        status_message = await update.message.reply_text(status_text, reply_markup=reply_markup)
     context.user_data['status_message_id'] = status_message.message_id
 
-    return PROCESSING_STICKERS
+
+def video_error_text(error: Exception) -> str:
+    """Сообщение пользователю о неудачном кодировании видео."""
+    if isinstance(error, StickerTooLargeError):
+        return ('Видео не помещается в 512 КБ даже с минимальным качеством. '
+                'Пожалуйста, пришлите более короткое или менее детализированное видео.')
+    return 'Не удалось обработать видео. Пожалуйста, попробуйте другое видео.'
+
+
+async def save_incoming_photo(bot, photo, photo_path: str) -> None:
+    """Скачивает фото из Telegram в память, уменьшает до 512 пикселей и сохраняет в PNG."""
+    file = await bot.get_file(photo.file_id)
+    # Временный файл не нужен: на диск записывается только итоговый PNG
+    data = await file.download_as_bytearray()
+    await asyncio.to_thread(normalize_photo, bytes(data), photo_path)
+
+
+def buffer_album_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Откладывает фото альбома: Telegram присылает каждое фото отдельным обновлением с общим media_group_id.
+    Первое фото запускает задачу, которая ждёт остальные и обрабатывает весь альбом разом
+    в очереди обновлений пользователя (PerUserUpdateProcessor.user_lock).
+    """
+    albums = context.user_data.setdefault('pending_albums', {})
+    group_id = update.message.media_group_id
+    if group_id in albums:
+        albums[group_id].append(update)
+        return
+    albums[group_id] = [update]
+    context.application.create_task(collect_album(context, group_id), update=update)
+
+
+async def collect_album(context: ContextTypes.DEFAULT_TYPE, group_id: str) -> None:
+    """Ждёт, пока фото альбома перестанут приходить (ALBUM_COLLECT_WINDOW секунд), и обрабатывает альбом."""
+    received = 0
+    # user_data перечитывается на каждом шаге: после отмены («Отмена» очищает user_data) альбом не обрабатывается
+    while 0 < len(context.user_data.get('pending_albums', {}).get(group_id, ())) != received:
+        received = len(context.user_data['pending_albums'][group_id])
+        await asyncio.sleep(ALBUM_COLLECT_WINDOW)
+    updates = context.user_data.get('pending_albums', {}).get(group_id)
+    if not updates:
+        return
+    # Задача идёт вне очереди обновлений, а ingest_album меняет user_data: ждём, пока обработчики
+    # этого пользователя закончат, и не пускаем новые, пока альбом не сохранён
+    async with context.application.update_processor.user_lock(updates[0]):
+        updates = context.user_data.get('pending_albums', {}).pop(group_id, [])
+        if updates:
+            updates.sort(key=lambda item: item.message.message_id)
+            await ingest_album(updates, context)
+
+
+async def ingest_album(updates: list, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обрабатывает альбом одной пачкой: один резерв счётчиков, параллельная загрузка фото,
+    общая фоновая обработка и одно сообщение со статусом.
+    """
+    update = updates[0]
+    user_id = update.effective_user.id
+    user_image_dir = os.path.join(IMAGE_BASE_DIR, str(user_id))
+    status_message = await update.message.reply_text(f'Получен альбом из {len(updates)} фото, сохраняем...')
+
+    first_counter = await reserve_photo_counters(user_id, len(updates))
+    if first_counter is None:
+        await status_message.edit_text('Не удалось получить счетчик фотографий.')
+        return
+
+    photo_paths = [os.path.join(user_image_dir, f'{user_id}_{first_counter + idx}.png') for idx in range(len(updates))]
+    results = await asyncio.gather(
+        *(save_incoming_photo(context.bot, item.message.photo[-1], photo_path)
+          for item, photo_path in zip(updates, photo_paths)),
+        return_exceptions=True
+    )
+
+    saved = []
+    for photo_path, result in zip(photo_paths, results):
+        if isinstance(result, Exception):
+            log_error(f"Ошибка при загрузке фото альбома {photo_path}: {str(result)}")
+            continue
+        await add_user_photo(user_id, photo_path, os.path.basename(photo_path))
+        saved.append(photo_path)
+
+    context.user_data.setdefault('image_files', []).extend(saved)
+    context.user_data['photo_count'] = context.user_data.get('photo_count', 0) + len(saved)
+    if saved:
+        start_speculative_processing(update, context, saved)
+    if len(saved) < len(updates):
+        await update.message.reply_text(f'Не удалось сохранить {len(updates) - len(saved)} фото из альбома.')
+    await send_media_status(update, context, status_message)
+
+async def preprocess_uploaded_image(update: Update, context: ContextTypes.DEFAULT_TYPE, photo_path: str) -> None:
+    try:
+        # Варианты строятся по одному декодированному изображению и попадают в кэш результатов
+        await remove_background_all(photo_path, SPECULATIVE_BACKENDS)
+        log_info(f"Фоновая обработка {os.path.basename(photo_path)} завершена")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # При ошибке варианты просто будут построены заново после нажатия «Обработать»
+        log_error(f"Ошибка при фоновой обработке изображения {photo_path}: {str(e)}", traceback.format_exc())
+    await notify_speculative_done(update, context)
+
+
+async def preprocess_uploaded_album(update: Update, context: ContextTypes.DEFAULT_TYPE, photo_paths: list) -> None:
+    try:
+        # Все фото альбома проходят через модели пачками, а не по одному
+        for start in range(0, len(photo_paths), INFERENCE_BATCH_SIZE):
+            await remove_background_all_batch(photo_paths[start:start + INFERENCE_BATCH_SIZE], SPECULATIVE_BACKENDS)
+        log_info(f"Фоновая обработка альбома ({len(photo_paths)} фото) завершена")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log_error(f"Ошибка при фоновой обработке альбома: {str(e)}", traceback.format_exc())
+    await notify_speculative_done(update, context)
+
+
+async def notify_speculative_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Сообщает, что фоновая обработка загруженных фото закончилась. Сообщение одно на серию загрузок:
+    его отправляет последняя завершившаяся задача, а задачи, которые уже дождалась кнопка «Обработать»
+    или которые отменены, молчат.
+    """
+    jobs = context.user_data.get('speculative_jobs', {})
+    current = asyncio.current_task()
+    if current not in jobs.values():
+        return
+    if any(not task.done() for task in jobs.values() if task is not current):
+        return
+    await update.message.reply_text(f'Фоновая обработка завершена: {len(jobs)} фото готовы к обработке.')
+
+
+def start_speculative_processing(update: Update, context: ContextTypes.DEFAULT_TYPE, photo_path) -> None:
+    """
+    Запускает удаление фона сразу после загрузки, чтобы к нажатию «Обработать» результат был готов.
+    photo_path — путь к фото или список путей (альбом): тогда все фото обрабатываются одной задачей.
+    """
+    jobs = context.user_data.setdefault('speculative_jobs', {})
+    if isinstance(photo_path, list):
+        task = context.application.create_task(preprocess_uploaded_album(update, context, photo_path), update=update)
+        for path in photo_path:
+            jobs[path] = task
+        return
+    jobs[photo_path] = context.application.create_task(
+        preprocess_uploaded_image(update, context, photo_path),
+        update=update
+    )
+
+
+def cancel_speculative_processing(context: ContextTypes.DEFAULT_TYPE, photo_path: str = None) -> None:
+    """Отменяет фоновую обработку изображения photo_path или всех изображений, если путь не указан."""
+    jobs = context.user_data.get('speculative_jobs', {})
+    paths = list(jobs) if photo_path is None else [photo_path]
+    for path in paths:
+        task = jobs.pop(path, None)
+        # Задачу альбома отменяем, только когда не осталось других фото, которые её ждут
+        if task is not None and not task.done() and task not in jobs.values():
+            task.cancel()
+
+
+async def wait_for_speculative_processing(context: ContextTypes.DEFAULT_TYPE, photo_path: str) -> None:
+    """Дожидается фоновой обработки изображения, если она ещё идёт, чтобы не запускать её повторно."""
+    task = context.user_data.get('speculative_jobs', {}).pop(photo_path, None)
+    if task is None:
+        return
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        # Ошибка уже записана в лог; варианты будут построены заново
+        pass
 
 async def handle_process_images_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
-    await query.answer()
-
     image_files = context.user_data.get('image_files', [])
-    if not image_files:
-        await query.edit_message_text('Нет изображений для обработки.')
+    # Повторное нажатие на ту же кнопку с тем же набором изображений не запускает обработку заново
+    press = (query.message.message_id, tuple(image_files))
+    if not begin_job(context, 'process_images', press):
+        await query.answer('Эти изображения уже обрабатываются или обработаны.')
         return PROCESSING_STICKERS
+    await query.answer()
 
-    for idx, image_path in enumerate(image_files):
-        # Определяем пути для сохранения обработанных изображений
-        briaai_path = image_path.replace('.png', '_briaai.png')
-        rembg_path = image_path.replace('.png', '_rembg.png')
-        u2net_path = image_path.replace('.png', '_u2net.png')
+    # Нажатие запоминается как обработанное только при успехе: после ошибки ту же кнопку можно нажать ещё раз
+    succeeded = False
+    try:
+        if not image_files:
+            await query.edit_message_text('Нет изображений для обработки.')
+            return PROCESSING_STICKERS
 
+        context.user_data.setdefault('status_message_id', query.message.message_id)
+        progress = await start_progress(update, context, 'Обработка изображений', len(image_files))
         try:
-            # Обработка с помощью BriaAI
-            remove_background_briaai(image_path, briaai_path)
-
-            # Обработка с помощью RemBG
-            remove_background_from_image(image_path, rembg_path)
-
-            # Обработка с помощью U2Net
-            mask = remove_background_u2net(image_path, u2net_model)
-            save_u2net_result(image_path, mask, u2net_path)
-
+            # Результаты фоновой обработки уже лежат в кэше; дожидаемся незавершённой, чтобы не считать дважды
+            await asyncio.gather(*(wait_for_speculative_processing(context, path) for path in image_files))
+            # Обработка изображений пачками с помощью BriaAI, RemBG и U2Net в пуле инференса
+            variants = []
+            for start in range(0, len(image_files), INFERENCE_BATCH_SIZE):
+                chunk = image_files[start:start + INFERENCE_BATCH_SIZE]
+                variants.extend(await remove_background_all_batch(chunk))
+                await progress.advance(len(chunk))
         except Exception as e:
-            log_error(f"Ошибка при обработке изображения {image_path}: {str(e)}", traceback.format_exc())
-            await query.edit_message_text(f'Произошла ошибка при обработке изображения {os.path.basename(image_path)}.')
+            log_error(f"Ошибка при обработке изображений: {str(e)}", traceback.format_exc())
+            await query.edit_message_text('Произошла ошибка при обработке изображений.')
             return PROCESSING_STICKERS
 
+        failed = [os.path.basename(image_path) for image_path, paths in zip(image_files, variants) if None in paths]
+        if failed:
+            await query.edit_message_text(f'Произошла ошибка при обработке изображений: {", ".join(failed)}.')
+            return PROCESSING_STICKERS
+        succeeded = True
+    finally:
+        end_job(context, 'process_images', press if succeeded else None)
+
     await query.edit_message_text('Изображения обработаны. Теперь выберите лучший вариант для каждого изображения.')
     # Начинаем процесс выбора изображений
     return await initiate_image_selection(update, context)
 
 import re
-from telegram import InputMediaPhoto
 
 async def initiate_image_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data['current_selection_index'] = 0
@@ -340,25 +483,22 @@ async def present_image_selection(update: Update, context: ContextTypes.DEFAULT_
         return ConversationHandler.END
 
     image_path = image_files[current_index]
-    # Предполагается, что обработанные версии сохранены как:
-    # image_path_briaai.png, image_path_rembg.png, image_path_u2net.png
-    briaai_path = image_path.replace('.png', '_briaai.png')
-    rembg_path = image_path.replace('.png', '_rembg.png')
-    u2net_path = image_path.replace('.png', '_u2net.png')
-
-    media = []
+    # Обработанные версии сохраняются как image_path_briaai.png, image_path_rembg.png, image_path_u2net.png.
+    # Если какой-то версии нет на диске, она берётся из кэша результатов или вычисляется заново.
     try:
-        with open(briaai_path, 'rb') as img1, open(rembg_path, 'rb') as img2, open(u2net_path, 'rb') as img3:
-            media.append(InputMediaPhoto(media=img1, caption='BriaAI'))
-            media.append(InputMediaPhoto(media=img2, caption='RemBG'))
-            media.append(InputMediaPhoto(media=img3, caption='U2Net'))
+        variants = await render_background_variants(image_path)
+        paths = await asyncio.to_thread(save_variants, image_path, variants)
     except Exception as e:
         log_error(f"Ошибка при открытии обработанных изображений: {str(e)}", traceback.format_exc())
         await update.effective_message.reply_text('Произошла ошибка при обработке изображений.')
         return ConversationHandler.END
 
-    # Отправляем обработанные изображения как группу медиа
-    await context.bot.send_media_group(chat_id=update.effective_chat.id, media=media)
+    # Отправляем обработанные изображения как группу медиа; уже отправленные варианты — по file_id
+    await send_cached_photo_group(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        photos=list(zip(paths, ('BriaAI', 'RemBG', 'U2Net')))
+    )
 
     # Отправляем кнопки для выбора лучшего варианта
     keyboard = [
@@ -415,19 +555,19 @@ async def edit_stickers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     # Отправляем все стикеры с номерами
     for idx, sticker_path in enumerate(total_files):
         if idx < len(image_files):
-            with open(sticker_path, 'rb') as img:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=img,
-                    caption=f'Стикер #{idx + 1}'
-                )
+            await send_cached_photo(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=sticker_path,
+                caption=f'Стикер #{idx + 1}'
+            )
         else:
-            with open(sticker_path, 'rb') as video_file:
-                await context.bot.send_video(
-                    chat_id=update.effective_chat.id,
-                    video=video_file,
-                    caption=f'Стикер #{idx + 1}'
-                )
+            await send_cached_video(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=sticker_path,
+                caption=f'Стикер #{idx + 1}'
+            )
 
     await update.effective_message.reply_text('Какой стикер нужно изменить? Введите номер стикера.')
     return EDITING_STICKERS
@@ -463,15 +603,11 @@ async def handle_new_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return EDITING_STICKERS
 
         if update.message.photo and edit_type == 'image':
-            file = await context.bot.get_file(update.message.photo[-1].file_id)
-            file_path = f'images/sticker_{sticker_number}.jpg'
-            await file.download_to_drive(file_path)
-
-            img = Image.open(file_path)
-            img.thumbnail((512, 512), Image.ANTIALIAS)
             processed_path = f'processed/sticker_{sticker_number}.png'
-            img.save(processed_path, 'PNG')
+            await save_incoming_photo(context.bot, update.message.photo[-1], processed_path)
 
+            # Старое изображение заменено — его фоновая обработка больше не нужна
+            cancel_speculative_processing(context, context.user_data['image_files'][sticker_number])
             context.user_data['image_files'][sticker_number] = processed_path
             await update.message.reply_text('Фото заменено. Все готово? Выберите: Изменить ещё или Готово.', reply_markup=InlineKeyboardMarkup([
                 [
@@ -490,7 +626,7 @@ async def handle_new_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
             # Обрабатываем видео
             converted_path = f'videos/sticker_{video_idx}.webm'
-            process_video(file_path, converted_path)
+            await run_transcode(process_video, file_path, converted_path)
 
             context.user_data['video_files'][video_idx] = converted_path
 
@@ -511,38 +647,6 @@ async def handle_new_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return EDITING_STICKERS
 
 
-# Дополнительная функция для конвертации видео в webm
-def process_video(input_path, output_path):
-    try:
-        # Загружаем видео
-        clip = VideoFileClip(input_path)
-
-        # Обрезаем до 3 секунд
-        if clip.duration > 3:
-            clip = clip.subclip(0, 3)
-
-        # Вычисляем масштабный коэффициент
-        max_dimension = max(clip.w, clip.h)
-        if max_dimension > 512:
-            scale_factor = 512 / max_dimension
-            clip = clip.resize(scale_factor)
-        # Если оба измерения <= 512, масштабирование не требуется
-
-        # Сохраняем видео в формате WebM с нужными параметрами, убирая аудиокодек
-        clip.write_videofile(
-            output_path,
-            codec="libvpx-vp9",      # Кодек VP9 для видео
-            bitrate="256k",          # Битрейт
-            ffmpeg_params=["-crf", "30", "-pix_fmt", "yuva420p"]  # Дополнительные параметры
-        )
-
-    except Exception as e:
-        # Логируем ошибку, если что-то пошло не так
-        log_error(f"Ошибка при конвертации видео: {str(e)}", traceback.format_exc())
-        raise  # Повторно выбрасываем исключение для обработки
-
-
-
 # handlers/create.py
 
 # handlers/create.py
@@ -550,86 +654,57 @@ def process_video(input_path, output_path):
 def is_valid_video(video_path: str) -> (bool, str):
     try:
         # Проверка размера файла
-        max_size = 512 * 1024  # 512 KB
+        max_size = STICKER_MAX_BYTES  # 512 KB
         file_size = os.path.getsize(video_path)
         if file_size > max_size:
             return False, f"Размер файла {file_size} байт превышает максимальный 512 КБ."
 
-        # Открытие видео с помощью moviepy
-        with VideoFileClip(video_path) as clip:
-            # Проверка длительности
-            duration = clip.duration
-            if duration > 3.0:
-                return False, f"Длительность видео {duration} секунд превышает максимально допустимые 3 секунды."
+        # Характеристики из заголовка контейнера, без декодирования кадров
+        props = probe_media(video_path)
+
+        # Проверка длительности. ffprobe может не знать длительность (например, у потоковой записи) —
+        # такое видео не проверить, поэтому оно считается неподходящим, а не пропускается
+        duration = props['duration']
+        if duration is None:
+            return False, "Не удалось определить длительность видео."
+        if duration > 3.0:
+            return False, f"Длительность видео {duration} секунд превышает максимально допустимые 3 секунды."
 
-            # Проверка размеров видео
-            width, height = clip.size
-            if width > 512 or height > 512:
-                return False, f"Разрешение видео {width}x{height} пикселей превышает максимально допустимые 512x512."
+        # Проверка размеров видео
+        width, height = props['width'], props['height']
+        if width is None or height is None:
+            return False, "Не удалось определить разрешение видео."
+        if width > 512 or height > 512:
+            return False, f"Разрешение видео {width}x{height} пикселей превышает максимально допустимые 512x512."
 
         return True, ""
     except Exception as e:
         log_error(f"Ошибка при проверке видео: {str(e)}")
         return False, f"Ошибка при проверке видео: {str(e)}"
 
-from moviepy.editor import ImageClip, VideoFileClip
-
-def resize_clip(clip: VideoFileClip) -> VideoFileClip:
-    """
-    Масштабирует видео или изображение, чтобы ни ширина, ни высота не превышали 512 пикселей,
-    сохраняя соотношение сторон.
-    """
-    max_dimension = max(clip.w, clip.h)
-    if max_dimension > 512:
-        scale_factor = 512 / max_dimension
-        return resize_clip(clip)
-    return clip
-
-from moviepy.editor import ImageClip
+# handlers/create.py
 
-def convert_image_to_webm(input_image_path: str, output_video_path: str) -> str:
+async def prepare_stickers_for_pack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Повторное нажатие кнопки, которая уже запускала сборку стикерпака, игнорируется
+    query = update.callback_query
+    press = query.message.message_id if query is not None and query.message is not None else None
+    if not begin_job(context, 'prepare_pack', press):
+        await update.effective_message.reply_text('Стикерпак уже создаётся или создан.')
+        return
+    succeeded = False
     try:
-        # Загружаем изображение как ImageClip
-        clip = ImageClip(input_image_path)
-
-        # Устанавливаем длительность видео (3 секунды)
-        clip = clip.set_duration(3)
-
-        # Масштабируем изображение так, чтобы ни ширина, ни высота не превышали 512 пикселей
-        clip = resize_clip(clip)
-
-        # Устанавливаем частоту кадров до 30 FPS
-        clip = clip.set_fps(30)
-
-        # Сохраняем видео в формате WebM с кодеком VP9 и без звука
-        clip.write_videofile(
-            output_video_path,
-            codec='libvpx-vp9',        # Кодек VP9
-            audio=False,               # Отключаем звук
-            threads=12,                # Используем несколько потоков для ускорения
-            preset='medium',           # Оптимизация для качества/скорости
-            ffmpeg_params=['-pix_fmt', 'yuva420p']  # Устанавливаем альфа-канал
-        )
-
-        # Получаем характеристики конвертированного видео
-        props = get_video_properties(output_video_path)
-        log_info(f"Конвертация изображения в видео завершена. Характеристики: {props}")
-
-        return output_video_path
-    except Exception as e:
-        log_error(f"Ошибка при конвертации изображения в WebM: {str(e)}")
-        raise
-
+        await _prepare_stickers_for_pack(update, context)
+        succeeded = True
+    finally:
+        # После ошибки нажатие не запоминается, чтобы сборку можно было запустить той же кнопкой
+        end_job(context, 'prepare_pack', press if succeeded else None)
 
 
-
-# handlers/create.py
-
-async def prepare_stickers_for_pack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def _prepare_stickers_for_pack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Проверка валидности видео
     invalid_videos = []
     for video_path in context.user_data.get('video_files', []):
-        is_valid, reason = is_valid_video(video_path)
+        is_valid, reason = await asyncio.to_thread(is_valid_video, video_path)
         if not is_valid:
             invalid_videos.append((video_path, reason))
 
@@ -647,51 +722,46 @@ async def prepare_stickers_for_pack(update: Update, context: ContextTypes.DEFAUL
     video_files = context.user_data.get('video_files', [])
     emojis = context.user_data.get('emojis', [])
 
-    if video_files and image_files:  # Если есть и изображения, и видео, конвертируем изображения
-        for idx, image_path in enumerate(image_files):
+    # Ход конвертации и загрузки стикеров показывается в одном сообщении
+    convert_images = bool(video_files and image_files)
+    total_steps = len(image_files) * (2 if convert_images else 1) + len(video_files)
+    progress = await start_progress(update, context, 'Создание стикерпака', total_steps)
+
+    if convert_images:  # Если есть и изображения, и видео, конвертируем изображения
+        async def convert_image(image_path):
             output_path = image_path.replace('.png', '_converted.webm')
             try:
-                convert_image_to_webm(image_path, output_path)
-                video_files.append(output_path)
-                # Логируем характеристики конвертированного видео
-                props = get_video_properties(output_path)
-                log_info(f"Конвертация изображения в видео завершена. Характеристики: {props}")
+                # Характеристики результата логируются внутри convert_image_to_webm
+                await run_transcode(convert_image_to_webm, image_path, output_path)
+                return output_path
             except Exception as e:
                 log_error(f"Не удалось конвертировать изображение {image_path} в WebM: {str(e)}")
-                continue
+                return None
+            finally:
+                await progress.advance()
+
+        # Изображения конвертируются параллельно; run_transcode сам ограничивает число одновременных кодирований
+        converted = await asyncio.gather(*(convert_image(image_path) for image_path in image_files))
+        video_files.extend(path for path in converted if path)
 
         # Удаляем обработанные изображения, так как они заменены видеофайлами
         image_files.clear()
 
     # Создание стикерпаков для изображений
     if image_files:
-        await create_sticker_pack(update, context, image_files, emojis[:len(image_files)], 'static')
+        await create_sticker_pack(update, context, image_files, emojis[:len(image_files)], 'static', progress)
 
     # Создание стикерпаков для видео
     if video_files:
-        await create_sticker_pack(update, context, video_files, emojis[len(image_files):], 'video')
+        await create_sticker_pack(update, context, video_files, emojis[len(image_files):], 'video', progress)
+    await progress.finish('Стикерпак собран.')
 
     # Очищаем данные пользователя
+    cancel_speculative_processing(context)
     context.user_data.clear()
 
 # handlers/create.py
 
-def get_video_properties(video_path: str) -> dict:
-    try:
-        with VideoFileClip(video_path) as clip:
-            return {
-                'duration': clip.duration,
-                'width': clip.w,
-                'height': clip.h,
-                'fps': clip.fps,
-                'file_size': os.path.getsize(video_path)
-            }
-    except Exception as e:
-        log_error(f"Ошибка при получении характеристик видео: {str(e)}")
-        return {}
-
-
-
 async def show_video_validation_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data['current_invalid_video'] = 0
     await show_current_invalid_video(update, context)
@@ -710,12 +780,12 @@ async def show_current_invalid_video(update: Update, context: ContextTypes.DEFAU
     video_filename = os.path.basename(video_path)
     total_videos = len(invalid_videos)
 
-    with open(video_path, 'rb') as video_file:
-        await context.bot.send_video(
-            chat_id=update.effective_chat.id,
-            video=video_file,
-            caption=f"Видео {idx + 1} из {total_videos}: {video_filename}\nПричина: {reason}"
-        )
+    await send_cached_video(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        path=video_path,
+        caption=f"Видео {idx + 1} из {total_videos}: {video_filename}\nПричина: {reason}"
+    )
 
     keyboard = [
         [
@@ -888,22 +958,22 @@ async def show_current_media_selection_menu(update: Update, context: ContextType
     if idx < len(image_files):
         media_type = 'image'
         media_path = image_files[idx]
-        with open(media_path, 'rb') as img:
-            await context.bot.send_photo(
-                chat_id=update.effective_chat.id,
-                photo=img,
-                caption=f"Изображение {idx + 1} из {total_media}"
-            )
+        await send_cached_photo(
+            context.bot,
+            chat_id=update.effective_chat.id,
+            path=media_path,
+            caption=f"Изображение {idx + 1} из {total_media}"
+        )
     else:
         media_type = 'video'
         video_idx = idx - len(image_files)
         media_path = video_files[video_idx]
-        with open(media_path, 'rb') as video_file:
-            await context.bot.send_video(
-                chat_id=update.effective_chat.id,
-                video=video_file,
-                caption=f"Видео {video_idx + 1} из {total_media}"
-            )
+        await send_cached_video(
+            context.bot,
+            chat_id=update.effective_chat.id,
+            path=media_path,
+            caption=f"Видео {video_idx + 1} из {total_media}"
+        )
 
     keyboard = [
         [
@@ -964,6 +1034,8 @@ async def process_current_media(update: Update, context: ContextTypes.DEFAULT_TY
     if idx < len(image_files):
         media_type = 'image'
         media_path = image_files[idx]
+        # Если изображение уже обрабатывается в фоне, варианты возьмутся из кэша без повторного запуска
+        await wait_for_speculative_processing(context, media_path)
         processed_variants = await process_image_variants(media_path)
     else:
         media_type = 'video'
@@ -985,19 +1057,19 @@ async def process_current_media(update: Update, context: ContextTypes.DEFAULT_TY
 
     for variant_path in processed_variants:
         if media_type == 'image':
-            with open(variant_path, 'rb') as img:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=img,
-                    caption="Предварительный просмотр обработанного изображения"
-                )
+            await send_cached_photo(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=variant_path,
+                caption="Предварительный просмотр обработанного изображения"
+            )
         else:
-            with open(variant_path, 'rb') as video_file:
-                await context.bot.send_video(
-                    chat_id=update.effective_chat.id,
-                    video=video_file,
-                    caption="Предварительный просмотр обработанного видео"
-                )
+            await send_cached_video(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=variant_path,
+                caption="Предварительный просмотр обработанного видео"
+            )
 
     await query.edit_message_text("Выберите лучший вариант:", reply_markup=reply_markup)
 
@@ -1008,22 +1080,9 @@ async def process_current_media(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def process_image_variants(image_path: str) -> list:
     try:
-        # Создаём три варианта изображения с разными обработками
-        briaai_path = image_path.replace('.png', '_briaai.png')
-        rembg_path = image_path.replace('.png', '_rembg.png')
-        u2net_path = image_path.replace('.png', '_u2net.png')
-
-        # Обработка с помощью BriaAI
-        remove_background_briaai(image_path, briaai_path)
-
-        # Обработка с помощью RemBG
-        remove_background_from_image(image_path, rembg_path)
-
-        # Обработка с помощью U2Net
-        mask = remove_background_u2net(image_path, u2net_model)
-        save_u2net_result(image_path, mask, u2net_path)
-
-        return [briaai_path, rembg_path, u2net_path]
+        # Создаём три варианта изображения с разными обработками (BriaAI, RemBG, U2Net).
+        # Варианты, уже посчитанные для такого же изображения, берутся из кэша результатов.
+        return await remove_background_all(image_path)
     except Exception as e:
         log_error(f"Ошибка при обработке изображения {image_path}: {str(e)}", traceback.format_exc())
         return []
@@ -1038,7 +1097,7 @@ async def process_video_variants(video_path: str) -> list:
         # Пример обработки: обрезка, изменение размера и т.д.
         # Здесь вы можете вызвать свои функции обработки видео
         # Для простоты приведу пример обрезки видео до 3 секунд
-        await convert_mp4_to_webm(video_path, variant1)  # Уже существует
+        await run_transcode(convert_mp4_to_webm, video_path, variant1)  # Уже существует
         # Создайте другие варианты по необходимости
         # variant2, variant3
 
@@ -1109,22 +1168,22 @@ async def show_current_media(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if idx < len(image_files):
         media_type = 'image'
         media_path = image_files[idx]
-        with open(media_path, 'rb') as img:
-            await context.bot.send_photo(
-                chat_id=update.effective_chat.id,
-                photo=img,
-                caption=f"Изображение {idx + 1} из {total_media}"
-            )
+        await send_cached_photo(
+            context.bot,
+            chat_id=update.effective_chat.id,
+            path=media_path,
+            caption=f"Изображение {idx + 1} из {total_media}"
+        )
     else:
         media_type = 'video'
         video_idx = idx - len(image_files)
         media_path = video_files[video_idx]
-        with open(media_path, 'rb') as video_file:
-            await context.bot.send_video(
-                chat_id=update.effective_chat.id,
-                video=video_file,
-                caption=f"Видео {video_idx + 1} из {total_media}"
-            )
+        await send_cached_video(
+            context.bot,
+            chat_id=update.effective_chat.id,
+            path=media_path,
+            caption=f"Видео {video_idx + 1} из {total_media}"
+        )
 
     context.user_data['current_media_type'] = media_type
     context.user_data['current_media_path'] = media_path
@@ -1151,57 +1210,32 @@ async def show_current_media(update: Update, context: ContextTypes.DEFAULT_TYPE)
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.effective_message.reply_text("Выберите действие:", reply_markup=reply_markup)
 
-def resize_video(clip: VideoFileClip) -> VideoFileClip:
-    max_dimension = max(clip.w, clip.h)
-    if max_dimension > 512:
-        scale_factor = 512 / max_dimension
-        return clip.resize(scale_factor)
-    return clip
-
-
 async def process_current_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.effective_message.reply_text("Ожидайте...")
     video_path = context.user_data.get('current_media_path')
     output_path = video_path.replace('.webm', '_processed.webm')
 
     try:
-        # Обработка видео с корректным масштабированием
-        with VideoFileClip(video_path) as clip:
-            # Обрезаем до 3 секунд, если необходимо
-            if clip.duration > 3:
-                clip = clip.subclip(0, 3)
-
-            # Вычисляем масштабный коэффициент
-            max_dimension = max(clip.w, clip.h)
-            if max_dimension > 512:
-                scale_factor = 512 / max_dimension
-                clip = clip.resize(scale_factor)
-
-            # Сохраняем обработанное видео
-            clip.write_videofile(
-                output_path,
-                codec="libvpx-vp9",
-                bitrate="256k",
-                ffmpeg_params=["-crf", "30", "-pix_fmt", "yuva420p"]
-            )
+        # Обработка видео с корректным масштабированием (обрезка до 3 секунд, 512 пикселей)
+        await run_transcode(process_video, video_path, output_path)
 
         # Обновляем видео в user_data
         idx = context.user_data.get('current_media_index') - len(context.user_data.get('image_files', []))
         context.user_data['video_files'][idx] = output_path
 
         # Отображаем обработанное видео с кнопками
-        with open(output_path, 'rb') as vid:
-            await context.bot.send_video(
-                chat_id=update.effective_chat.id,
-                video=vid,
-                caption="Обработка завершена.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Готово", callback_data='video_processing_done')],
-                    [InlineKeyboardButton("Отмена", callback_data='cancel_video_processing')]
-                ])
-            )
+        await send_cached_video(
+            context.bot,
+            chat_id=update.effective_chat.id,
+            path=output_path,
+            caption="Обработка завершена.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Готово", callback_data='video_processing_done')],
+                [InlineKeyboardButton("Отмена", callback_data='cancel_video_processing')]
+            ])
+        )
     except Exception as e:
-        await update.message.reply_text('Не удалось обработать видео. Пожалуйста, попробуйте другое видео.')
+        await update.message.reply_text(video_error_text(e))
         log_error(f"Ошибка при обработке видео: {str(e)}")
         return PROCESSING_STICKERS
 
@@ -1262,12 +1296,12 @@ async def handle_media_processing(update: Update, context: ContextTypes.DEFAULT_
 async def process_all_images(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.effective_message.reply_text("Обрезка всех изображений, ожидайте...")
     image_files = context.user_data.get('image_files', [])
-    processed_files = []
-    for idx, image_path in enumerate(image_files):
-        output_path = image_path.replace('.png', '_processed.png')
-        # Выберите одну из технологий обработки или примените по очереди
-        remove_background_briaai(image_path, output_path)
-        processed_files.append(output_path)
+    # Выберите одну из технологий обработки или примените по очереди
+    results = await remove_background_batch_async(
+        'briaai', image_files, [image_path.replace('.png', '_processed.png') for image_path in image_files]
+    )
+    # Изображения, которые не удалось обработать, остаются без изменений
+    processed_files = [result or image_path for image_path, result in zip(image_files, results)]
     # Сохраняем оригинальные изображения на случай отмены
     context.user_data['original_image_files'] = image_files.copy()
     # Обновляем изображения в user_data
@@ -1283,15 +1317,14 @@ async def cancel_all_images_processing(update: Update, context: ContextTypes.DEF
     await update.effective_message.reply_text("Изменения отменены.")
     await show_current_media(update, context)
 
-def process_image_with_rembg_tool(image_path):
+async def process_image_with_rembg_tool(image_path):
     rembg_path = image_path.replace('.png', '_rembg.png')
-    remove_background_from_image(image_path)
+    await remove_background_async('rembg', image_path, rembg_path)
     return rembg_path
 
-def process_image_with_u2net_tool(image_path):
+async def process_image_with_u2net_tool(image_path):
     u2net_path = image_path.replace('.png', '_u2net.png')
-    mask = remove_background_u2net(image_path, u2net_model)
-    save_u2net_result(image_path, mask, u2net_path)
+    await remove_background_async('u2net', image_path, u2net_path)
     return u2net_path
 
 # Пример функции обработки изображения с помощью RemBG
@@ -1315,7 +1348,7 @@ async def process_image_with_briaai(update: Update, context: ContextTypes.DEFAUL
 
     image_path = context.user_data.get('processing_image_path')
     output_path = image_path.replace('.png', '_briaai.png')
-    remove_background_briaai(image_path, output_path)
+    await remove_background_async('briaai', image_path, output_path)
 
     # Обновляем изображение в user_data
     idx = context.user_data.get('processing_image_index')
@@ -1329,12 +1362,12 @@ async def process_image_with_briaai(update: Update, context: ContextTypes.DEFAUL
 async def show_current_invalid_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     idx = context.user_data['current_invalid_video']
     video_path = context.user_data['invalid_videos'][idx]
-    with open(video_path, 'rb') as video_file:
-        await context.bot.send_video(
-            chat_id=update.effective_chat.id,
-            video=video_file,
-            caption=f"Видео {idx + 1} из {len(context.user_data['invalid_videos'])}"
-        )
+    await send_cached_video(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        path=video_path,
+        caption=f"Видео {idx + 1} из {len(context.user_data['invalid_videos'])}"
+    )
 
     keyboard = [
         [
@@ -1390,7 +1423,7 @@ async def handle_privacy_selection(update: Update, context: ContextTypes.DEFAULT
     await prepare_stickers_for_pack(update, context)
     return ConversationHandler.END
 
-async def create_sticker_pack(update, context, sticker_files, emojis, sticker_format):
+async def create_sticker_pack(update, context, sticker_files, emojis, sticker_format, progress=None):
     user_id = update.effective_user.id
     pack_name_base = context.user_data.get('pack_name')
     pack_name = sanitize_pack_name(f"{pack_name_base}_{sticker_format}", BOT_USERNAME)
@@ -1401,80 +1434,34 @@ async def create_sticker_pack(update, context, sticker_files, emojis, sticker_fo
     while len(emojis) < len(sticker_files):
         emojis.append(random.choice(RANDOM_EMOJIS))
 
+    async def on_progress(count):
+        if progress:
+            await progress.advance(count)
+
     try:
-        # Создаем новый стикерпак с первым стикером
-        first_sticker_path = sticker_files[0]
-        first_emoji = emojis[0]
-        with open(first_sticker_path, 'rb') as sticker_file:
-            if sticker_format == 'video':
-                first_sticker = InputSticker(
-                    sticker=sticker_file,
-                    emoji_list=[first_emoji],
-                    mask_position=None,
-                    keywords=None,
-                    format='video'  # Указываем формат для видео
-                )
-            else:
-                first_sticker = InputSticker(
-                    sticker=sticker_file,
-                    emoji_list=[first_emoji],
-                    mask_position=None,
-                    keywords=None,
-                    format = 'static'
-                )
-            await context.bot.create_new_sticker_set(
-                user_id=user_id,
-                name=pack_name,
-                title=pack_name_base,
-                stickers=[first_sticker]
-            )
+        # Задание сохраняется в базе, поэтому прерванная сборка продолжится после перезапуска
+        result = await start_pack_job(
+            context.bot, user_id, update.effective_chat.id, pack_name, pack_name_base, author_name, is_private,
+            sticker_files, emojis, sticker_format, on_progress
+        )
     except Exception as e:
         log_error(f"Ошибка при создании нового стикерпака: {str(e)}", traceback.format_exc())
         await update.effective_message.reply_text('Не удалось создать новый стикерпак.')
         return
 
-    # Добавляем остальные стикеры
-    for idx in range(1, len(sticker_files)):
-        sticker_path = sticker_files[idx]
-        emoji_assigned = emojis[idx]
-        with open(sticker_path, 'rb') as sticker_file:
-            try:
-                if sticker_format == 'video':
-                    sticker = InputSticker(
-                        sticker=sticker_file,
-                        emoji_list=[emoji_assigned],
-                        mask_position=None,
-                        keywords=None,
-                        format='video'
-                    )
-                else:
-                    sticker = InputSticker(
-                        sticker=sticker_file,
-                        emoji_list=[emoji_assigned],
-                        mask_position=None,
-                        keywords=None,
-                        format='static'
-                    )
-                await context.bot.add_sticker_to_set(
-                    user_id=user_id,
-                    name=pack_name,
-                    sticker=sticker
-                )
-                await asyncio.sleep(0.5)  # Избегаем перегрузки запросами
-            except Exception as e:
-                log_error(f"Ошибка при добавлении стикера: {str(e)}", traceback.format_exc())
-                await update.effective_message.reply_text(f'Не удалось добавить стикер {idx + 1}.')
-                continue
+    if not result['created']:
+        log_error(f"Не удалось создать стикерпак {pack_name}: ни один файл не загружен")
+        await update.effective_message.reply_text('Не удалось создать новый стикерпак.')
+        return
+
+    for idx in result['failed']:
+        await update.effective_message.reply_text(f'Не удалось добавить стикер {idx + 1}.')
 
     # Отправляем сообщение об успешном создании
-    pack_link = f'https://t.me/addstickers/{pack_name}'
     await update.effective_message.reply_text(
-        f'Стикерпак "{pack_name_base}" успешно создан!\nСсылка: {pack_link}'
+        f'Стикерпак "{pack_name_base}" успешно создан!\nСсылка: {result["pack_link"]}'
     )
 
-    # Сохраняем стикерпак в базе данных
-    add_sticker_pack(user_id, pack_name_base, author_name, pack_link, is_private)
-
 
 
 async def process_image_with_rembg(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1483,25 +1470,24 @@ async def process_image_with_rembg(update: Update, context: ContextTypes.DEFAULT
     image_path = context.user_data.get('processing_image_path')
     output_path = image_path.replace('.png', '_rembg.png')
 
-    # Вызов функции из rembg.py
-    result_image = remove_background_from_image(image_path)
-    result_image.save(output_path)
+    # Обработка RemBG в пуле инференса
+    await remove_background_async('rembg', image_path, output_path)
 
     # Обновляем изображение в user_data
     idx = context.user_data.get('processing_image_index')
     context.user_data['image_files'][idx] = output_path
 
     # Отображаем обработанное изображение с кнопками
-    with open(output_path, 'rb') as img:
-        await context.bot.send_photo(
-            chat_id=update.effective_chat.id,
-            photo=img,
-            caption="Обработка завершена.",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("Готово", callback_data='image_processing_done')],
-                [InlineKeyboardButton("Отмена", callback_data='cancel_image_processing')]
-            ])
-        )
+    await send_cached_photo(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        path=output_path,
+        caption="Обработка завершена.",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("Готово", callback_data='image_processing_done')],
+            [InlineKeyboardButton("Отмена", callback_data='cancel_image_processing')]
+        ])
+    )
 
 async def process_image_with_u2net(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.effective_message.reply_text("Ожидайте...")
@@ -1509,25 +1495,24 @@ async def process_image_with_u2net(update: Update, context: ContextTypes.DEFAULT
     image_path = context.user_data.get('processing_image_path')
     output_path = image_path.replace('.png', '_u2net.png')
 
-    # Вызов функций из u2net.py
-    mask = remove_background_u2net(image_path, u2net_model)
-    save_u2net_result(image_path, mask, output_path)
+    # Обработка U2Net в пуле инференса
+    await remove_background_async('u2net', image_path, output_path)
 
     # Обновляем изображение в user_data
     idx = context.user_data.get('processing_image_index')
     context.user_data['image_files'][idx] = output_path
 
     # Отображаем обработанное изображение с кнопками
-    with open(output_path, 'rb') as img:
-        await context.bot.send_photo(
-            chat_id=update.effective_chat.id,
-            photo=img,
-            caption="Обработка завершена.",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("Готово", callback_data='image_processing_done')],
-                [InlineKeyboardButton("Отмена", callback_data='cancel_image_processing')]
-            ])
-        )
+    await send_cached_photo(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        path=output_path,
+        caption="Обработка завершена.",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("Готово", callback_data='image_processing_done')],
+            [InlineKeyboardButton("Отмена", callback_data='cancel_image_processing')]
+        ])
+    )
 
 
 
@@ -1541,32 +1526,32 @@ async def prompt_for_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         sticker_path = sticker_files[current]
         if current < len(image_files):
             # Обработка изображения
-            with open(sticker_path, 'rb') as img:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=img,
-                    caption=f'Пришлите эмодзи для этого стикера {current + 1}/{len(sticker_files)}:',
-                    reply_markup=InlineKeyboardMarkup([
-                        [
-                            InlineKeyboardButton("Пропустить", callback_data='skip'),
-                            InlineKeyboardButton("Пропустить все", callback_data='skip_all')
-                        ]
-                    ])
-                )
+            await send_cached_photo(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=sticker_path,
+                caption=f'Пришлите эмодзи для этого стикера {current + 1}/{len(sticker_files)}:',
+                reply_markup=InlineKeyboardMarkup([
+                    [
+                        InlineKeyboardButton("Пропустить", callback_data='skip'),
+                        InlineKeyboardButton("Пропустить все", callback_data='skip_all')
+                    ]
+                ])
+            )
         else:
             # Обработка видео
-            with open(sticker_path, 'rb') as video_file:
-                await context.bot.send_video(
-                    chat_id=update.effective_chat.id,
-                    video=video_file,
-                    caption=f'Пришлите эмодзи для этого стикера {current + 1}/{len(sticker_files)}:',
-                    reply_markup=InlineKeyboardMarkup([
-                        [
-                            InlineKeyboardButton("Пропустить", callback_data='skip'),
-                            InlineKeyboardButton("Пропустить все", callback_data='skip_all')
-                        ]
-                    ])
-                )
+            await send_cached_video(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=sticker_path,
+                caption=f'Пришлите эмодзи для этого стикера {current + 1}/{len(sticker_files)}:',
+                reply_markup=InlineKeyboardMarkup([
+                    [
+                        InlineKeyboardButton("Пропустить", callback_data='skip'),
+                        InlineKeyboardButton("Пропустить все", callback_data='skip_all')
+                    ]
+                ])
+            )
         return AWAITING_EMOJI
     else:
         await ask_for_pack_name(update, context)
@@ -1633,12 +1618,12 @@ async def edit_photos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
     # Отправляем все фото с номерами
     for idx, image_path in enumerate(image_files):
-        with open(image_path, 'rb') as img:
-            await context.bot.send_photo(
-                chat_id=update.effective_chat.id,
-                photo=img,
-                caption=f'Фото #{idx + 1}'
-            )
+        await send_cached_photo(
+            context.bot,
+            chat_id=update.effective_chat.id,
+            path=image_path,
+            caption=f'Фото #{idx + 1}'
+        )
 
     await update.effective_message.reply_text('Какое фото нужно изменить? Введите номер фото.')
     return EDITING_PHOTOS
@@ -1652,16 +1637,12 @@ async def handle_new_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await update.message.reply_text('Не выбран номер фото для замены.')
             return EDITING_PHOTOS
 
-        file = await context.bot.get_file(update.message.photo[-1].file_id)
-        file_path = f'images/photo_{photo_number}.jpg'
-        await file.download_to_drive(file_path)
-
-        img = Image.open(file_path)
         # Изменено: Масштабирование без жесткого подгонки до 512x512
-        img.thumbnail((512, 512), Image.ANTIALIAS)
         processed_path = f'processed/sticker_{photo_number}.png'
-        img.save(processed_path, 'PNG')
+        await save_incoming_photo(context.bot, update.message.photo[-1], processed_path)
 
+        # Старое фото заменено — его фоновая обработка больше не нужна
+        cancel_speculative_processing(context, context.user_data['image_files'][photo_number])
         context.user_data['image_files'][photo_number] = processed_path
         await update.message.reply_text('Фото заменено. Все готово? Выберите: Изменить ещё или Готово.', reply_markup=InlineKeyboardMarkup([
             [
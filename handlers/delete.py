@@ -1,6 +1,6 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import get_user_packs, delete_sticker_pack
+from async_database import get_user_packs, delete_sticker_pack
 from utils import log_error
 import traceback
 
@@ -9,7 +9,7 @@ async def delete_pack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         query = update.callback_query
         await query.answer()
 
-        user_packs = get_user_packs(update.effective_user.id)
+        user_packs = await get_user_packs(update.effective_user.id)
         if not user_packs:
             await query.edit_message_text('У вас нет стикерпаков для удаления.')
             return
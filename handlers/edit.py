@@ -3,20 +3,21 @@ import re
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from tg_stickers_bot.database import get_user_packs, get_pack_by_id, update_pack_name, replace_stickers
+from tg_stickers_bot.async_database import get_user_packs, get_pack_by_id, update_pack_name, replace_stickers
 from tg_stickers_bot.states import EDITING_PHOTOS, AWAITING_PACK_NAME, PROCESSING_MEDIA
 from tg_stickers_bot.utils import log_error
+from tg_stickers_bot.media_cache import send_cached_photo, send_cached_video
 import traceback
 
 from tg_stickers_bot.handlers.create import prepare_stickers_for_pack, is_english, \
     process_image_variants, process_video_variants, \
-    show_current_media_selection_menu  # Импортируем функцию создания стикерпаков
+    show_current_media_selection_menu, wait_for_speculative_processing  # Импортируем функцию создания стикерпаков
 
 async def edit_pack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
 
-    user_packs = get_user_packs(update.effective_user.id)
+    user_packs = await get_user_packs(update.effective_user.id)
     if not user_packs:
         await query.edit_message_text('У вас нет стикерпаков для редактирования.')
         return
@@ -41,7 +42,7 @@ async def edit_pack_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.edit_message_text('Некорректный идентификатор стикерпака.')
         return EDITING_PHOTOS
 
-    pack = get_pack_by_id(pack_id)
+    pack = await get_pack_by_id(pack_id)
     if not pack:
         await query.edit_message_text('Стикерпак не найден.')
         return EDITING_PHOTOS
@@ -69,7 +70,7 @@ async def process_new_pack_name(update: Update, context: ContextTypes.DEFAULT_TY
         return AWAITING_PACK_NAME
     pack_id = context.user_data.get('selected_pack_id')
     if pack_id:
-        update_pack_name(pack_id, new_name)
+        await update_pack_name(pack_id, new_name)
         await update.message.reply_text('Название стикерпака успешно обновлено.')
     else:
         await update.message.reply_text('Не удалось определить стикерпак для обновления.')
@@ -141,6 +142,8 @@ async def process_current_media(update: Update, context: ContextTypes.DEFAULT_TY
     if idx < len(image_files):
         media_type = 'image'
         media_path = image_files[idx]
+        # Если изображение уже обрабатывается в фоне, варианты возьмутся из кэша без повторного запуска
+        await wait_for_speculative_processing(context, media_path)
         processed_variants = await process_image_variants(media_path)
     else:
         media_type = 'video'
@@ -162,19 +165,19 @@ async def process_current_media(update: Update, context: ContextTypes.DEFAULT_TY
 
     for variant_path in processed_variants:
         if media_type == 'image':
-            with open(variant_path, 'rb') as img:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=img,
-                    caption="Предварительный просмотр обработанного изображения"
-                )
+            await send_cached_photo(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=variant_path,
+                caption="Предварительный просмотр обработанного изображения"
+            )
         else:
-            with open(variant_path, 'rb') as video_file:
-                await context.bot.send_video(
-                    chat_id=update.effective_chat.id,
-                    video=video_file,
-                    caption="Предварительный просмотр обработанного видео"
-                )
+            await send_cached_video(
+                context.bot,
+                chat_id=update.effective_chat.id,
+                path=variant_path,
+                caption="Предварительный просмотр обработанного видео"
+            )
 
     await query.edit_message_text("Выберите лучший вариант:", reply_markup=reply_markup)
 
@@ -1,8 +1,8 @@
 # handlers/start.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from tg_stickers_bot.database import add_user, is_admin, get_public_packs
-from .admin import admin_panel
+from tg_stickers_bot.async_database import add_user, is_admin, get_public_packs
+from .admin import admin_panel, fetch_page, pagination_buttons, parse_page_cursor
 from .create import create_new_pack, PROCESSING_STICKERS
 from tg_stickers_bot.handlers.edit import edit_pack
 from .delete import delete_pack, confirm_delete_pack
@@ -14,7 +14,7 @@ import traceback
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         user = update.effective_user
-        add_user(user.id, user.username or user.full_name)
+        await add_user(user.id, user.username or user.full_name)
 
         keyboard = [
             [InlineKeyboardButton("Создать новый стикерпак", callback_data='create_new')],
@@ -24,7 +24,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             [InlineKeyboardButton("О боте", callback_data='about')]
         ]
 
-        if is_admin(user.id):
+        if await is_admin(user.id):
             keyboard.insert(0, [InlineKeyboardButton("Админ панель", callback_data='admin_panel')])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -71,22 +71,28 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def view_public_packs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
-        packs = context.bot_data.get('public_packs', [])
-        if not packs:
-            # Получаем публичные стикерпакеты из базы данных
-            packs = get_public_packs()
-            context.bot_data['public_packs'] = packs  # Кэшируем для будущих запросов
+        query = update.callback_query
+        after_id, before_id = 0, None
+        if query.data.startswith('public_packs_'):
+            await query.answer()
+            after_id, before_id = parse_page_cursor(query.data, 'public_packs')
+
+        # Страницы берутся из кэша get_public_packs, который сбрасывается при добавлении и удалении стикерпаков
+        packs, has_prev, has_next = await fetch_page(get_public_packs, after_id, before_id)
 
         if not packs:
-            await update.callback_query.edit_message_text('Публичных стикерпаков нет.')
+            await query.edit_message_text('Публичных стикерпаков нет.')
             return
 
         keyboard = [
             [InlineKeyboardButton(f"{pack[1]}", url=pack[3])]  # pack[3] = pack_link
             for pack in packs
         ]
+        buttons = pagination_buttons('public_packs', packs, has_prev, has_next)
+        if buttons:
+            keyboard.append(buttons)
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.callback_query.edit_message_text('Публичные стикерпакеты:', reply_markup=reply_markup)
+        await query.edit_message_text('Публичные стикерпакеты:', reply_markup=reply_markup)
     except Exception as e:
         log_error(f"Ошибка в view_public_packs: {str(e)}", traceback.format_exc())
         await update.effective_message.reply_text('Произошла ошибка при отображении публичных стикерпаков.')
@@ -0,0 +1,179 @@
+# image_processing.py
+
+# Функции этого модуля выполняются в процессах пула workers.py,
+# поэтому модели импортируются лениво — только внутри рабочего процесса.
+# Загруженные модели хранит model_registry.
+#
+# Исходное изображение декодируется один раз в массив NumPy; каждый инструмент
+# строит по нему только маску, а прозрачность накладывается векторно.
+
+import io
+import math
+import traceback
+
+import numpy as np
+from PIL import Image
+
+from utils import log_error
+
+BACKENDS = ('briaai', 'rembg', 'u2net')
+
+# Нормализация входа U2Net (средние и отклонения ImageNet), размер входа сети
+U2NET_INPUT_SIZE = 320
+U2NET_MEAN = np.array((0.485, 0.456, 0.406), dtype=np.float32)
+U2NET_STD = np.array((0.229, 0.224, 0.225), dtype=np.float32)
+
+
+def get_output_path(image_path: str, backend: str) -> str:
+    """Возвращает путь к результату обработки изображения выбранным инструментом."""
+    return image_path.replace('.png', f'_{backend}.png')
+
+
+def normalize_photo(data: bytes, photo_path: str, size: int = 512) -> None:
+    """
+    Декодирует фото из памяти, уменьшает до size пикселей по большей стороне и сохраняет PNG в photo_path.
+
+    Для JPEG используется draft: декодер сразу распаковывает кадр в масштабе 1/2, 1/4 или 1/8,
+    не меньшем итогового размера, поэтому полноразмерное изображение в памяти не создаётся.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        scale = min(1.0, size / max(width, height))
+        image.draft(None, (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))))
+        image.thumbnail((size, size))
+        image.save(photo_path, 'PNG')
+
+
+def load_rgb(image_path: str) -> np.ndarray:
+    """Декодирует изображение в массив RGB (H, W, 3) uint8."""
+    with Image.open(image_path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def composite(rgb: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Добавляет маску к изображению как альфа-канал. Возвращает массив RGBA (H, W, 4)."""
+    return np.dstack((rgb, mask))
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Кодирует массив RGBA в PNG в памяти."""
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, mode='RGBA').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _u2net_input(rgb: np.ndarray) -> np.ndarray:
+    resized = Image.fromarray(rgb).resize((U2NET_INPUT_SIZE, U2NET_INPUT_SIZE), Image.BILINEAR)
+    array = np.asarray(resized, dtype=np.float32)
+    array /= max(float(array.max()), 1e-6)
+    array = (array - U2NET_MEAN) / U2NET_STD
+    return array.transpose(2, 0, 1)
+
+
+def _u2net_masks(model, images: list) -> list:
+    """Один прямой проход U2Net для пачки изображений RGB. Возвращает маски в размере исходных изображений."""
+    import torch
+
+    batch = torch.from_numpy(np.stack([_u2net_input(rgb) for rgb in images]))
+    device = next(model.parameters()).device
+    with torch.no_grad():
+        outputs = model(batch.to(device))
+    # Первый выход U2Net — итоговая карта заметности (N, 1, H, W)
+    predictions = outputs[0][:, 0].cpu().numpy()
+
+    low = predictions.min(axis=(1, 2), keepdims=True)
+    high = predictions.max(axis=(1, 2), keepdims=True)
+    predictions = ((predictions - low) / np.maximum(high - low, 1e-6) * 255).astype(np.uint8)
+
+    masks = []
+    for rgb, prediction in zip(images, predictions):
+        height, width = rgb.shape[:2]
+        mask = Image.fromarray(prediction, mode='L').resize((width, height), Image.BILINEAR)
+        masks.append(np.asarray(mask))
+    return masks
+
+
+def predict_masks(backend: str, images: list, batch_size: int = 8) -> list:
+    """
+    Строит маски переднего плана для изображений RGB одним инструментом.
+
+    U2Net и BriaAI обрабатывают до batch_size изображений за один прямой проход, RemBG — по одному
+    в общей сессии (его граф ONNX рассчитан на пачку из одного изображения).
+    """
+    from model_registry import get_model
+
+    model = get_model(backend)
+    masks = []
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        if backend == 'u2net':
+            masks.extend(_u2net_masks(model, chunk))
+        elif backend == 'briaai':
+            pil_images = [Image.fromarray(rgb) for rgb in chunk]
+            results = model(pil_images, batch_size=len(chunk), return_mask=True)
+            masks.extend(np.asarray(mask.convert('L')) for mask in results)
+        elif backend == 'rembg':
+            from rembg import remove
+            for rgb in chunk:
+                masks.append(np.asarray(remove(Image.fromarray(rgb), session=model, only_mask=True).convert('L')))
+        else:
+            raise ValueError(f"Неизвестный инструмент удаления фона: {backend}")
+    return masks
+
+
+def render_variants(image_path: str, backends=BACKENDS) -> dict:
+    """
+    Декодирует изображение один раз и строит по нему варианты без фона для всех инструментов.
+
+    Returns:
+        dict: инструмент -> PNG в виде bytes.
+    """
+    rgb = load_rgb(image_path)
+    return {
+        backend: encode_png(composite(rgb, predict_masks(backend, [rgb])[0]))
+        for backend in backends
+    }
+
+
+def remove_background(backend: str, image_path: str, output_path: str) -> str:
+    """Удаляет фон с изображения выбранным инструментом и сохраняет результат в output_path."""
+    data = render_variants(image_path, (backend,))[backend]
+    with open(output_path, 'wb') as output_file:
+        output_file.write(data)
+    return output_path
+
+
+def remove_background_batch(backend: str, image_paths: list, output_paths: list, batch_size: int = 8) -> list:
+    """
+    Удаляет фон с пачки изображений одним инструментом.
+
+    Если пачка целиком не обработалась, изображения обрабатываются по одному,
+    чтобы ошибка одного файла не затронула остальные.
+
+    Returns:
+        list: пути к результатам в порядке image_paths; None для изображений, которые не удалось обработать.
+    """
+    results = []
+    for start in range(0, len(image_paths), batch_size):
+        chunk = image_paths[start:start + batch_size]
+        chunk_outputs = output_paths[start:start + batch_size]
+        try:
+            images = [load_rgb(image_path) for image_path in chunk]
+            masks = predict_masks(backend, images, batch_size)
+            for rgb, mask, output_path in zip(images, masks, chunk_outputs):
+                with open(output_path, 'wb') as output_file:
+                    output_file.write(encode_png(composite(rgb, mask)))
+            results.extend(chunk_outputs)
+            continue
+        except Exception as e:
+            log_error(f"Пакетная обработка {backend} не удалась, обрабатываем по одному: {str(e)}",
+                      traceback.format_exc())
+
+        for image_path, output_path in zip(chunk, chunk_outputs):
+            try:
+                results.append(remove_background(backend, image_path, output_path))
+            except Exception as e:
+                log_error(f"Ошибка при обработке изображения {image_path} ({backend}): {str(e)}",
+                          traceback.format_exc())
+                results.append(None)
+    return results
@@ -71,8 +71,14 @@ from states import (
     VIDEO_VALIDATION, PROCESSING_MEDIA, EDITING_STICKERS, AWAITING_IMAGE_SELECTION
 )
 
-from database import initialize_db, add_user_message, get_public_packs
+from database import initialize_db
+from async_database import add_user_message
 from utils import cleanup_temp_files, log_error
+# Импортируем через пакет, как в handlers, чтобы останавливать тот же экземпляр пулов
+from tg_stickers_bot.workers import start_workers, shutdown_workers
+from pack_jobs import resume_pack_jobs
+from db_pool import close_all as close_db_connections
+from update_processor import PerUserUpdateProcessor
 import config
 
 # Определяем глобальный обработчик ошибок
@@ -92,7 +98,11 @@ async def global_error_handler(update, context):
         if update and update.effective_message:
             message_text = update.effective_message.text or update.effective_message.caption
             if user_id:
-                add_user_message(user_id, message_text, has_error=True, error_log_link=log_file)
+                await add_user_message(user_id, message_text, has_error=True, error_log_link=log_file)
+
+async def on_startup(application) -> None:
+    """Запускает дособирание стикерпаков, прерванных прошлым перезапуском."""
+    application.create_task(resume_pack_jobs(application.bot))
 
 def main() -> None:
     # Включаем логирование
@@ -104,7 +114,12 @@ def main() -> None:
     initialize_db()
     try:
         initialize_db()
-        application = ApplicationBuilder().token(config.TOKEN).build()
+        start_workers()
+        # Обновления разных пользователей обрабатываются параллельно: долгая обработка у одного
+        # пользователя не задерживает остальных, а диалог каждого идёт последовательно
+        application = ApplicationBuilder().token(config.TOKEN) \
+            .concurrent_updates(PerUserUpdateProcessor(config.UPDATE_CONCURRENCY)) \
+            .post_init(on_startup).build()
 
         # Конфигурируем ConversationHandler для создания стикерпаков
         conv_handler = ConversationHandler(
@@ -145,10 +160,10 @@ def main() -> None:
                 ],
                 ADMIN_PANEL: [
                     CallbackQueryHandler(admin_panel_buttons,
-                                         pattern='^(admin_users|admin_all_packs|admin_access_pack|back_to_main)$'),
+                                         pattern='^(admin_users|admin_all_packs|admin_access_pack|admin_cache_stats|admin_panel|back_to_main)$'),
                 ],
                 ADMIN_USER_LIST: [
-                    CallbackQueryHandler(admin_users_pagination, pattern='^(admin_users_next|admin_users_prev)$'),
+                    CallbackQueryHandler(admin_users_pagination, pattern=r'^admin_users_(next|prev)_\d+$'),
                     CallbackQueryHandler(admin_user_packs, pattern=r'^admin_user_\d+$'),
                     CallbackQueryHandler(admin_panel, pattern='^admin_panel$'),
                 ],
@@ -162,7 +177,7 @@ def main() -> None:
                 ],
                 ADMIN_ALL_PACKS: [
                     CallbackQueryHandler(admin_all_packs_pagination,
-                                         pattern='^(admin_all_packs_next|admin_all_packs_prev)$'),
+                                         pattern=r'^admin_all_packs_(next|prev)_\d+$'),
                     CallbackQueryHandler(admin_all_pack_actions, pattern=r'^admin_all_pack_\d+$'),
                     CallbackQueryHandler(admin_panel, pattern='^admin_panel$'),
                 ],
@@ -190,12 +205,16 @@ def main() -> None:
         )
 
         application.add_handler(conv_handler)
+        # Кнопки «<» и «>» списка публичных стикерпаков работают и после завершения диалога
+        application.add_handler(CallbackQueryHandler(view_public_packs, pattern=r'^public_packs_(next|prev)_\d+$'))
 
         # Добавляем глобальный обработчик ошибок
         application.add_error_handler(global_error_handler)
 
         application.run_polling()
     finally:
+        shutdown_workers()
+        close_db_connections()
         cleanup_temp_files()
 
 if __name__ == '__main__':
@@ -0,0 +1,110 @@
+# media_cache.py
+
+# Повторная отправка превью по file_id вместо загрузки файла заново.
+# После первой отправки локального файла запоминается file_id, который вернул Telegram,
+# и при листании ⬅️/➡️ тот же файл отправляется по идентификатору, без передачи байтов.
+# Запись привязана к mtime и размеру файла: если файл перезаписан (обработка, замена фото),
+# версия не совпадёт и файл будет загружен снова.
+
+import os
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+from cache import get_cache
+from config import FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL
+from utils import log_info
+
+
+def _file_ids():
+    return get_cache('file_ids', FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL)
+
+
+def _file_version(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _sent_file_id(message, kind: str):
+    """file_id из отправленного сообщения, если Telegram сохранил файл с тем же типом."""
+    if kind == 'photo':
+        return message.photo[-1].file_id if message.photo else None
+    media = getattr(message, kind, None)
+    return media.file_id if media else None
+
+
+async def _send_cached(send, kind: str, path: str, **kwargs):
+    file_ids = _file_ids()
+    key = (kind, path)
+    version = _file_version(path)
+    entry = file_ids.get(key)
+    if entry is not None and entry[0] == version:
+        try:
+            return await send(**{kind: entry[1]}, **kwargs)
+        except BadRequest as e:
+            # file_id больше не принимается — загружаем файл заново
+            log_info(f"file_id для {path} отклонён ({e}), файл будет загружен повторно")
+            file_ids.invalidate(key)
+
+    with open(path, 'rb') as media_file:
+        message = await send(**{kind: media_file}, **kwargs)
+    file_id = _sent_file_id(message, kind)
+    if file_id:
+        file_ids.set(key, (version, file_id))
+    return message
+
+
+async def send_cached_photo(bot, chat_id: int, path: str, **kwargs):
+    """Отправляет изображение path, используя file_id предыдущей отправки того же файла."""
+    return await _send_cached(bot.send_photo, 'photo', path, chat_id=chat_id, **kwargs)
+
+
+async def send_cached_video(bot, chat_id: int, path: str, **kwargs):
+    """Отправляет видео path, используя file_id предыдущей отправки того же файла."""
+    return await _send_cached(bot.send_video, 'video', path, chat_id=chat_id, **kwargs)
+
+
+async def send_cached_document(bot, chat_id: int, path: str, **kwargs):
+    """Отправляет файл path как документ, используя file_id предыдущей отправки того же файла."""
+    return await _send_cached(bot.send_document, 'document', path, chat_id=chat_id, **kwargs)
+
+
+async def send_cached_photo_group(bot, chat_id: int, photos: list, **kwargs):
+    """
+    Отправляет изображения альбомом (send_media_group). photos — список пар (путь, подпись).
+
+    Уже отправленные файлы передаются по file_id, остальные загружаются, и их file_id запоминаются.
+    Если Telegram отклонил альбом с file_id, он отправляется ещё раз целиком из файлов.
+    """
+    file_ids = _file_ids()
+    versions = [_file_version(path) for path, _ in photos]
+    cached = []
+    for (path, _), version in zip(photos, versions):
+        entry = file_ids.get(('photo', path))
+        cached.append(entry[1] if entry is not None and entry[0] == version else None)
+
+    async def send(use_cached: bool):
+        media = []
+        for (path, caption), file_id in zip(photos, cached):
+            if use_cached and file_id:
+                media.append(InputMediaPhoto(media=file_id, caption=caption))
+            else:
+                with open(path, 'rb') as media_file:
+                    media.append(InputMediaPhoto(media=media_file.read(), caption=caption))
+        return await bot.send_media_group(chat_id=chat_id, media=media, **kwargs)
+
+    try:
+        messages = await send(use_cached=True)
+    except BadRequest as e:
+        if not any(cached):
+            raise
+        log_info(f"file_id альбома отклонён ({e}), файлы будут загружены повторно")
+        for path, _ in photos:
+            file_ids.invalidate(('photo', path))
+        messages = await send(use_cached=False)
+
+    for (path, _), version, message in zip(photos, versions, messages):
+        file_id = _sent_file_id(message, 'photo')
+        if file_id:
+            file_ids.set(('photo', path), (version, file_id))
+    return messages
@@ -0,0 +1,233 @@
+# media_probe.py
+
+# Характеристики видео (длительность, размеры, fps, кодек, альфа-канал, размер файла)
+# без открытия VideoFileClip, который запускает ffmpeg и декодирует кадр.
+# WebM читается напрямую: нужные поля лежат в заголовке EBML (Segment → Info и Tracks)
+# до первого кластера с кадрами. Остальные контейнеры разбираются одним вызовом ffprobe,
+# а если ffprobe нет (moviepy приносит только ffmpeg), — через VideoFileClip, как раньше.
+# Результат запоминается по пути и проверяется по mtime и размеру файла,
+# поэтому проверка, логирование и повторная проверка одного файла стоят одного разбора.
+
+import json
+import os
+import shutil
+import struct
+import subprocess
+
+from cache import get_cache
+from config import PROBE_CACHE_SIZE, PROBE_CACHE_TTL
+
+# Сколько байт от начала файла читать в поисках Info и Tracks
+EBML_HEADER_BYTES = 256 * 1024
+
+EBML_ID = 0x1A45DFA3
+DOC_TYPE_ID = 0x4282
+SEGMENT_ID = 0x18538067
+CLUSTER_ID = 0x1F43B675
+INFO_ID = 0x1549A966
+TIMECODE_SCALE_ID = 0x2AD7B1
+DURATION_ID = 0x4489
+TRACKS_ID = 0x1654AE6B
+TRACK_ENTRY_ID = 0xAE
+TRACK_TYPE_ID = 0x83
+CODEC_ID_ID = 0x86
+DEFAULT_DURATION_ID = 0x23E383
+VIDEO_ID = 0xE0
+PIXEL_WIDTH_ID = 0xB0
+PIXEL_HEIGHT_ID = 0xBA
+ALPHA_MODE_ID = 0x53C0
+
+# Кодеки Matroska -> имена ffprobe, чтобы оба способа возвращали одинаковые значения
+MATROSKA_CODECS = {
+    'V_VP9': 'vp9',
+    'V_VP8': 'vp8',
+    'V_AV1': 'av1',
+    'V_MPEG4/ISO/AVC': 'h264',
+}
+
+
+def _file_version(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def probe_media(path: str) -> dict:
+    """
+    Возвращает характеристики видео: duration (с), width, height, fps, codec, alpha, file_size.
+
+    Raises:
+        ValueError: если ffprobe не смог разобрать файл или в нём нет видеопотока.
+    """
+    probes = get_cache('media_probe', PROBE_CACHE_SIZE, PROBE_CACHE_TTL)
+    version = _file_version(path)
+    entry = probes.get(path)
+    if entry is not None and entry[0] == version:
+        return dict(entry[1])
+
+    props = probe_webm(path)
+    if props is None:
+        props = probe_ffprobe(path) if shutil.which('ffprobe') else probe_moviepy(path)
+    props['file_size'] = version[1]
+    probes.set(path, (version, props))
+    return dict(props)
+
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> tuple:
+    """Читает целое переменной длины EBML. Возвращает (значение, длина) или (None, 0), если данных не хватает."""
+    if pos >= len(data):
+        return None, 0
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        return None, 0
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        # Неизвестный размер (потоковая запись) — элемент продолжается до конца родителя
+        value = -1
+    return value, length
+
+
+def _elements(data: bytes, start: int, end: int):
+    """Перебирает элементы EBML в data[start:end]: (id, начало данных, конец данных)."""
+    pos = start
+    while pos < end:
+        element_id, id_length = _read_vint(data, pos, keep_marker=True)
+        size, size_length = _read_vint(data, pos + id_length, keep_marker=False)
+        if element_id is None or size is None:
+            return
+        data_start = pos + id_length + size_length
+        data_end = end if size < 0 else data_start + size
+        yield element_id, data_start, min(data_end, end)
+        if data_end > end:
+            return
+        pos = data_end
+
+
+def _uint(data: bytes) -> int:
+    return int.from_bytes(data, 'big')
+
+
+def _float(data: bytes) -> float:
+    return struct.unpack('>f' if len(data) == 4 else '>d', data)[0]
+
+
+def probe_webm(path: str):
+    """Разбирает заголовок WebM/Matroska. Возвращает None, если это не WebM или нужных полей нет."""
+    with open(path, 'rb') as f:
+        data = f.read(EBML_HEADER_BYTES)
+
+    doc_type = None
+    segment = None
+    for element_id, start, end in _elements(data, 0, len(data)):
+        if element_id == EBML_ID:
+            for child_id, child_start, child_end in _elements(data, start, end):
+                if child_id == DOC_TYPE_ID:
+                    doc_type = data[child_start:child_end].decode('ascii', 'ignore')
+        elif element_id == SEGMENT_ID:
+            segment = (start, end)
+            break
+    if doc_type not in ('webm', 'matroska') or segment is None:
+        return None
+
+    timecode_scale = 1000000
+    duration = None
+    track = None
+    for element_id, start, end in _elements(data, *segment):
+        if element_id == CLUSTER_ID:
+            break
+        if element_id == INFO_ID:
+            for child_id, child_start, child_end in _elements(data, start, end):
+                if child_id == TIMECODE_SCALE_ID:
+                    timecode_scale = _uint(data[child_start:child_end])
+                elif child_id == DURATION_ID:
+                    duration = _float(data[child_start:child_end])
+        elif element_id == TRACKS_ID:
+            for entry_id, entry_start, entry_end in _elements(data, start, end):
+                if entry_id == TRACK_ENTRY_ID and track is None:
+                    track = _video_track(data, entry_start, entry_end)
+
+    if duration is None or track is None or not track.get('width') or not track.get('height'):
+        return None
+    default_duration = track.pop('default_duration', None)
+    track['duration'] = duration * timecode_scale / 1e9
+    track['fps'] = 1e9 / default_duration if default_duration else None
+    return track
+
+
+def _video_track(data: bytes, start: int, end: int):
+    track = {'alpha': False}
+    is_video = False
+    for element_id, child_start, child_end in _elements(data, start, end):
+        value = data[child_start:child_end]
+        if element_id == TRACK_TYPE_ID:
+            is_video = _uint(value) == 1
+        elif element_id == CODEC_ID_ID:
+            codec = value.rstrip(b'\x00').decode('ascii', 'ignore')
+            track['codec'] = MATROSKA_CODECS.get(codec, codec)
+        elif element_id == DEFAULT_DURATION_ID:
+            track['default_duration'] = _uint(value)
+        elif element_id == VIDEO_ID:
+            for video_id, video_start, video_end in _elements(data, child_start, child_end):
+                video_value = data[video_start:video_end]
+                if video_id == PIXEL_WIDTH_ID:
+                    track['width'] = _uint(video_value)
+                elif video_id == PIXEL_HEIGHT_ID:
+                    track['height'] = _uint(video_value)
+                elif video_id == ALPHA_MODE_ID:
+                    track['alpha'] = _uint(video_value) == 1
+    return track if is_video else None
+
+
+def probe_ffprobe(path: str) -> dict:
+    """Характеристики первого видеопотока одним вызовом ffprobe."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+         'stream=width,height,codec_name,pix_fmt,avg_frame_rate,r_frame_rate,duration:stream_tags:format=duration',
+         '-of', 'json', path],
+        capture_output=True, text=True, timeout=30
+    )
+    if result.returncode != 0:
+        raise ValueError(f"ffprobe не смог разобрать {path}: {result.stderr.strip()}")
+    info = json.loads(result.stdout)
+    streams = info.get('streams') or []
+    if not streams:
+        raise ValueError(f"В файле {path} нет видеопотока")
+    stream = streams[0]
+    duration = stream.get('duration') or info.get('format', {}).get('duration')
+    tags = {key.lower(): value for key, value in (stream.get('tags') or {}).items()}
+    return {
+        'duration': float(duration) if duration else None,
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'fps': _frame_rate(stream.get('avg_frame_rate')) or _frame_rate(stream.get('r_frame_rate')),
+        'codec': stream.get('codec_name'),
+        # Декодер libvpx сообщает yuv420p, а наличие альфа-канала VP9 видно по тегу alpha_mode
+        'alpha': 'yuva' in (stream.get('pix_fmt') or '') or tags.get('alpha_mode') == '1',
+    }
+
+
+def _frame_rate(value):
+    if not value or value == '0/0':
+        return None
+    numerator, _, denominator = value.partition('/')
+    denominator = float(denominator or 1)
+    return float(numerator) / denominator if denominator else None
+
+
+def probe_moviepy(path: str) -> dict:
+    """Запасной способ без ffprobe: открывает файл через VideoFileClip."""
+    from moviepy.editor import VideoFileClip
+
+    with VideoFileClip(path) as clip:
+        return {
+            'duration': clip.duration,
+            'width': clip.w,
+            'height': clip.h,
+            'fps': clip.fps,
+            'codec': None,
+            'alpha': None,
+        }
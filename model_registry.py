@@ -0,0 +1,196 @@
+# model_registry.py
+
+# Реестр моделей удаления фона. У каждого процесса пула инференса свой реестр:
+# модель загружается один раз при первом обращении и остаётся в памяти,
+# пока ею пользуются. Редко используемые модели выгружаются по таймауту: проверку
+# раз в MODEL_IDLE_CHECK_INTERVAL секунд выполняет фоновый поток процесса (init_worker).
+
+import gc
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from PIL import Image
+
+from config import MODEL_IDLE_TIMEOUT, MODEL_IDLE_CHECK_INTERVAL
+from utils import log_error, log_info
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, 'photo', 'processing', 'models')
+
+# backend -> {'model': ..., 'loaded_at': ..., 'last_used': ..., 'memory': ..., 'calls': ...}
+_models = {}
+# Реестр используют задачи пула и поток выгрузки простаивающих моделей
+_models_lock = threading.RLock()
+
+
+def _current_rss() -> int:
+    """Возвращает текущий объём резидентной памяти процесса в байтах (0, если неизвестно)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _load_briaai():
+    from transformers import pipeline
+    model_path = os.path.join(MODELS_DIR, 'briaai')
+    if not os.path.isdir(model_path):
+        model_path = 'briaai/RMBG-1.4'
+    return pipeline('image-segmentation', model=model_path, trust_remote_code=True)
+
+
+def _load_rembg():
+    from rembg import new_session
+    rembg_home = os.path.join(MODELS_DIR, 'rembg')
+    if os.path.isdir(rembg_home):
+        os.environ.setdefault('U2NET_HOME', rembg_home)
+    # Без явной сессии rembg.remove создаёт новую сессию на каждый вызов
+    return new_session('u2net')
+
+
+def _load_u2net():
+    from photo.processing.u2net import u2net_model
+    return u2net_model
+
+
+def _unload_u2net():
+    # Модель U2Net хранится в глобальной переменной модуля, поэтому выгружаем и сам модуль.
+    # Ссылку на модуль держит ещё и родительский пакет (атрибут photo.processing.u2net) —
+    # без её удаления модуль и модель остаются в памяти
+    sys.modules.pop('photo.processing.u2net', None)
+    package = sys.modules.get('photo.processing')
+    if package is not None and hasattr(package, 'u2net'):
+        delattr(package, 'u2net')
+
+
+LOADERS = {
+    'briaai': _load_briaai,
+    'rembg': _load_rembg,
+    'u2net': _load_u2net,
+}
+
+UNLOADERS = {
+    'u2net': _unload_u2net,
+}
+
+
+def get_model(backend: str):
+    """Возвращает загруженную модель backend, при необходимости загружая её."""
+    with _models_lock:
+        unload_idle_models(exclude=backend)
+
+        entry = _models.get(backend)
+        if entry is None:
+            if backend not in LOADERS:
+                raise ValueError(f"Неизвестный инструмент удаления фона: {backend}")
+            rss_before = _current_rss()
+            started = time.monotonic()
+            model = LOADERS[backend]()
+            entry = {
+                'model': model,
+                'loaded_at': time.time(),
+                'load_time': time.monotonic() - started,
+                'memory': max(0, _current_rss() - rss_before),
+                'last_used': time.monotonic(),
+                'calls': 0,
+            }
+            _models[backend] = entry
+            log_info(f"Модель {backend} загружена за {entry['load_time']:.1f} с, "
+                     f"память: {entry['memory'] / 2 ** 20:.0f} МБ (процесс {os.getpid()})")
+
+        entry['last_used'] = time.monotonic()
+        entry['calls'] += 1
+        return entry['model']
+
+
+def unload_model(backend: str) -> None:
+    """Выгружает модель backend из памяти процесса."""
+    with _models_lock:
+        entry = _models.pop(backend, None)
+        if entry is None:
+            return
+        del entry['model']
+        if backend in UNLOADERS:
+            UNLOADERS[backend]()
+    gc.collect()
+    log_info(f"Модель {backend} выгружена (процесс {os.getpid()})")
+
+
+def unload_idle_models(exclude: str = None) -> None:
+    """Выгружает модели, которыми не пользовались дольше MODEL_IDLE_TIMEOUT секунд."""
+    with _models_lock:
+        now = time.monotonic()
+        for backend, entry in list(_models.items()):
+            if backend != exclude and now - entry['last_used'] > MODEL_IDLE_TIMEOUT:
+                unload_model(backend)
+
+
+def get_model_stats() -> dict:
+    """Возвращает сведения о моделях, загруженных в этом процессе: память, время загрузки, число вызовов и простой."""
+    with _models_lock:
+        now = time.monotonic()
+        return {
+            backend: {
+                'memory': entry['memory'],
+                'load_time': entry['load_time'],
+                'calls': entry['calls'],
+                'idle': now - entry['last_used'],
+            }
+            for backend, entry in _models.items()
+        }
+
+
+def worker_model_stats(hold: float = 0.0) -> tuple:
+    """
+    Задача пула инференса: (pid процесса, get_model_stats()).
+
+    hold — сколько секунд задержать процесс, чтобы одновременно отправленные задачи
+    достались разным процессам пула.
+    """
+    if hold:
+        time.sleep(hold)
+    return os.getpid(), get_model_stats()
+
+
+def _unload_idle_loop() -> None:
+    while True:
+        time.sleep(MODEL_IDLE_CHECK_INTERVAL)
+        try:
+            unload_idle_models()
+        except Exception as e:
+            log_error(f"Ошибка при выгрузке простаивающих моделей: {str(e)}", traceback.format_exc())
+
+
+def init_worker(backends) -> None:
+    """
+    Инициализатор процесса пула инференса: прогревает модели backends и запускает поток,
+    который выгружает простаивающие модели, даже когда новых задач нет.
+    """
+    threading.Thread(target=_unload_idle_loop, name='model-idle-sweep', daemon=True).start()
+    warm_up_models(backends)
+
+
+def warm_up_models(backends) -> None:
+    """Загружает модели и прогоняет через каждую пустое изображение, чтобы первый запрос не ждал загрузки."""
+    from image_processing import remove_background
+
+    fd, dummy_path = tempfile.mkstemp(suffix='.png')
+    os.close(fd)
+    try:
+        Image.new('RGB', (64, 64), (255, 255, 255)).save(dummy_path, 'PNG')
+        for backend in backends:
+            output_path = dummy_path.replace('.png', f'_{backend}.png')
+            try:
+                remove_background(backend, dummy_path, output_path)
+            except Exception as e:
+                log_error(f"Не удалось прогреть модель {backend}: {str(e)}", traceback.format_exc())
+            finally:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+    finally:
+        os.remove(dummy_path)
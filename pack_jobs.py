@@ -0,0 +1,124 @@
+# pack_jobs.py
+
+# Сборка стикерпака как задание в базе данных: упорядоченный список файлов, эмодзи
+# и статус каждого стикера сохраняются до начала загрузки. Если бот перезапустится
+# посреди сборки, resume_pack_jobs при старте продолжит её с того стикера, на котором она остановилась.
+
+import traceback
+
+from telegram.error import BadRequest
+
+from async_database import (create_pack_job, get_pack_job, get_pack_job_stickers, get_unfinished_pack_jobs,
+                            update_pack_job_status, update_pack_job_stickers, add_sticker_pack)
+from sticker_upload import build_sticker_set
+from utils import log_error, log_info
+
+
+async def _count_set_stickers(bot, name: str):
+    """Возвращает число стикеров в наборе name или None, если набора нет."""
+    try:
+        sticker_set = await bot.get_sticker_set(name)
+        return len(sticker_set.stickers)
+    except BadRequest:
+        return None
+
+
+async def run_pack_job(bot, job_id: int, on_progress=None, resume: bool = False) -> dict:
+    """
+    Выполняет (или продолжает) задание на сборку стикерпака.
+
+    Args:
+        on_progress: необязательная корутина on_progress(count), см. build_sticker_set.
+        resume: задание продолжается после перезапуска — состояние набора сверяется с Telegram.
+
+    Returns:
+        dict: created — существует ли набор, failed — позиции стикеров, которые не удалось добавить,
+        pack_link — ссылка на набор.
+    """
+    _, user_id, chat_id, name, title, author_name, is_private, sticker_format, status = await get_pack_job(job_id)
+    stickers = await get_pack_job_stickers(job_id)
+    pending = [(position, file_path, emoji_assigned)
+               for position, file_path, emoji_assigned, sticker_status in stickers if sticker_status == 'pending']
+    failed = [position for position, _, _, sticker_status in stickers if sticker_status == 'failed']
+    set_exists = status == 'created'
+
+    if resume:
+        # Процесс мог завершиться между запросом к Telegram и записью в базу:
+        # стикеры добавляются по порядку, поэтому лишние стикеры в наборе — это первые из ожидающих
+        set_size = await _count_set_stickers(bot, name)
+        if set_size is not None:
+            set_exists = True
+            added = sum(1 for *_, sticker_status in stickers if sticker_status == 'added')
+            already_added = [position for position, _, _ in pending[:max(0, set_size - added)]]
+            if already_added:
+                await update_pack_job_stickers(job_id, already_added, 'added')
+                pending = pending[len(already_added):]
+            if on_progress and already_added:
+                await on_progress(len(already_added))
+
+    positions = [position for position, _, _ in pending]
+
+    async def on_added(indices):
+        await update_pack_job_stickers(job_id, [positions[idx] for idx in indices], 'added')
+        await update_pack_job_status(job_id, 'created')
+
+    async def on_failed(indices):
+        # Ошибка записывается сразу: после перезапуска стикер не считается ожидающим
+        await update_pack_job_stickers(job_id, [positions[idx] for idx in indices], 'failed')
+
+    if pending:
+        try:
+            result = await build_sticker_set(
+                bot, user_id, name, title,
+                [file_path for _, file_path, _ in pending], [emoji_assigned for _, _, emoji_assigned in pending],
+                sticker_format, on_progress, on_added=on_added, on_failed=on_failed, set_exists=set_exists
+            )
+        except BadRequest:
+            # Ошибку в самом запросе повторный запуск не исправит — задание больше не возобновляется
+            await update_pack_job_status(job_id, 'failed')
+            raise
+        set_exists = set_exists or result['created']
+        failed.extend(positions[idx] for idx in result['failed'])
+
+    pack_link = f'https://t.me/addstickers/{name}'
+    if set_exists:
+        await update_pack_job_status(job_id, 'done')
+        # Сохраняем стикерпак в базе данных
+        await add_sticker_pack(user_id, title, author_name, pack_link, is_private)
+    else:
+        await update_pack_job_status(job_id, 'failed')
+    return {'created': set_exists, 'failed': sorted(failed), 'pack_link': pack_link}
+
+
+async def start_pack_job(bot, user_id: int, chat_id: int, name: str, title: str, author_name: str, is_private: bool,
+                         sticker_files: list, emojis: list, sticker_format: str, on_progress=None) -> dict:
+    """Сохраняет задание на сборку стикерпака и выполняет его."""
+    job_id = await create_pack_job(user_id, chat_id, name, title, author_name, is_private, sticker_format,
+                             sticker_files, emojis)
+    if job_id is None:
+        # База недоступна — собираем без возможности возобновления
+        result = await build_sticker_set(bot, user_id, name, title, sticker_files, emojis, sticker_format, on_progress)
+        pack_link = f'https://t.me/addstickers/{name}'
+        if result['created']:
+            await add_sticker_pack(user_id, title, author_name, pack_link, is_private)
+        return {'created': result['created'], 'failed': result['failed'], 'pack_link': pack_link}
+    return await run_pack_job(bot, job_id, on_progress)
+
+
+async def resume_pack_jobs(bot) -> None:
+    """Продолжает задания на сборку, прерванные перезапуском бота, и сообщает пользователям результат."""
+    for job_id in await get_unfinished_pack_jobs():
+        job = await get_pack_job(job_id)
+        chat_id, title = job[2], job[4]
+        log_info(f"Возобновляем сборку стикерпака {job[3]} (задание {job_id})")
+        try:
+            result = await run_pack_job(bot, job_id, resume=True)
+            if not result['created']:
+                await bot.send_message(chat_id, f'Не удалось создать стикерпак "{title}".')
+                continue
+            text = f'Стикерпак "{title}" дособран после перезапуска бота!\nСсылка: {result["pack_link"]}'
+            if result['failed']:
+                text += '\nНе удалось добавить стикеры: ' + ', '.join(str(position + 1) for position in result['failed'])
+            await bot.send_message(chat_id, text)
+        except Exception as e:
+            log_error(f"Ошибка при возобновлении задания {job_id}: {str(e)}", traceback.format_exc())
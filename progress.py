@@ -0,0 +1,126 @@
+# progress.py
+
+import time
+from collections import deque
+
+from telegram.error import BadRequest, RetryAfter
+
+from config import PROGRESS_EDIT_INTERVAL
+from sticker_upload import retry_seconds
+from utils import log_error
+
+
+class ProgressReporter:
+    """
+    Показывает ход длительной задачи, редактируя одно сообщение.
+
+    Сообщение редактируется не чаще раза в PROGRESS_EDIT_INTERVAL секунд, чтобы не упираться
+    в ограничения Telegram на редактирование; при RetryAfter следующее обновление откладывается.
+    """
+
+    def __init__(self, bot, chat_id: int, message_id: int, title: str, total: int,
+                 min_interval: float = PROGRESS_EDIT_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.title = title
+        self.total = total
+        self.min_interval = min_interval
+        self.done = 0
+        self.started_at = time.monotonic()
+        self.next_edit_at = 0.0
+        self.last_text = None
+
+    def format(self, done: int) -> str:
+        text = f"{self.title}: {done} из {self.total}"
+        if 0 < done < self.total:
+            elapsed = time.monotonic() - self.started_at
+            eta = elapsed / done * (self.total - done)
+            text += f". Осталось примерно {int(eta) + 1} с"
+        return text
+
+    async def update(self, done: int, force: bool = False) -> None:
+        """Обновляет сообщение, если с прошлого обновления прошло достаточно времени (или force=True)."""
+        self.done = done
+        now = time.monotonic()
+        if not force and now < self.next_edit_at:
+            return
+        await self._edit(self.format(done), now)
+
+    async def advance(self, step: int = 1) -> None:
+        """Отмечает ещё step выполненных элементов."""
+        await self.update(self.done + step, force=self.done + step >= self.total)
+
+    async def finish(self, text: str, reply_markup=None) -> None:
+        """Показывает итоговый текст независимо от ограничения частоты."""
+        await self._edit(text, time.monotonic(), reply_markup=reply_markup)
+
+    async def _edit(self, text: str, now: float, reply_markup=None) -> None:
+        if text == self.last_text and reply_markup is None:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text, chat_id=self.chat_id, message_id=self.message_id, reply_markup=reply_markup
+            )
+            self.last_text = text
+            self.next_edit_at = now + self.min_interval
+        except RetryAfter as e:
+            self.next_edit_at = now + retry_seconds(e)
+        except BadRequest as e:
+            # «Message is not modified» и удалённое сообщение не мешают выполнению задачи
+            log_error(f"Не удалось обновить сообщение о ходе выполнения: {e}")
+            self.next_edit_at = now + self.min_interval
+
+
+async def start_progress(update, context, title: str, total: int) -> ProgressReporter:
+    """
+    Создаёт ProgressReporter для сообщения со статусом пользователя.
+
+    Используется сообщение status_message_id из user_data; если его нет — отправляется новое.
+    """
+    message_id = context.user_data.get('status_message_id')
+    if message_id is None:
+        message = await update.effective_message.reply_text(f"{title}: 0 из {total}")
+        message_id = message.message_id
+        context.user_data['status_message_id'] = message_id
+    reporter = ProgressReporter(context.bot, update.effective_chat.id, message_id, title, total)
+    await reporter.update(0, force=True)
+    return reporter
+
+
+# Сколько последних выполненных нажатий помнить для каждой задачи
+FINISHED_JOBS_KEPT = 32
+
+
+def begin_job(context, job: str, press=None) -> bool:
+    """
+    Отмечает задачу job пользователя как выполняющуюся.
+
+    Обновления одного пользователя обрабатываются по очереди (PerUserUpdateProcessor), поэтому
+    повторное нажатие той же кнопки обычно приходит уже после окончания задачи. press — ключ нажатия
+    (например, id сообщения с кнопкой): нажатие с ключом, для которого задача уже выполнена, отклоняется.
+
+    Returns:
+        bool: False, если такая задача уже выполняется или это нажатие уже обработано.
+    """
+    jobs = context.user_data.setdefault('jobs_in_flight', set())
+    if job in jobs:
+        return False
+    if press is not None and press in context.user_data.get('finished_jobs', {}).get(job, ()):
+        return False
+    jobs.add(job)
+    return True
+
+
+def end_job(context, job: str, press=None) -> None:
+    """
+    Снимает отметку о выполнении задачи job и запоминает обработанное нажатие press.
+
+    press передаётся только при успешном завершении: нажатие, после которого задача
+    завершилась ошибкой, можно повторить.
+    """
+    context.user_data.get('jobs_in_flight', set()).discard(job)
+    if press is not None:
+        # user_data могли очистить по ходу задачи, поэтому словарь создаётся заново при необходимости
+        finished = context.user_data.setdefault('finished_jobs', {})
+        finished.setdefault(job, deque(maxlen=FINISHED_JOBS_KEPT)).append(press)
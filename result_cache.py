@@ -0,0 +1,167 @@
+# result_cache.py
+
+# Кэш результатов удаления фона. Ключ — хэш содержимого исходного изображения,
+# инструмент и версия его модели, поэтому повторно загруженное фото не обрабатывается заново.
+# Файлы вытесняются по давности использования (LRU по mtime), когда кэш превышает бюджет на диске.
+#
+# Функции модуля читают и пишут файлы, поэтому обработчики вызывают их через asyncio.to_thread.
+
+import hashlib
+import os
+import shutil
+import threading
+
+from cache import get_cache
+from config import RESULT_CACHE_MAX_BYTES, IMAGE_HASH_CACHE_SIZE, IMAGE_HASH_CACHE_TTL
+from utils import log_error
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'background')
+
+# Версии моделей: при смене модели старые результаты перестают совпадать по ключу
+BACKEND_VERSIONS = {
+    'briaai': 'rmbg-1.4',
+    'rembg': 'u2net-mask',
+    'u2net': 'u2net-mask',
+}
+
+# Текущий объём кэша в байтах; считается при первом обращении
+_total_size = None
+# Запись в кэш идёт из нескольких потоков одновременно
+_size_lock = threading.Lock()
+
+
+def image_hash(image_path: str) -> str:
+    """Возвращает SHA-256 содержимого файла."""
+    # путь -> ((mtime, размер), хэш): один и тот же файл не читается повторно, пока не изменится
+    hashes = get_cache('image_hashes', IMAGE_HASH_CACHE_SIZE, IMAGE_HASH_CACHE_TTL)
+    stat = os.stat(image_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    entry = hashes.get(image_path)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    sha = hashlib.sha256()
+    with open(image_path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 20), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    hashes.set(image_path, (version, digest))
+    return digest
+
+
+def _cache_path(image_path: str, backend: str) -> str:
+    digest = image_hash(image_path)
+    version = BACKEND_VERSIONS.get(backend, '0')
+    return os.path.join(CACHE_DIR, digest[:2], f'{digest}_{backend}_{version}.png')
+
+
+def _get_total_size() -> int:
+    global _total_size
+    if _total_size is None:
+        _total_size = sum(size for _, _, size in _cache_entries())
+    return _total_size
+
+
+def _cache_entries():
+    """Возвращает (mtime, путь, размер) всех файлов кэша."""
+    entries = []
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+    return entries
+
+
+def fetch(image_path: str, backend: str, output_path: str) -> bool:
+    """
+    Копирует закэшированный результат в output_path.
+
+    Returns:
+        bool: True, если результат был в кэше.
+    """
+    try:
+        cache_path = _cache_path(image_path, backend)
+        if not os.path.exists(cache_path):
+            return False
+        if os.path.abspath(output_path) != os.path.abspath(cache_path):
+            shutil.copyfile(cache_path, output_path)
+        # Отмечаем использование для LRU
+        os.utime(cache_path)
+        return True
+    except OSError as e:
+        log_error(f"Ошибка чтения кэша для {image_path} ({backend}): {e}")
+        return False
+
+
+def fetch_bytes(image_path: str, backend: str):
+    """Возвращает закэшированный результат в виде bytes или None, если его нет."""
+    try:
+        cache_path = _cache_path(image_path, backend)
+        if not os.path.exists(cache_path):
+            return None
+        with open(cache_path, 'rb') as cache_file:
+            data = cache_file.read()
+        os.utime(cache_path)
+        return data
+    except OSError as e:
+        log_error(f"Ошибка чтения кэша для {image_path} ({backend}): {e}")
+        return None
+
+
+def store(image_path: str, backend: str, result_path: str) -> None:
+    """Сохраняет файл с результатом обработки в кэш."""
+    _store(image_path, backend, lambda temp_path: shutil.copyfile(result_path, temp_path))
+
+
+def store_bytes(image_path: str, backend: str, data: bytes) -> None:
+    """Сохраняет результат обработки, полученный в памяти, в кэш."""
+    def write(temp_path):
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(data)
+    _store(image_path, backend, write)
+
+
+def _store(image_path: str, backend: str, write) -> None:
+    """Записывает результат в кэш через write(temp_path) и при необходимости вытесняет старые записи."""
+    global _total_size
+    try:
+        cache_path = _cache_path(image_path, backend)
+        if os.path.exists(cache_path):
+            os.utime(cache_path)
+            return
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        write(temp_path)
+        os.replace(temp_path, cache_path)
+        with _size_lock:
+            if _total_size is None:
+                # Первый подсчёт обходит директорию и уже учитывает только что записанный файл
+                _get_total_size()
+            else:
+                _total_size += os.path.getsize(cache_path)
+            if _total_size > RESULT_CACHE_MAX_BYTES:
+                evict(RESULT_CACHE_MAX_BYTES)
+    except OSError as e:
+        log_error(f"Ошибка записи в кэш для {image_path} ({backend}): {e}")
+
+
+def evict(max_bytes: int) -> None:
+    """Удаляет давно не использованные результаты, пока кэш не уложится в max_bytes."""
+    global _total_size
+    entries = sorted(_cache_entries())
+    total = sum(size for _, _, size in entries)
+    for _, path, size in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            log_error(f"Не удалось удалить {path} из кэша: {e}")
+    _total_size = total
@@ -0,0 +1,171 @@
+# sticker_upload.py
+
+# Загрузка стикеров в набор:
+# 1. файлы заранее загружаются через upload_sticker_file параллельно (не больше STICKER_UPLOAD_CONCURRENCY);
+# 2. набор создаётся сразу с первыми MAX_INITIAL_STICKERS стикерами;
+# 3. остальные добавляются по file_id, темп подстраивается под ответы RetryAfter.
+
+import asyncio
+import time
+import traceback
+
+from telegram import InputSticker
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import STICKER_UPLOAD_CONCURRENCY
+from utils import log_error, log_info
+
+# Столько стикеров Bot API принимает в одном вызове create_new_sticker_set
+MAX_INITIAL_STICKERS = 50
+# Сколько раз повторять запрос после RetryAfter
+MAX_RETRIES = 5
+# Пределы паузы между add_sticker_to_set (секунды)
+MIN_ADD_DELAY = 0.0
+MAX_ADD_DELAY = 5.0
+
+
+def retry_seconds(error: RetryAfter) -> float:
+    """Пауза из RetryAfter в секундах (retry_after бывает числом или timedelta)."""
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+
+async def upload_sticker_files(bot, user_id: int, sticker_files: list, sticker_format: str) -> list:
+    """
+    Загружает файлы стикеров на серверы Telegram параллельно.
+
+    Returns:
+        list: file_id для каждого файла в исходном порядке; None, если файл загрузить не удалось.
+    """
+    semaphore = asyncio.Semaphore(STICKER_UPLOAD_CONCURRENCY)
+
+    async def upload(sticker_path):
+        async with semaphore:
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    with open(sticker_path, 'rb') as sticker_file:
+                        uploaded = await bot.upload_sticker_file(
+                            user_id=user_id, sticker=sticker_file, sticker_format=sticker_format
+                        )
+                    return uploaded.file_id
+                except RetryAfter as e:
+                    if attempt == MAX_RETRIES:
+                        log_error(f"Превышено число повторов загрузки {sticker_path}: {e}")
+                        return None
+                    await asyncio.sleep(retry_seconds(e))
+                except (TelegramError, OSError) as e:
+                    log_error(f"Не удалось загрузить файл стикера {sticker_path}: {e}", traceback.format_exc())
+                    return None
+
+    return list(await asyncio.gather(*(upload(path) for path in sticker_files)))
+
+
+def _input_sticker(file_id: str, emoji_assigned: str, sticker_format: str) -> InputSticker:
+    return InputSticker(
+        sticker=file_id,
+        emoji_list=[emoji_assigned],
+        mask_position=None,
+        keywords=None,
+        format=sticker_format
+    )
+
+
+async def _with_retry(request):
+    """Выполняет request(), повторяя его после RetryAfter. Возвращает (результат, суммарное ожидание)."""
+    waited = 0.0
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await request(), waited
+        except RetryAfter as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = retry_seconds(e)
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+async def build_sticker_set(bot, user_id: int, name: str, title: str, sticker_files: list, emojis: list,
+                            sticker_format: str, on_progress=None, on_added=None, on_failed=None,
+                            set_exists: bool = False) -> dict:
+    """
+    Создаёт набор стикеров и добавляет в него все файлы.
+
+    Args:
+        on_progress: необязательная корутина on_progress(count), вызывается после добавления count стикеров.
+        on_added: необязательная корутина on_added(indices), получает номера только что добавленных стикеров.
+        on_failed: необязательная корутина on_failed(indices), получает номера стикеров, которые не удалось
+            загрузить или добавить, сразу после ошибки.
+        set_exists: набор уже создан (продолжение прерванной сборки) — все стикеры только добавляются.
+
+    Returns:
+        dict: created — создан ли набор, failed — номера стикеров, которые не удалось добавить,
+        elapsed — общее время в секундах.
+    """
+    started = time.monotonic()
+    failed = []
+
+    file_ids = await upload_sticker_files(bot, user_id, sticker_files, sticker_format)
+    stickers = []
+    for idx, (file_id, emoji_assigned) in enumerate(zip(file_ids, emojis)):
+        if file_id is None:
+            failed.append(idx)
+        else:
+            stickers.append((idx, _input_sticker(file_id, emoji_assigned, sticker_format)))
+    if failed and on_failed:
+        await on_failed(list(failed))
+
+    if not stickers:
+        return {'created': False, 'failed': failed, 'elapsed': time.monotonic() - started}
+
+    if set_exists:
+        initial = []
+    else:
+        initial = await _create_set(bot, user_id, name, title, stickers)
+        if on_added:
+            await on_added([idx for idx, _ in initial])
+        if on_progress:
+            await on_progress(len(initial))
+
+    # Добавляем остальные: пауза растёт после RetryAfter и постепенно сокращается после успешных запросов
+    delay = MIN_ADD_DELAY
+    for idx, sticker in stickers[len(initial):]:
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            _, waited = await _with_retry(lambda: bot.add_sticker_to_set(user_id=user_id, name=name, sticker=sticker))
+            if waited:
+                delay = min(MAX_ADD_DELAY, max(delay * 2, waited / 4))
+            else:
+                delay = max(MIN_ADD_DELAY, delay / 2 if delay > 0.05 else 0.0)
+            if on_added:
+                await on_added([idx])
+        except TelegramError as e:
+            log_error(f"Ошибка при добавлении стикера: {str(e)}", traceback.format_exc())
+            failed.append(idx)
+            if on_failed:
+                await on_failed([idx])
+        if on_progress:
+            await on_progress(1)
+
+    elapsed = time.monotonic() - started
+    log_info(f"Набор {name}: {len(sticker_files) - len(failed)} из {len(sticker_files)} стикеров за {elapsed:.1f} с")
+    return {'created': True, 'failed': sorted(failed), 'elapsed': elapsed}
+
+
+async def _create_set(bot, user_id: int, name: str, title: str, stickers: list) -> list:
+    """Создаёт набор с первыми MAX_INITIAL_STICKERS стикерами. Возвращает те (номер, стикер), что вошли в набор."""
+    initial = stickers[:MAX_INITIAL_STICKERS]
+    try:
+        await _with_retry(lambda: bot.create_new_sticker_set(
+            user_id=user_id, name=name, title=title, stickers=[sticker for _, sticker in initial]
+        ))
+    except BadRequest as e:
+        if len(initial) == 1:
+            raise
+        # Один неподходящий стикер не должен мешать созданию набора: создаём с первым, остальные добавляем
+        log_error(f"Не удалось создать набор {name} сразу с {len(initial)} стикерами: {e}")
+        initial = stickers[:1]
+        await _with_retry(lambda: bot.create_new_sticker_set(
+            user_id=user_id, name=name, title=title, stickers=[initial[0][1]]
+        ))
+    return initial
@@ -0,0 +1,23 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+# Модули бота импортируются из корня проекта, как при запуске main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_pool
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Пустая база во временной директории, созданная initialize_db; соединения закрываются после теста."""
+    import database
+
+    monkeypatch.setattr(db_pool, 'DB_NAME', str(tmp_path / 'stickers.db'))
+    db_pool.close_all()
+    database.initialize_db()
+    yield db_pool.DB_NAME
+    db_pool.close_all()
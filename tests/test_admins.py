@@ -0,0 +1,25 @@
+# tests/test_admins.py
+#
+# Администраторы добавляются в базу напрямую, поэтому список в памяти должен перечитываться по TTL.
+
+import time
+
+import database
+from db_pool import execute
+
+
+def test_admin_added_directly_takes_effect_after_ttl(temp_db, monkeypatch):
+    monkeypatch.setattr(database._admins_cache(), 'ttl', 0.05)
+    database.load_admins()
+    assert not database.is_admin(7)
+
+    execute('INSERT INTO admins (admin_id) VALUES (?)', (7,))
+    # Пока запись кэша жива, используется прежний список
+    assert not database.is_admin(7)
+    time.sleep(0.1)
+    assert database.is_admin(7)
+    assert database.get_admin_count() == 1
+
+    execute('DELETE FROM admins WHERE admin_id = ?', (7,))
+    time.sleep(0.1)
+    assert not database.is_admin(7)
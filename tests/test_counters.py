@@ -0,0 +1,42 @@
+# tests/test_counters.py
+#
+# Счётчики медиа резервируются одним UPSERT ... RETURNING: параллельные вызовы из разных потоков
+# (у каждого своё соединение) не должны получать одинаковые номера.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+USER_ID = 42
+THREADS = 8
+
+
+def test_parallel_increments_are_distinct(temp_db):
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        ids = list(pool.map(lambda _: database.get_and_increment_photo_counter(USER_ID), range(200)))
+    assert None not in ids
+    assert sorted(ids) == list(range(1, 201))
+
+
+def test_parallel_reserved_blocks_do_not_overlap(temp_db):
+    sizes = [1 + i % 7 for i in range(100)]
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        firsts = list(pool.map(lambda size: database.reserve_photo_counters(USER_ID, size), sizes))
+    assert None not in firsts
+    reserved = [number for first, size in zip(firsts, sizes) for number in range(first, first + size)]
+    assert len(reserved) == len(set(reserved)) == sum(sizes)
+    assert sorted(reserved) == list(range(1, sum(sizes) + 1))
+
+
+def test_increments_and_blocks_mixed(temp_db):
+    def allocate(i):
+        if i % 2:
+            return [database.get_and_increment_photo_counter(USER_ID)]
+        first = database.reserve_photo_counters(USER_ID, 5)
+        return list(range(first, first + 5))
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        reserved = [number for block in pool.map(allocate, range(60)) for number in block]
+    assert len(reserved) == len(set(reserved)) == 30 + 30 * 5
+    # Счётчик видео не затрагивается
+    assert database.get_and_increment_video_counter(USER_ID) == 1
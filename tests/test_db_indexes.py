@@ -0,0 +1,60 @@
+# tests/test_db_indexes.py
+#
+# Запросы, выполняемые на каждое действие пользователя, должны идти поиском по индексу (SEARCH),
+# а не полным проходом таблицы или индекса (SCAN).
+# Проверяются те запросы, которые функции database.py действительно выполняют: они перехватываются
+# через trace callback соединения и прогоняются через EXPLAIN QUERY PLAN.
+
+import pytest
+
+import database
+from cache import invalidate
+from db_pool import fetchall, get_connection
+
+HOT_CALLS = {
+    'get_user_packs': lambda: database.get_user_packs(1),
+    'public_packs_next': lambda: database.get_public_packs(after_id=0),
+    'public_packs_prev': lambda: database.get_public_packs(before_id=100),
+    'count_public_packs': lambda: database.get_count('public_packs'),
+    'all_packs_next': lambda: database.get_all_packs(after_id=0),
+    'all_packs_prev': lambda: database.get_all_packs(before_id=100),
+    'users_next': lambda: database.get_users(after_id=0),
+    'users_prev': lambda: database.get_users(before_id=100),
+    'pack_by_id': lambda: database.get_pack_by_id(1),
+    'pack_job': lambda: database.get_pack_job(1),
+    'unfinished_jobs': database.get_unfinished_pack_jobs,
+    'pack_job_stickers': lambda: database.get_pack_job_stickers(1),
+    'update_pack_job_stickers': lambda: database.update_pack_job_stickers(1, [0], 'uploaded'),
+}
+
+
+def executed_plans(call) -> list:
+    """Вызывает call() и возвращает планы (список шагов) всех выполненных им запросов."""
+    # Кэши живут дольше тестовой базы: без сброса запрос мог бы не дойти до SQLite
+    invalidate('public_packs')
+    invalidate('counts')
+    conn = get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    queries = [sql for sql in statements if sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+    assert queries, statements
+    return [[row[3] for row in fetchall(f'EXPLAIN QUERY PLAN {sql}')] for sql in queries]
+
+
+def test_migrations_applied(temp_db):
+    assert fetchall('PRAGMA user_version')[0][0] == len(database.MIGRATIONS)
+
+
+@pytest.mark.parametrize('name', sorted(HOT_CALLS))
+def test_hot_query_uses_index(temp_db, name):
+    for plan in executed_plans(HOT_CALLS[name]):
+        assert not [step for step in plan if step.startswith('SCAN')], plan
+
+
+def test_public_packs_index_is_covering(temp_db):
+    [plan] = executed_plans(lambda: database.get_count('public_packs'))
+    assert any('COVERING INDEX idx_sticker_packs_public' in step for step in plan), plan
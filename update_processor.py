@@ -0,0 +1,71 @@
+# update_processor.py
+
+# Параллельная обработка обновлений разных пользователей.
+# По умолчанию python-telegram-bot обрабатывает обновления строго по одному, и пока обработчик
+# одного пользователя ждёт пул инференса или кодирование, остальные чаты стоят.
+# ConversationHandler же рассчитан на последовательные обновления внутри одного диалога,
+# поэтому обновления одного пользователя по-прежнему выполняются по очереди,
+# а обновления разных пользователей — одновременно.
+
+import asyncio
+import contextlib
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных пользователей параллельно, одного пользователя — по порядку."""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # ключ -> [блокировка, число обновлений и задач, которые её держат или ждут]
+        self._locks = {}
+
+    @staticmethod
+    def _key(update: object):
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return 'user', user.id
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return 'chat', chat.id
+        return None
+
+    @contextlib.asynccontextmanager
+    async def user_lock(self, update: object):
+        """
+        Занимает очередь пользователя (или чата) обновления update: пока блокировка занята,
+        его обновления ждут. Нужна и фоновым задачам, которые меняют user_data.
+        """
+        key = self._key(update)
+        if key is None:
+            yield
+            return
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            # Блокировки не накапливаются: запись удаляется, когда её никто не ждёт
+            if not entry[1]:
+                self._locks.pop(key, None)
+
+    async def process_update(self, update: object, coroutine) -> None:
+        # Базовый класс сначала занимает общий слот, а затем вызывает do_process_update.
+        # Тогда обновления, ждущие своей очереди у пользователя, держали бы слоты, и серия
+        # сообщений одного пользователя могла бы занять все max_concurrent_updates.
+        # Поэтому слот берётся только после блокировки пользователя
+        async with self.user_lock(update):
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,345 @@
+# video_processing.py
+
+# Функции кодирования видео выполняются в пуле перекодирования (workers.py),
+# поэтому модуль не зависит от Telegram и обработчиков.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import traceback
+from collections import namedtuple
+
+from moviepy.editor import ImageClip, VideoFileClip
+
+from config import VIDEO_TRANSCODER, STICKER_MAX_BYTES, VIDEO_CRF, VIDEO_SIZE_RETRIES, VIDEO_ENCODE_PROFILE
+from media_probe import probe_media
+from utils import log_error, log_info
+
+# Максимальная длительность видеостикера (секунды)
+MAX_STICKER_DURATION = 3
+
+# Масштаб до 512 пикселей по большей стороне с сохранением пропорций. Маленькие видео тоже увеличиваются:
+# Telegram требует, чтобы одна сторона видеостикера была ровно 512
+SCALE_FILTER = "scale=512:512:force_original_aspect_ratio=decrease"
+
+# Профили скорости кодирования libvpx-vp9:
+#   deadline   — режим кодера ('good' для файлов; 'realtime' не поддерживает двухпроходное кодирование);
+#   cpu_used   — компромисс скорость/качество внутри режима (0 — медленно и качественно, 5 — быстро);
+#   row_mt     — многопоточность по строкам блоков, нужна, чтобы потоки были заняты на кадре 512x512;
+#   tile_columns — log2 числа колонок тайлов (для ширины 512 libvpx допускает не больше 1)
+ENCODE_PROFILES = {
+    'fast': {'deadline': 'good', 'cpu_used': 5, 'row_mt': True, 'tile_columns': 1},
+    'balanced': {'deadline': 'good', 'cpu_used': 2, 'row_mt': True, 'tile_columns': 1},
+    'quality': {'deadline': 'good', 'cpu_used': 0, 'row_mt': True, 'tile_columns': 0},
+}
+
+# Потоки кодирования по умолчанию; пул перекодирования передаёт свою долю ядер
+DEFAULT_THREADS = os.cpu_count() or 1
+
+# Битрейт запасного кодирования через moviepy (без подбора под размер)
+MOVIEPY_BITRATE = '256k'
+
+# Частота кадров видеостикера из картинки: кадры одинаковые, поэтому одного в секунду достаточно
+STILL_FPS = 1
+
+# Доля бюджета размера, отдаваемая видеопотоку; остальное — заголовки и индекс WebM
+BITRATE_BUDGET_SHARE = 0.92
+# Насколько увеличивать CRF при каждом повторе второго прохода
+CRF_RETRY_STEP = 4
+
+# Частота кадров последнего прохода, если видео не уложилось в размер после всех повторов
+FALLBACK_FPS = 15
+
+
+class StickerTooLargeError(ValueError):
+    """Видео не удалось уместить в предельный размер стикера даже с минимальным качеством."""
+
+
+# Результат кодирования видео: путь, число проходов ffmpeg, время (секунды), размер (байты), итоговый битрейт
+EncodeResult = namedtuple('EncodeResult', 'path passes elapsed size bitrate')
+
+
+def get_video_properties(video_path: str) -> dict:
+    try:
+        return probe_media(video_path)
+    except Exception as e:
+        log_error(f"Ошибка при получении характеристик видео: {str(e)}")
+        return {}
+
+
+def resize_clip(clip: VideoFileClip) -> VideoFileClip:
+    """
+    Масштабирует видео или изображение так, чтобы большая сторона была ровно 512 пикселей,
+    сохраняя соотношение сторон (как SCALE_FILTER для ffmpeg).
+    """
+    max_dimension = max(clip.w, clip.h)
+    if max_dimension != 512:
+        return clip.resize(512 / max_dimension)
+    return clip
+
+
+def encode_profile_params(profile: str = None) -> list:
+    """Параметры ffmpeg для профиля кодирования (по умолчанию VIDEO_ENCODE_PROFILE)."""
+    settings = ENCODE_PROFILES[profile or VIDEO_ENCODE_PROFILE]
+    return [
+        '-deadline', settings['deadline'],
+        '-cpu-used', str(settings['cpu_used']),
+        '-row-mt', '1' if settings['row_mt'] else '0',
+        '-tile-columns', str(settings['tile_columns']),
+    ]
+
+
+def ffmpeg_executable() -> str:
+    """ffmpeg из PATH, а если его нет — тот, что устанавливается вместе с moviepy (imageio-ffmpeg)."""
+    path = shutil.which('ffmpeg')
+    if path:
+        return path
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def budget_bitrate(duration: float, max_bytes: int = STICKER_MAX_BYTES) -> int:
+    """Битрейт (бит/с), при котором видео длительностью duration укладывается в max_bytes."""
+    duration = min(MAX_STICKER_DURATION, duration or MAX_STICKER_DURATION)
+    return int(max_bytes * 8 * BITRATE_BUDGET_SHARE / duration)
+
+
+def transcode_with_ffmpeg(input_path: str, output_path: str, threads: int, fps: int = None,
+                          crf: int = VIDEO_CRF, max_bytes: int = STICKER_MAX_BYTES,
+                          profile: str = None) -> EncodeResult:
+    """
+    Кодирует видео в WebM (VP9, yuva420p, без звука) так, чтобы файл уложился в max_bytes:
+    обрезка до MAX_STICKER_DURATION, масштаб до 512 и, если указано, частота кадров.
+    Кадры не проходят через Python — ffmpeg читает вход и пишет результат сам.
+
+    Битрейт рассчитывается из длительности и max_bytes и служит потолком для режима CRF.
+    Первый (быстрый) проход собирает статистику, второй кодирует; если файл всё же
+    больше max_bytes, второй проход повторяется с меньшим битрейтом и большим CRF.
+    Если и после VIDEO_SIZE_RETRIES повторов файл велик, выполняется последняя пара проходов
+    с частотой FALLBACK_FPS, половиной битрейта и максимальным CRF.
+    Скорость кодирования задаёт профиль из ENCODE_PROFILES.
+
+    Raises:
+        StickerTooLargeError: если и последний вариант больше max_bytes (файл удаляется).
+    """
+    started = time.perf_counter()
+    try:
+        duration = probe_media(input_path)['duration']
+    except Exception as e:
+        # Без длительности бюджет считается для максимальной длины стикера — так файл точно не больше
+        log_error(f"Не удалось определить длительность {input_path}: {str(e)}")
+        duration = None
+    bitrate = budget_bitrate(duration, max_bytes)
+
+    filters = [SCALE_FILTER]
+    if fps:
+        # Частота кадров снижается до масштабирования, чтобы не масштабировать лишние кадры
+        filters.insert(0, f'fps={fps}')
+    log_dir = tempfile.mkdtemp(prefix='vp9_passlog_')
+    passlog = os.path.join(log_dir, 'pass')
+
+    def run_pass(number: int, target: str, options: list) -> None:
+        command = [
+            ffmpeg_executable(), '-v', 'error', '-y',
+            '-t', str(MAX_STICKER_DURATION), '-i', input_path,
+            '-an', '-vf', ','.join(filters),
+            '-c:v', 'libvpx-vp9', '-pix_fmt', 'yuva420p',
+            *encode_profile_params(profile), '-threads', str(threads),
+            '-pass', str(number), '-passlogfile', passlog,
+            *options,
+            target
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg завершился с кодом {result.returncode}: {result.stderr.strip()[-500:]}")
+
+    try:
+        run_pass(1, os.devnull, ['-b:v', str(bitrate), '-crf', str(crf), '-f', 'null'])
+        passes = 1
+        for attempt in range(VIDEO_SIZE_RETRIES + 1):
+            run_pass(2, output_path, ['-b:v', str(bitrate), '-crf', str(crf)])
+            passes += 1
+            size = os.path.getsize(output_path)
+            if size <= max_bytes:
+                break
+            if attempt < VIDEO_SIZE_RETRIES:
+                log_info(f"{output_path}: {size} байт больше {max_bytes}, повторяем с меньшим битрейтом")
+                # Битрейт уменьшается пропорционально превышению, с запасом
+                bitrate = int(bitrate * max_bytes / size * 0.9)
+                crf = min(63, crf + CRF_RETRY_STEP)
+        else:
+            log_info(f"{output_path}: после {passes} проходов размер {size} байт больше {max_bytes}, "
+                     f"кодируем с частотой {FALLBACK_FPS} кадров/с и минимальным качеством")
+            # Статистика первого прохода относится к другой частоте кадров — собираем её заново
+            filters[:] = [f'fps={min(fps or FALLBACK_FPS, FALLBACK_FPS)}', SCALE_FILTER]
+            bitrate = int(min(bitrate, budget_bitrate(duration, max_bytes)) / 2)
+            crf = 63
+            run_pass(1, os.devnull, ['-b:v', str(bitrate), '-crf', str(crf), '-f', 'null'])
+            run_pass(2, output_path, ['-b:v', str(bitrate), '-maxrate', str(bitrate), '-bufsize', str(bitrate),
+                                      '-crf', str(crf)])
+            passes += 2
+            size = os.path.getsize(output_path)
+            if size > max_bytes:
+                os.remove(output_path)
+                raise StickerTooLargeError(
+                    f"{input_path}: после {passes} проходов размер {size} байт больше {max_bytes}"
+                )
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    return EncodeResult(output_path, passes, time.perf_counter() - started, size, bitrate)
+
+
+def _transcode(input_path: str, output_path: str, threads: int, moviepy_transcode, **ffmpeg_options) -> EncodeResult:
+    """Кодирует через ffmpeg (VIDEO_TRANSCODER), а при ошибке — через moviepy_transcode."""
+    if VIDEO_TRANSCODER == 'ffmpeg':
+        try:
+            return transcode_with_ffmpeg(input_path, output_path, threads, **ffmpeg_options)
+        except StickerTooLargeError:
+            # moviepy кодирует без подбора под размер — повторять через него бессмысленно
+            raise
+        except Exception as e:
+            log_error(f"ffmpeg не смог перекодировать {input_path}, повторяем через moviepy: {str(e)}")
+    started = time.perf_counter()
+    moviepy_transcode(input_path, output_path, threads)
+    return EncodeResult(output_path, 1, time.perf_counter() - started, os.path.getsize(output_path), None)
+
+
+def convert_mp4_to_webm(input_path: str, output_path: str, threads: int = DEFAULT_THREADS) -> EncodeResult:
+    try:
+        result = _transcode(input_path, output_path, threads, _convert_mp4_to_webm_moviepy, fps=30)
+
+        # Получаем характеристики конвертированного видео
+        props = get_video_properties(output_path)
+        log_info(f"Конвертация видео завершена за {result.elapsed:.1f} с ({result.passes} проходов). "
+                 f"Характеристики: {props}")
+
+        return result
+    except Exception as e:
+        log_error(f"Ошибка при конвертации MP4 в WebM: {str(e)}")
+        raise
+
+
+def _convert_mp4_to_webm_moviepy(input_path: str, output_path: str, threads: int) -> str:
+    with VideoFileClip(input_path) as clip:
+        # Обрезаем до 3 секунд, если длительность больше 3 секунд
+        if clip.duration > 3:
+            clip = clip.subclip(0, 3)
+
+        # Масштабируем так, чтобы большая сторона была ровно 512 пикселей
+        clip = resize_clip(clip)
+
+        # Устанавливаем частоту кадров до 30 FPS
+        clip = clip.set_fps(30)
+
+        # Сохраняем видео в формате WebM с кодеком VP9 и без звука
+        clip.write_videofile(
+            output_path,
+            codec='libvpx-vp9',  # Кодек VP9
+            audio=False,         # Отключаем звук
+            threads=threads,     # Число потоков выделяет планировщик перекодирования
+            bitrate=MOVIEPY_BITRATE,  # Ограничиваем размер файла
+            # Альфа-канал и профиль скорости кодирования
+            ffmpeg_params=['-pix_fmt', 'yuva420p', *encode_profile_params()]
+        )
+
+    return output_path
+
+
+def still_to_webm(input_image_path: str, output_video_path: str, threads: int) -> str:
+    """
+    Кодирует картинку в видеостикер длительностью MAX_STICKER_DURATION с частотой STILL_FPS:
+    вместо 90 одинаковых кадров кодируются три, альфа-канал PNG сохраняется (yuva420p).
+    """
+    command = [
+        ffmpeg_executable(), '-v', 'error', '-y',
+        '-loop', '1', '-framerate', str(STILL_FPS), '-t', str(MAX_STICKER_DURATION), '-i', input_image_path,
+        '-vf', SCALE_FILTER,
+        '-c:v', 'libvpx-vp9', '-pix_fmt', 'yuva420p', '-crf', str(VIDEO_CRF), '-b:v', '0',
+        *encode_profile_params(), '-threads', str(threads),
+        output_video_path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg завершился с кодом {result.returncode}: {result.stderr.strip()[-500:]}")
+    return output_video_path
+
+
+def convert_image_to_webm(input_image_path: str, output_video_path: str, threads: int = DEFAULT_THREADS) -> str:
+    try:
+        converted = False
+        if VIDEO_TRANSCODER == 'ffmpeg':
+            try:
+                still_to_webm(input_image_path, output_video_path, threads)
+                converted = True
+            except Exception as e:
+                log_error(f"ffmpeg не смог перекодировать {input_image_path}, повторяем через moviepy: {str(e)}")
+        if not converted:
+            _convert_image_to_webm_moviepy(input_image_path, output_video_path, threads)
+
+        # Получаем характеристики конвертированного видео
+        props = get_video_properties(output_video_path)
+        log_info(f"Конвертация изображения в видео завершена. Характеристики: {props}")
+
+        return output_video_path
+    except Exception as e:
+        log_error(f"Ошибка при конвертации изображения в WebM: {str(e)}")
+        raise
+
+
+def _convert_image_to_webm_moviepy(input_image_path: str, output_video_path: str, threads: int) -> None:
+    # Загружаем изображение как ImageClip
+    clip = ImageClip(input_image_path)
+
+    # Устанавливаем длительность видео (3 секунды)
+    clip = clip.set_duration(3)
+
+    # Масштабируем изображение так, чтобы ни ширина, ни высота не превышали 512 пикселей
+    clip = resize_clip(clip)
+
+    # Устанавливаем частоту кадров до 30 FPS
+    clip = clip.set_fps(30)
+
+    # Сохраняем видео в формате WebM с кодеком VP9 и без звука
+    clip.write_videofile(
+        output_video_path,
+        codec='libvpx-vp9',        # Кодек VP9
+        audio=False,               # Отключаем звук
+        threads=threads,           # Число потоков выделяет планировщик перекодирования
+        # Альфа-канал и профиль скорости кодирования
+        ffmpeg_params=['-pix_fmt', 'yuva420p', *encode_profile_params()]
+    )
+
+
+# Дополнительная функция для конвертации видео в webm
+def process_video(input_path: str, output_path: str, threads: int = DEFAULT_THREADS) -> EncodeResult:
+    try:
+        return _transcode(input_path, output_path, threads, _process_video_moviepy)
+    except Exception as e:
+        # Логируем ошибку, если что-то пошло не так
+        log_error(f"Ошибка при конвертации видео: {str(e)}", traceback.format_exc())
+        raise  # Повторно выбрасываем исключение для обработки
+
+
+def _process_video_moviepy(input_path: str, output_path: str, threads: int) -> str:
+    with VideoFileClip(input_path) as clip:
+        # Обрезаем до 3 секунд
+        if clip.duration > 3:
+            clip = clip.subclip(0, 3)
+
+        # Масштабируем так, чтобы большая сторона была ровно 512 пикселей
+        clip = resize_clip(clip)
+
+        # Сохраняем видео в формате WebM с нужными параметрами, убирая аудиокодек
+        clip.write_videofile(
+            output_path,
+            codec="libvpx-vp9",      # Кодек VP9 для видео
+            audio=False,
+            threads=threads,
+            bitrate=MOVIEPY_BITRATE,  # Битрейт
+            ffmpeg_params=["-crf", str(VIDEO_CRF), "-pix_fmt", "yuva420p", *encode_profile_params()]
+        )
+
+    return output_path
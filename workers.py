@@ -0,0 +1,327 @@
+# workers.py
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_BATCH_SIZE, TRANSCODE_WORKERS, WARMUP_BACKENDS
+from image_processing import BACKENDS, get_output_path, remove_background, remove_background_batch, render_variants
+from model_registry import init_worker, worker_model_stats
+import result_cache
+from video_processing import EncodeResult
+from utils import log_info
+
+# Пул процессов для моделей удаления фона. Создаётся лениво при первой задаче,
+# чтобы модели не загружались в процессе, обслуживающем Telegram.
+_inference_pool = None
+# Ограничение глубины очереди: не более INFERENCE_QUEUE_SIZE задач ожидают или выполняются
+_inference_slots = None
+
+_inference_stats = {
+    'queued': 0,
+    'running': 0,
+    'completed': 0,
+    'failed': 0,
+    'total_wait': 0.0,
+    'max_wait': 0.0,
+}
+
+
+def get_inference_pool() -> ProcessPoolExecutor:
+    """Возвращает пул процессов для инференса, создавая его при первом обращении."""
+    global _inference_pool
+    if _inference_pool is None:
+        _inference_pool = ProcessPoolExecutor(
+            max_workers=INFERENCE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            # Каждый процесс прогревает модель по умолчанию и следит за простоем моделей
+            initializer=init_worker,
+            initargs=(WARMUP_BACKENDS,)
+        )
+        log_info(f"Запущен пул инференса: {INFERENCE_WORKERS} процессов, очередь {INFERENCE_QUEUE_SIZE}")
+    return _inference_pool
+
+
+async def run_inference(func, *args):
+    """
+    Выполняет func(*args) в пуле инференса, не блокируя цикл событий.
+
+    Если очередь заполнена, вызывающий ждёт освобождения места.
+    """
+    global _inference_slots
+    if _inference_slots is None:
+        _inference_slots = asyncio.Semaphore(INFERENCE_QUEUE_SIZE)
+
+    _inference_stats['queued'] += 1
+    enqueued_at = time.monotonic()
+    try:
+        await _inference_slots.acquire()
+    finally:
+        _inference_stats['queued'] -= 1
+
+    wait = time.monotonic() - enqueued_at
+    _inference_stats['total_wait'] += wait
+    _inference_stats['max_wait'] = max(_inference_stats['max_wait'], wait)
+    _inference_stats['running'] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(get_inference_pool(), func, *args)
+        _inference_stats['completed'] += 1
+        return result
+    except Exception:
+        _inference_stats['failed'] += 1
+        raise
+    finally:
+        _inference_stats['running'] -= 1
+        _inference_slots.release()
+
+
+def get_inference_stats() -> dict:
+    """Возвращает число ожидающих и выполняемых задач инференса и время ожидания места в очереди."""
+    stats = dict(_inference_stats)
+    started = stats['completed'] + stats['failed'] + stats['running']
+    stats['avg_wait'] = stats['total_wait'] / started if started else 0.0
+    return stats
+
+
+# Сколько ждать ответа процессов пула со статистикой моделей (секунды)
+MODEL_STATS_TIMEOUT = 5.0
+
+
+async def collect_model_stats() -> dict:
+    """
+    Собирает статистику моделей из процессов пула инференса: pid -> model_registry.get_model_stats().
+
+    Процессу, занятому инференсом дольше MODEL_STATS_TIMEOUT, в ответе места нет.
+    Пул не запускается ради статистики: если его ещё нет, возвращается пустой словарь.
+    """
+    if _inference_pool is None:
+        return {}
+    loop = asyncio.get_running_loop()
+    futures = [loop.run_in_executor(_inference_pool, worker_model_stats, 0.2) for _ in range(INFERENCE_WORKERS)]
+    done, _ = await asyncio.wait(futures, timeout=MODEL_STATS_TIMEOUT)
+    return dict(future.result() for future in done if future.exception() is None)
+
+
+async def remove_background_async(backend: str, image_path: str, output_path: str = None) -> str:
+    """Удаляет фон с изображения в пуле инференса и возвращает путь к результату."""
+    if output_path is None:
+        output_path = get_output_path(image_path, backend)
+    # Хэширование и копирование файлов кэша — в отдельном потоке, не в цикле событий
+    if await asyncio.to_thread(result_cache.fetch, image_path, backend, output_path):
+        return output_path
+    await run_inference(remove_background, backend, image_path, output_path)
+    await asyncio.to_thread(result_cache.store, image_path, backend, output_path)
+    return output_path
+
+
+async def render_background_variants(image_path: str, backends=BACKENDS) -> dict:
+    """
+    Возвращает варианты изображения без фона в памяти: инструмент -> PNG (bytes).
+
+    Варианты из кэша отдаются сразу, остальные строятся одной задачей пула,
+    которая декодирует изображение один раз для всех инструментов.
+    """
+    variants = await asyncio.to_thread(_fetch_cached_variants, image_path, backends)
+    missing = [backend for backend in backends if backend not in variants]
+    if missing:
+        rendered = await run_inference(render_variants, image_path, tuple(missing))
+        await asyncio.to_thread(_store_variants, image_path, rendered)
+        variants.update(rendered)
+    return {backend: variants[backend] for backend in backends}
+
+
+def _fetch_cached_variants(image_path: str, backends) -> dict:
+    variants = {}
+    for backend in backends:
+        data = result_cache.fetch_bytes(image_path, backend)
+        if data is not None:
+            variants[backend] = data
+    return variants
+
+
+def _store_variants(image_path: str, variants: dict) -> None:
+    for backend, data in variants.items():
+        result_cache.store_bytes(image_path, backend, data)
+
+
+def _has_content(path: str, data: bytes) -> bool:
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def save_variants(image_path: str, variants: dict) -> list:
+    """Сохраняет варианты рядом с исходником (image_path_<backend>.png) — эти файлы идут в стикерпак."""
+    paths = []
+    for backend, data in variants.items():
+        output_path = get_output_path(image_path, backend)
+        # Файл перезаписывается всегда, когда его содержимое отличается: по тому же пути мог остаться
+        # вариант прежнего изображения (замена фото сохраняется в тот же processed/sticker_N.png).
+        # Совпадающий файл не трогается, чтобы не менялся mtime и file_id превью оставался действительным
+        if not _has_content(output_path, data):
+            with open(output_path, 'wb') as output_file:
+                output_file.write(data)
+        paths.append(output_path)
+    return paths
+
+
+async def remove_background_all(image_path: str, backends=BACKENDS) -> list:
+    """Обрабатывает изображение всеми инструментами. Пути возвращаются в порядке backends."""
+    variants = await render_background_variants(image_path, backends)
+    return await asyncio.to_thread(save_variants, image_path, variants)
+
+
+async def remove_background_batch_async(backend: str, image_paths: list, output_paths: list = None) -> list:
+    """Обрабатывает пачку изображений одним инструментом за одну задачу пула. None — изображение не обработано."""
+    if output_paths is None:
+        output_paths = [get_output_path(image_path, backend) for image_path in image_paths]
+    results = list(output_paths)
+    # В пул отправляются только изображения, которых нет в кэше
+    cached = await asyncio.to_thread(
+        lambda: [result_cache.fetch(image_path, backend, output_path)
+                 for image_path, output_path in zip(image_paths, output_paths)]
+    )
+    pending = [idx for idx, hit in enumerate(cached) if not hit]
+    if pending:
+        computed = await run_inference(remove_background_batch, backend,
+                                       [image_paths[idx] for idx in pending],
+                                       [output_paths[idx] for idx in pending],
+                                       INFERENCE_BATCH_SIZE)
+        for idx, result in zip(pending, computed):
+            results[idx] = result
+            if result is not None:
+                await asyncio.to_thread(result_cache.store, image_paths[idx], backend, result)
+    return results
+
+
+async def remove_background_all_batch(image_paths: list, backends=BACKENDS) -> list:
+    """
+    Обрабатывает пачку изображений всеми инструментами.
+
+    Returns:
+        list: для каждого изображения список путей в порядке backends (None — вариант не получен).
+    """
+    per_backend = await asyncio.gather(
+        *(remove_background_batch_async(backend, image_paths) for backend in backends)
+    )
+    return [list(variants) for variants in zip(*per_backend)]
+
+
+# Пул процессов для кодирования видео (moviepy обрабатывает кадры в Python и держит GIL)
+_transcode_pool = None
+# Допуск к кодированию: одновременно выполняется не более TRANSCODE_WORKERS задач
+_transcode_slots = None
+# Потоки ffmpeg на одно кодирование, чтобы все кодирования вместе занимали не больше ядер, чем есть
+TRANSCODE_THREADS = max(1, (os.cpu_count() or 1) // TRANSCODE_WORKERS)
+
+_transcode_stats = {
+    'queued': 0,
+    'running': 0,
+    'completed': 0,
+    'failed': 0,
+    'total_wait': 0.0,
+    'last_wait': 0.0,
+    'max_wait': 0.0,
+    'encoded': 0,
+    'encode_passes': 0,
+    'encode_time': 0.0,
+    'last_passes': 0,
+    'last_encode_time': 0.0,
+    'oversize_retries': 0,
+}
+
+
+def get_transcode_pool() -> ProcessPoolExecutor:
+    """Возвращает пул процессов для кодирования видео, создавая его при первом обращении."""
+    global _transcode_pool
+    if _transcode_pool is None:
+        _transcode_pool = ProcessPoolExecutor(
+            max_workers=TRANSCODE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        log_info(f"Запущен пул перекодирования: {TRANSCODE_WORKERS} процессов по {TRANSCODE_THREADS} потоков")
+    return _transcode_pool
+
+
+async def run_transcode(func, *args):
+    """
+    Выполняет кодирование func(*args, threads=TRANSCODE_THREADS) в пуле перекодирования.
+
+    Задачи сверх TRANSCODE_WORKERS ждут своей очереди; время ожидания попадает в статистику.
+    """
+    global _transcode_slots
+    if _transcode_slots is None:
+        _transcode_slots = asyncio.Semaphore(TRANSCODE_WORKERS)
+
+    _transcode_stats['queued'] += 1
+    enqueued_at = time.monotonic()
+    try:
+        await _transcode_slots.acquire()
+    finally:
+        _transcode_stats['queued'] -= 1
+
+    wait = time.monotonic() - enqueued_at
+    _transcode_stats['last_wait'] = wait
+    _transcode_stats['total_wait'] += wait
+    _transcode_stats['max_wait'] = max(_transcode_stats['max_wait'], wait)
+    _transcode_stats['running'] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            get_transcode_pool(), functools.partial(func, *args, threads=TRANSCODE_THREADS)
+        )
+        _transcode_stats['completed'] += 1
+        # Кодирования видео возвращают EncodeResult: учитываем проходы и время, а вызывающему отдаём путь
+        if isinstance(result, EncodeResult):
+            _transcode_stats['encode_passes'] += result.passes
+            _transcode_stats['encode_time'] += result.elapsed
+            _transcode_stats['encoded'] += 1
+            _transcode_stats['last_passes'] = result.passes
+            _transcode_stats['last_encode_time'] = result.elapsed
+            # Один проход — анализ, один — кодирование; остальные — повторы из-за превышения размера
+            _transcode_stats['oversize_retries'] += max(0, result.passes - 2)
+            return result.path
+        return result
+    except Exception:
+        _transcode_stats['failed'] += 1
+        raise
+    finally:
+        _transcode_stats['running'] -= 1
+        _transcode_slots.release()
+
+
+def get_transcode_stats() -> dict:
+    """Возвращает длину очереди, число выполняемых задач, время ожидания и проходы кодирований."""
+    stats = dict(_transcode_stats)
+    started = stats['completed'] + stats['failed'] + stats['running']
+    stats['avg_wait'] = stats['total_wait'] / started if started else 0.0
+    stats['avg_passes'] = stats['encode_passes'] / stats['encoded'] if stats['encoded'] else 0.0
+    stats['avg_encode_time'] = stats['encode_time'] / stats['encoded'] if stats['encoded'] else 0.0
+    stats['threads_per_job'] = TRANSCODE_THREADS
+    return stats
+
+
+def start_workers():
+    """Запускает процессы пула инференса заранее, чтобы модели прогрелись до первого запроса."""
+    pool = get_inference_pool()
+    for _ in range(INFERENCE_WORKERS):
+        pool.submit(os.getpid)
+
+
+def shutdown_workers():
+    """Останавливает пулы фоновых задач."""
+    global _inference_pool, _transcode_pool
+    if _inference_pool is not None:
+        _inference_pool.shutdown(wait=False, cancel_futures=True)
+        _inference_pool = None
+    if _transcode_pool is not None:
+        _transcode_pool.shutdown(wait=False, cancel_futures=True)
+        _transcode_pool = None